@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" A bidirectional dictionary, mapping keys to values and values back to
+keys:
+
+>>> slugs = BiDict({1: u'emil', 2: u'pippi'})
+>>> slugs.inverse[u'pippi']
+2
+>>> slugs[2] = u'pippilotta'
+>>> u'pippi' in slugs.inverse
+False
+"""
+
+from dictlib.mapping import BaseDictAdapter
+import itertools
+
+
+__all__ = (u'BiDict',)
+
+
+class BiDict(BaseDictAdapter):
+    """ A dictionary with unique, hashable values whose inverse mapping is
+    available as the `inverse` attribute. Both directions are looked up in
+    constant time.
+
+    The forward and the inverse mapping are two plain dictionaries which
+    share the key and value objects. `inverse` is a `BiDict` on the same two
+    dictionaries with their roles swapped, so changes through either side
+    are visible on the other one immediately, and `inverse.inverse` is the
+    original `BiDict`.
+
+    The forward dictionary is available as the `doc` attribute; it must not
+    be changed directly.
+    """
+    def __init__(self, doc=None):
+        """ Constructor.
+
+        :param doc: An optional mapping or iterable of `(key, value)` pairs.
+        :raises ValueError: If a value occurs for more than one key.
+        """
+        forward = dict(doc or ())
+        backward = dict(itertools.izip(forward.itervalues(), forward.iterkeys()))
+        if len(backward) != len(forward):
+            raise ValueError(u'Values are not unique')
+        BaseDictAdapter.__init__(self, forward)
+        self.__dict__[u'_backward'] = backward
+        self.__dict__[u'_inverse'] = None
+
+    @property
+    def inverse(self):
+        """ The inverse `BiDict`, mapping values to keys. This is a live
+        view, not a copy.
+        """
+        if self._inverse is None:
+            inverse = BiDict()
+            inverse.__dict__[u'_doc'] = self._backward
+            inverse.__dict__[u'_backward'] = self._doc
+            inverse.__dict__[u'_inverse'] = self
+            self.__dict__[u'_inverse'] = inverse
+        return self._inverse
+
+    def __getitem__(self, key):
+        return self._doc[key]
+
+    def __setitem__(self, key, value):
+        """ Map `key` to `value`, removing the inverse entry of the previous
+        value of `key`.
+
+        :raises ValueError: If `value` is mapped to another key already.
+        :see: `BiDict.forceput`
+        """
+        forward, backward = self._doc, self._backward
+        old_key = backward.get(value, key)
+        if old_key != key:
+            raise ValueError(u'Value %r is mapped to key %r already' % (value, old_key))
+        if key in forward:
+            del backward[forward[key]]
+        backward[value] = key
+        forward[key] = value
+
+    def forceput(self, key, value):
+        """ Map `key` to `value`, removing both the previous value of `key`
+        and the previous key of `value`.
+        """
+        forward, backward = self._doc, self._backward
+        if value in backward:
+            del forward[backward.pop(value)]
+        if key in forward:
+            del backward[forward[key]]
+        backward[value] = key
+        forward[key] = value
+
+    def __delitem__(self, key):
+        del self._backward[self._doc.pop(key)]
+
+    def __contains__(self, key):
+        return key in self._doc
+
+    def __iter__(self):
+        return iter(self._doc)
+
+    def __len__(self):
+        return len(self._doc)
+
+    def keys(self):
+        return self._doc.keys()
+
+    def iterkeys(self):
+        return self._doc.iterkeys()
+
+    def itervalues(self):
+        return self._doc.itervalues()
+
+    def iteritems(self):
+        return self._doc.iteritems()
+
+    def values(self):
+        return self._doc.values()
+
+    def items(self):
+        return self._doc.items()
+
+    def clear(self):
+        self._doc.clear()
+        self._backward.clear()
+
+    def copy(self):
+        new = BiDict()
+        new.__dict__[u'_doc'] = dict(self._doc)
+        new.__dict__[u'_backward'] = dict(self._backward)
+        return new
+
+    def __repr__(self):
+        return u'%s(%r)' % (self.__class__.__name__, self._doc)
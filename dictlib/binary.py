@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" A compact binary serialization format derived from a `Schema`.
+
+Documents are encoded as follows (all numbers little-endian):
+
+ - A header: the magic bytes `DLB`, the format version (1 byte) and the
+   schema version given to `BinaryCodec` (4 bytes).
+ - Dictionaries: declared keys are positional, in sorted order. Two bitmaps
+   tell which keys are present and which of them are not `None`, followed by
+   the values of the present, non-`None` keys. If the `DictField` has a type
+   key (e. g. `unicode`), the number of remaining keys follows, each as a
+   string, a `None` flag and the value.
+ - `IntField`s, `FloatField`s and the datetime fields have fixed-width
+   encodings; `LongField`s are encoded as decimal strings.
+ - Strings are length-prefixed UTF-8, `UuidField`s are 16 bytes and
+   `EnumField`s are encoded as the index of the value.
+ - Lists are encoded as their length followed by the elements. If there are
+   several element fields or elements may be `None`, each element is
+   prefixed with the index of its field (255 meaning `None`); the field is
+   the first one the element is valid for. Lists with array storage are
+   stored as packed arrays of 8 byte integers or doubles.
+ - Any other fields are encoded as length-prefixed JSON.
+"""
+
+from dictlib.schema import Field, IntField, LongField, FloatField, \
+    UnicodeField, UuidField, EnumField, NoneField, DatetimeField, DateField, \
+    TimeField, ListField, DictField, SchemaDefinitionError
+from dictlib.exceptions import SchemaFieldNotFound, ValidationError
+import array
+import codecs
+import datetime
+import json
+import struct
+import sys
+import types
+import uuid
+
+
+__all__ = (u'BinaryCodec', u'BinaryFormatError')
+
+
+class BinaryFormatError(Exception):
+    """ Thrown when decoding data which is not in the expected binary format.
+    """
+    pass
+
+
+_HEADER = struct.Struct('<3sBI')
+_MAGIC = 'DLB'
+_FORMAT_VERSION = 1
+_NONE_TAG = 255
+
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+_TAG = struct.Struct('<B')
+_DATE = struct.Struct('<i')
+
+#: Maps array type codes of `ListField`s to the `struct` format of their items
+_ARRAY_FORMATS = {'l': 'q', 'd': 'd'}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_utf_8_decode = codecs.utf_8_decode
+
+
+def _encode_str(value, out):
+    if isinstance(value, unicode):
+        value = value.encode(u'utf-8')
+    out.append(_LENGTH.pack(len(value)))
+    out.append(value)
+
+
+def _decode_str(buf, offset):
+    length, = _LENGTH.unpack_from(buf, offset)
+    offset += 4
+    end = offset + length
+    if end > len(buf):
+        raise IndexError(u'string exceeds data')
+    return _utf_8_decode(buf[offset:end], None, True)[0], end
+
+
+def _fixed(struct_):
+    def encode(value, out):
+        out.append(struct_.pack(value))
+    def decode(buf, offset):
+        return struct_.unpack_from(buf, offset)[0], offset + struct_.size
+    return encode, decode
+
+
+def _encode_datetime(value, out):
+    delta = value - _EPOCH
+    out.append(_INT.pack((delta.days * 86400 + delta.seconds) * 1000000 +
+                         delta.microseconds))
+
+def _decode_datetime(buf, offset):
+    microseconds, = _INT.unpack_from(buf, offset)
+    return _EPOCH + datetime.timedelta(microseconds=microseconds), offset + 8
+
+
+def _encode_date(value, out):
+    out.append(_DATE.pack(value.toordinal()))
+
+def _decode_date(buf, offset):
+    ordinal, = _DATE.unpack_from(buf, offset)
+    return datetime.date.fromordinal(ordinal), offset + 4
+
+
+def _encode_time(value, out):
+    out.append(_INT.pack(((value.hour * 60 + value.minute) * 60 + value.second) *
+                         1000000 + value.microsecond))
+
+def _decode_time(buf, offset):
+    microseconds, = _INT.unpack_from(buf, offset)
+    seconds, microsecond = divmod(microseconds, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return datetime.time(hour, minute, second, microsecond), offset + 8
+
+
+def _encode_long(value, out):
+    _encode_str(str(value), out)
+
+def _decode_long(buf, offset):
+    value, offset = _decode_str(buf, offset)
+    return long(value), offset
+
+
+def _encode_uuid(value, out):
+    out.append(value.bytes)
+
+def _decode_uuid(buf, offset):
+    return uuid.UUID(bytes=buf[offset:offset + 16].tobytes()), offset + 16
+
+
+def _encode_none(value, out):
+    pass
+
+def _decode_none(buf, offset):
+    return None, offset
+
+
+def _compile_json(field):
+    def encode(value, out):
+        _encode_str(json.dumps(field.to_json(value)), out)
+    def decode(buf, offset):
+        value, offset = _decode_str(buf, offset)
+        return field.from_json(json.loads(value)), offset
+    return encode, decode
+
+
+def _compile_enum(field):
+    values, codes = field.values, dict((v, i) for i, v in enumerate(field.values))
+    def encode(value, out):
+        try:
+            out.append(_LENGTH.pack(codes[value]))
+        except (KeyError, TypeError):
+            raise ValueError(u'Value %r is not one of the allowed values' % (value,))
+    def decode(buf, offset):
+        return values[_LENGTH.unpack_from(buf, offset)[0]], offset + 4
+    return encode, decode
+
+
+def _compile_array(field):
+    typecode = field.typecode
+    item_format = _ARRAY_FORMATS[typecode]
+    itemsize = struct.calcsize('<' + item_format)
+    # Arrays can be copied byte by byte only if their items have the size
+    # of the encoded items
+    is_native = array.array(typecode).itemsize == itemsize
+    def encode(value, out):
+        if not isinstance(value, array.array) or value.typecode != typecode:
+            value = array.array(typecode, value)
+        out.append(_LENGTH.pack(len(value)))
+        if not is_native:
+            out.append(struct.pack('<%d%s' % (len(value), item_format), *value))
+        elif _BIG_ENDIAN:
+            value = array.array(typecode, value)
+            value.byteswap()
+            out.append(value.tostring())
+        else:
+            out.append(value.tostring())
+    def decode(buf, offset):
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += 4
+        end = offset + length * itemsize
+        if end > len(buf):
+            raise IndexError(u'array exceeds data')
+        if is_native:
+            value = array.array(typecode)
+            value.fromstring(buf[offset:end].tobytes())
+            if _BIG_ENDIAN:
+                value.byteswap()
+        else:
+            value = array.array(typecode, struct.unpack_from(
+                '<%d%s' % (length, item_format), buf, offset))
+        if field.storage == u'numpy':
+            value = field.from_json(value)
+        return value, end
+    return encode, decode
+
+
+def _select_field(candidates, element):
+    """ Return the first of the element fields `candidates` that `element`
+    is valid for, or `None`. A single candidate is returned without
+    validation, its encoder rejects invalid elements.
+    """
+    if len(candidates) == 1:
+        return candidates[0]
+    for candidate in candidates:
+        try:
+            candidate.validate(element)
+            return candidate
+        except ValidationError:
+            pass
+    return None
+
+
+def _compile_list(field):
+    if field.storage is not None:
+        return _compile_array(field)
+
+    element_codecs = [_compile(element_field) for element_field in field.fields]
+    if len(field.fields) == 1 and not field.fields[0].can_be_none:
+        encode_element, decode_element = element_codecs[0]
+        def encode(value, out):
+            out.append(_LENGTH.pack(len(value)))
+            for element in value:
+                encode_element(element, out)
+        def decode(buf, offset):
+            length, = _LENGTH.unpack_from(buf, offset)
+            offset += 4
+            value = []
+            for i in xrange(length):
+                element, offset = decode_element(buf, offset)
+                value.append(element)
+            return value, offset
+        return encode, decode
+
+    tags = dict((id(element_field), i) for i, element_field in enumerate(field.fields))
+    def encode(value, out):
+        out.append(_LENGTH.pack(len(value)))
+        for element in value:
+            if element is None:
+                out.append(_TAG.pack(_NONE_TAG))
+                continue
+            element_field = _select_field(field.get_fields_for_type(type(element)),
+                                          element)
+            if element_field is None:
+                raise ValueError(u'List element %r has none of the listed fields' %
+                                 (element,))
+            tag = tags[id(element_field)]
+            out.append(_TAG.pack(tag))
+            element_codecs[tag][0](element, out)
+    def decode(buf, offset):
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += 4
+        value = []
+        for i in xrange(length):
+            tag, = _TAG.unpack_from(buf, offset)
+            offset += 1
+            if tag == _NONE_TAG:
+                value.append(None)
+            else:
+                element, offset = element_codecs[tag][1](buf, offset)
+                value.append(element)
+        return value, offset
+    return encode, decode
+
+
+def _compile_dict(field):
+    schema = field.get_schema()
+    keys = sorted(key for key in schema if not isinstance(key, types.TypeType))
+    key_set = frozenset(keys)
+    field_codecs = [_compile(schema[key]) for key in keys]
+    encoders = [codec[0] for codec in field_codecs]
+    decoders = [codec[1] for codec in field_codecs]
+    bitmap_len = (len(keys) + 7) // 8
+
+    type_keys = [key for key in schema if isinstance(key, types.TypeType)]
+    if len(type_keys) > 1 or (type_keys and type_keys[0] not in (unicode, str)):
+        raise SchemaDefinitionError(u'Binary encoding supports only unicode '
+                                    u'or str type keys')
+    if type_keys:
+        encode_dynamic, decode_dynamic = _compile(schema[type_keys[0]])
+    dynamic = bool(type_keys)
+
+    def encode(value, out):
+        present = bytearray(bitmap_len)
+        not_none = bytearray(bitmap_len)
+        parts = []
+        count = 0
+        for i, key in enumerate(keys):
+            if key not in value:
+                continue
+            count += 1
+            present[i >> 3] |= 1 << (i & 7)
+            item = value[key]
+            if item is not None:
+                not_none[i >> 3] |= 1 << (i & 7)
+                encoders[i](item, parts)
+        out.append(str(present))
+        out.append(str(not_none))
+        out.extend(parts)
+
+        if dynamic:
+            extra = [(key, item) for key, item in value.iteritems()
+                     if key not in key_set]
+            out.append(_LENGTH.pack(len(extra)))
+            for key, item in extra:
+                _encode_str(key, out)
+                if item is None:
+                    out.append(_TAG.pack(_NONE_TAG))
+                else:
+                    out.append(_TAG.pack(0))
+                    encode_dynamic(item, out)
+        elif count != len(value):
+            unknown = [key for key in value if key not in key_set]
+            raise SchemaFieldNotFound(u'Key %s not defined in schema' % unknown[0])
+
+    def decode(buf, offset):
+        present = bytearray(buf[offset:offset + bitmap_len])
+        offset += bitmap_len
+        not_none = bytearray(buf[offset:offset + bitmap_len])
+        offset += bitmap_len
+        value = {}
+        for i, key in enumerate(keys):
+            bit = 1 << (i & 7)
+            if not present[i >> 3] & bit:
+                continue
+            if not_none[i >> 3] & bit:
+                value[key], offset = decoders[i](buf, offset)
+            else:
+                value[key] = None
+
+        if dynamic:
+            length, = _LENGTH.unpack_from(buf, offset)
+            offset += 4
+            for i in xrange(length):
+                key, offset = _decode_str(buf, offset)
+                tag, = _TAG.unpack_from(buf, offset)
+                offset += 1
+                if tag == _NONE_TAG:
+                    value[key] = None
+                else:
+                    value[key], offset = decode_dynamic(buf, offset)
+        return value, offset
+
+    return encode, decode
+
+
+_FIXED_CODECS = [
+    (IntField, _fixed(_INT)),
+    (LongField, (_encode_long, _decode_long)),
+    (FloatField, _fixed(_FLOAT)),
+    (UnicodeField, (_encode_str, _decode_str)),
+    (UuidField, (_encode_uuid, _decode_uuid)),
+    (NoneField, (_encode_none, _decode_none)),
+    (DatetimeField, (_encode_datetime, _decode_datetime)),
+    (DateField, (_encode_date, _decode_date)),
+    (TimeField, (_encode_time, _decode_time)),
+]
+
+
+def _compile(field):
+    """ Return an `(encode, decode)` tuple of functions for `field`.
+    `encode(value, out)` appends byte strings to the list `out`,
+    `decode(buf, offset)` returns a `(value, offset)` tuple.
+    """
+    for field_class, codec in _FIXED_CODECS:
+        if isinstance(field, field_class):
+            return codec
+    if isinstance(field, EnumField):
+        return _compile_enum(field)
+    elif isinstance(field, ListField):
+        return _compile_list(field)
+    elif isinstance(field, DictField):
+        return _compile_dict(field)
+    else:
+        return _compile_json(field)
+
+
+class BinaryCodec(object):
+    """ Encodes documents of a schema to a compact binary format and back.
+
+    Each encoded document starts with a header containing `version`, so that
+    data encoded with an incompatible version of the schema is detected.
+    """
+    def __init__(self, schema, version=0):
+        """ Constructor.
+
+        :param schema: A `Schema` (or any `DictField`) describing the
+        documents.
+        :param version: The version of the schema; increment it whenever the
+        schema changes.
+        :raises SchemaDefinitionError: If the schema cannot be encoded.
+        """
+        self.schema = schema
+        self.version = version
+        self._header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, version)
+        self._encode, self._decode = _compile_dict(schema)
+
+    def encode(self, doc):
+        """ Encode the document `doc` and return a byte string.
+        """
+        out = [self._header]
+        self._encode(doc, out)
+        return ''.join(out)
+
+    def decode(self, data):
+        """ Decode a document encoded with `encode()`.
+
+        :param data: A byte string, `bytearray` or `memoryview`. Strings are
+        decoded from slices of a `memoryview` on `data`, without copying.
+        :raises BinaryFormatError: If `data` was not encoded with the same
+        schema version or is truncated.
+        """
+        doc, offset = self.decode_from(data)
+        return doc
+
+    def decode_from(self, data, offset=0):
+        """ Decode a document starting at `offset` in `data`.
+
+        :return: A tuple of the document and the offset after its end.
+        :raises BinaryFormatError: See `decode()`.
+        """
+        buf = data if isinstance(data, memoryview) else memoryview(data)
+        try:
+            magic, format_version, version = _HEADER.unpack_from(buf, offset)
+        except struct.error:
+            raise BinaryFormatError(u'Data is too short for a header')
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            raise BinaryFormatError(u'Data is not in binary format version %d' %
+                                    _FORMAT_VERSION)
+        if version != self.version:
+            raise BinaryFormatError(u'Data has schema version %d instead of %d' %
+                                    (version, self.version))
+        try:
+            return self._decode(buf, offset + _HEADER.size)
+        except (struct.error, IndexError, ValueError) as e:
+            raise BinaryFormatError(u'Data is truncated or corrupt: %s' % e)
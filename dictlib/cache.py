@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Memoization of validation results for repeated sub-documents.
+
+A `ValidationCache` remembers which (field, sub-document) pairs have been
+proven valid, so that `DictField.validate()` and `ListField.validate()` can
+skip identical sub-documents:
+
+>>> cache = ValidationCache(max_size=10000)
+>>> schema.validate(doc, cache=cache)
+
+Sub-documents are identified by their structure and content, never by
+`id()`: a frozen, hashable copy of each sub-document is part of the cache
+key, including the type of every key and value (so that `1` and `1.0` are
+told apart). Modifying a dictionary after it has been validated therefore
+never causes a false cache hit. Fields are identified by the field object
+itself; call `ValidationCache.clear()` after changing a schema definition,
+e. g. with `DictField.extend()`.
+"""
+
+import collections
+import threading
+
+
+__all__ = (u'ValidationCache',)
+
+
+# Types of values which can be frozen as they are
+_SCALAR_TYPES = frozenset([unicode, str, int, long, float, bool, type(None)])
+
+
+class _Mapping(object):
+    """ Marker for frozen mappings.
+    """
+    pass
+
+
+class ValidationCache(object):
+    """ A bounded LRU cache of validation results. Only successful validations
+    are cached. A cache may be shared between threads.
+    """
+    def __init__(self, max_size=1024):
+        """ Constructor.
+
+        :param max_size: The maximum number of cached validation results.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """ Remove all cached validation results and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def session(self):
+        """ Return a session for validating a single document. Sessions
+        remember the frozen copies of sub-documents, so that each part of the
+        document is frozen only once.
+        """
+        return _ValidationCacheSession(self)
+
+    def contains(self, key):
+        """ Return whether validation with `key` was successful before and
+        update the hit/miss counters.
+        """
+        if key is None:
+            return False
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False
+            self._entries[key] = value
+            self.hits += 1
+            return True
+
+    def add(self, key):
+        """ Record a successful validation for `key`.
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = True
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class _ValidationCacheSession(object):
+    def __init__(self, cache):
+        self.cache = cache
+        # Maps id(value) -> (value, frozen value); keeping a reference to the
+        # value makes sure the id is not reused during the session
+        self._frozen = {}
+
+    def session(self):
+        return self
+
+    def make_key(self, field, value, partial):
+        """ Return the cache key for validating `value` with `field` or `None`
+        if `value` cannot be frozen, e. g. because it contains unhashable
+        values.
+        """
+        frozen = self._freeze(value)
+        if frozen is None:
+            return None
+        return (field, partial, frozen)
+
+    def contains(self, key):
+        return self.cache.contains(key)
+
+    def add(self, key):
+        self.cache.add(key)
+
+    def _freeze(self, value):
+        if type(value) is dict or isinstance(value, collections.Mapping):
+            try:
+                return self._frozen[id(value)][1]
+            except KeyError:
+                pass
+            items = []
+            for key, item in value.iteritems():
+                item_type = item.__class__
+                if item_type in _SCALAR_TYPES:
+                    frozen_item = (item_type, item)
+                else:
+                    frozen_item = self._freeze(item)
+                    if frozen_item is None:
+                        frozen = None
+                        break
+                items.append((key.__class__, key, frozen_item))
+            else:
+                frozen = (_Mapping, frozenset(items))
+            self._frozen[id(value)] = (value, frozen)
+            return frozen
+        elif isinstance(value, (list, tuple)):
+            try:
+                return self._frozen[id(value)][1]
+            except KeyError:
+                pass
+            items = []
+            for item in value:
+                item_type = item.__class__
+                if item_type in _SCALAR_TYPES:
+                    frozen_item = (item_type, item)
+                else:
+                    frozen_item = self._freeze(item)
+                    if frozen_item is None:
+                        frozen = None
+                        break
+                items.append(frozen_item)
+            else:
+                frozen = (value.__class__, tuple(items))
+            self._frozen[id(value)] = (value, frozen)
+            return frozen
+        else:
+            try:
+                hash(value)
+            except TypeError:
+                return None
+            return (value.__class__, value)
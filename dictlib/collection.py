@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" In-memory collections of documents with secondary indexes on dotted
+paths.
+
+>>> books = DocumentCollection(BookSchema())
+>>> books.create_index(u'info.author.id')
+>>> books.create_index(u'year')
+>>> books.insert({u'info': {u'author': {u'id': 1}}, u'year': 1931})
+>>> books.find(u'info.author.id', 1)
+>>> books.find_range(u'year', 1900, 1950)
+"""
+
+from dictlib.exceptions import SchemaFieldNotFound
+from dictlib.schema import AbstractNumericField, BaseDatetimeField, \
+    DictField, ListField
+from dictlib.sorteddict import _SortedList, _MAX
+from dictlib.utils import getitem, setitem
+import collections
+import itertools
+
+
+__all__ = (u'DocumentCollection',)
+
+
+HASH = u'hash'
+SORTED = u'sorted'
+
+# Fields whose values are ordered and get a sorted index by default
+_SORTABLE_FIELDS = (AbstractNumericField, BaseDatetimeField)
+
+
+def _get_path_field(schema, path):
+    """ Return a tuple of the field of the dotted `path` in `schema` and
+    whether the path leads through or to a `ListField`, so that list elements
+    are indexed. The field is `None` if it cannot be determined, e. g. for
+    `ListField`s with several element fields. List elements are addressed
+    without an index, e. g. `items.sku` for the key `sku` of the elements of
+    the list `items`.
+
+    :raises SchemaFieldNotFound: If `path` is not defined in `schema`.
+    """
+    field = schema
+    multi = False
+    for key in path.split(u'.') + [None]:
+        while isinstance(field, ListField):
+            multi = True
+            if len(field.fields) != 1:
+                return None, multi
+            field = field.fields[0]
+        if key is None:
+            break
+        if not isinstance(field, DictField):
+            raise SchemaFieldNotFound(u'Path %s not defined in schema' % path)
+        try:
+            field = field.get_field(key)
+        except SchemaFieldNotFound:
+            raise SchemaFieldNotFound(u'Path %s not defined in schema' % path)
+    return field, multi
+
+
+def _iter_path_values(value, segments):
+    """ Iterate over the values at the path `segments` in `value`. Lists on
+    the path are expanded into their elements, unless a segment is a number
+    indexing the list, and so are lists at the end of the path.
+    """
+    if isinstance(value, collections.Sequence) and not isinstance(value, basestring):
+        if segments and segments[0].isdigit():
+            index = int(segments[0])
+            if index < len(value):
+                for v in _iter_path_values(value[index], segments[1:]):
+                    yield v
+        else:
+            for element in value:
+                for v in _iter_path_values(element, segments):
+                    yield v
+    elif not segments:
+        yield value
+    elif isinstance(value, collections.Mapping) and segments[0] in value:
+        for v in _iter_path_values(value[segments[0]], segments[1:]):
+            yield v
+
+
+class _Index(object):
+    """ Base class of indexes on a dotted path.
+    """
+    def __init__(self, path, multi=False, value_type=None):
+        """ Constructor.
+
+        :param path: The dotted path of the indexed values.
+        :param multi: Whether the elements of lists on and at the end of
+        `path` are indexed.
+        :param value_type: If set, values of other types are not indexed.
+        """
+        self.path = path
+        self.multi = multi
+        self.value_type = value_type
+        self._segments = path.split(u'.')
+        # Maps document ids to their indexed keys, for removing them
+        self._keys_by_id = {}
+
+    def add(self, doc_id, doc):
+        """ Index the document `doc` with id `doc_id`, which must not be
+        indexed already.
+        """
+        raise NotImplementedError()
+
+    def remove(self, doc_id):
+        """ Remove the entries of the document with id `doc_id`, using the
+        keys it was indexed with, so that it may have been changed in place
+        since.
+        """
+        raise NotImplementedError()
+
+    def keys_of(self, doc):
+        if self.multi:
+            values = list(_iter_path_values(doc, self._segments))
+        else:
+            try:
+                values = (getitem(doc, self.path),)
+            except (KeyError, IndexError, TypeError):
+                return ()
+        if self.value_type is not None:
+            return [v for v in values if isinstance(v, self.value_type)]
+        return values
+
+
+class _HashIndex(_Index):
+    """ Maps each value to the set of ids of the documents containing it.
+    """
+    kind = HASH
+
+    def __init__(self, path, multi=False, value_type=None):
+        super(_HashIndex, self).__init__(path, multi, value_type)
+        self._ids = {}
+
+    def add(self, doc_id, doc):
+        keys = []
+        for key in self.keys_of(doc):
+            try:
+                self._ids.setdefault(key, set()).add(doc_id)
+                keys.append(key)
+            except TypeError:
+                # Unhashable values are not indexed
+                pass
+        if keys:
+            self._keys_by_id[doc_id] = keys
+
+    def remove(self, doc_id):
+        for key in self._keys_by_id.pop(doc_id, ()):
+            ids = self._ids.get(key)
+            # Keys occurring several times have been removed already
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._ids[key]
+
+    def find(self, value):
+        try:
+            return self._ids.get(value, ())
+        except TypeError:
+            return ()
+
+
+class _SortedIndex(_Index):
+    """ Keeps `(value, doc_id)` tuples in a `_SortedList` for range queries.
+    """
+    kind = SORTED
+
+    def __init__(self, path, multi=False, value_type=None):
+        super(_SortedIndex, self).__init__(path, multi, value_type)
+        self._entries = _SortedList()
+
+    def add(self, doc_id, doc):
+        keys = [key for key in self.keys_of(doc) if key is not None]
+        for key in keys:
+            self._entries.add((key, doc_id))
+        if keys:
+            self._keys_by_id[doc_id] = keys
+
+    def remove(self, doc_id):
+        for key in self._keys_by_id.pop(doc_id, ()):
+            self._entries.remove((key, doc_id))
+
+    def find(self, value):
+        return self.find_range(value, value)
+
+    def find_range(self, min=None, max=None, include_min=True, include_max=True):
+        # The tuple (value,) sorts before and (value, _MAX) after all tuples
+        # (value, doc_id), so document ids are never compared
+        entries = self._entries
+        if min is None:
+            start = 0
+        else:
+            start = entries.bisect_left((min,) if include_min else (min, _MAX))
+        if max is None:
+            end = len(entries)
+        else:
+            end = entries.bisect_left((max, _MAX) if include_max else (max,))
+        return [doc_id for key, doc_id in entries.islice(start, end)]
+
+
+class DocumentCollection(collections.Mapping):
+    """ A collection of documents, mapping document ids to documents, with
+    hash indexes for equality queries and sorted indexes for range queries
+    on dotted paths. The indexes are updated on `insert()`, `update()`,
+    `set()` and `delete()`; documents changed otherwise must be passed to
+    `update()` to keep the indexes consistent.
+
+    Queries on paths without an index scan all documents.
+    """
+    def __init__(self, schema=None, docs=()):
+        """ Constructor.
+
+        :param schema: An optional `Schema` of the documents, used to choose
+        the kind and key type of indexes.
+        :param docs: Documents to insert.
+        """
+        self.schema = schema
+        self._docs = collections.OrderedDict()
+        self._indexes = {}
+        self._ids = itertools.count()
+        for doc in docs:
+            self.insert(doc)
+
+    def create_index(self, path, kind=None):
+        """ Create an index on the dotted `path` and index all documents.
+
+        The kind of index depends on the field of `path` in the schema: paths
+        of numeric and datetime fields get a sorted index, which only indexes
+        numbers or values of the datetime type, respectively; all others get
+        a hash index. For `ListField`s, each element is indexed, also for
+        paths into dictionaries in lists. Without a schema, a hash index is
+        created.
+
+        :param path: A dotted path, e. g. `info.author.id` or `items.sku`.
+        :param kind: `u'hash'` or `u'sorted'` to override the kind of index.
+        :raises SchemaFieldNotFound: If `path` is not defined in the schema.
+        """
+        if self.schema is not None:
+            field, multi = _get_path_field(self.schema, path)
+        else:
+            field, multi = None, False
+
+        if kind is None:
+            kind = SORTED if isinstance(field, _SORTABLE_FIELDS) else HASH
+        if kind not in (HASH, SORTED):
+            raise ValueError(u'Invalid index kind %r' % kind)
+        value_type = None
+        if kind == SORTED:
+            # Numbers of different types are comparable with each other
+            if isinstance(field, AbstractNumericField):
+                value_type = AbstractNumericField.json_type
+            elif isinstance(field, BaseDatetimeField):
+                value_type = field.type
+
+        index_class = _SortedIndex if kind == SORTED else _HashIndex
+        index = index_class(path, multi=multi, value_type=value_type)
+        for doc_id, doc in self._docs.iteritems():
+            index.add(doc_id, doc)
+        self._indexes[path] = index
+
+    def drop_index(self, path):
+        """ Remove the index on `path`.
+
+        :raises KeyError: If there is no index on `path`.
+        """
+        del self._indexes[path]
+
+    def index_kind(self, path):
+        """ Return the kind of index on `path` or `None`.
+        """
+        index = self._indexes.get(path)
+        return index.kind if index is not None else None
+
+    def insert(self, doc, doc_id=None):
+        """ Add `doc` to the collection.
+
+        :param doc_id: The id of the document. Default: a new integer id.
+        :return: The id of the document.
+        :raises KeyError: If there is a document with id `doc_id` already.
+        """
+        if doc_id is None:
+            doc_id = next(self._ids)
+            while doc_id in self._docs:
+                doc_id = next(self._ids)
+        elif doc_id in self._docs:
+            raise KeyError(u'Document %r exists already' % (doc_id,))
+        self._docs[doc_id] = doc
+        for index in self._indexes.itervalues():
+            index.add(doc_id, doc)
+        return doc_id
+
+    def update(self, doc_id, doc=None):
+        """ Replace the document with id `doc_id` by `doc` and update the
+        indexes. If `doc` is not given, reindex the document after it has
+        been changed in place.
+
+        :raises KeyError: If there is no document with id `doc_id`.
+        """
+        if doc_id not in self._docs:
+            raise KeyError(doc_id)
+        for index in self._indexes.itervalues():
+            index.remove(doc_id)
+        if doc is not None:
+            self._docs[doc_id] = doc
+        for index in self._indexes.itervalues():
+            index.add(doc_id, self._docs[doc_id])
+
+    def set(self, doc_id, path, value):
+        """ Set the value of the dotted `path` in the document with id
+        `doc_id` and update only the indexes affected.
+
+        :raises KeyError: If there is no document with id `doc_id`.
+        """
+        doc = self._docs[doc_id]
+        # Index paths address list elements without an index
+        key_path = u'.'.join(key for key in path.split(u'.') if not key.isdigit())
+        prefix = key_path + u'.'
+        affected = [index for index in self._indexes.itervalues()
+                    if index.path in (path, key_path) or index.path.startswith(prefix) or
+                    path.startswith(index.path + u'.') or
+                    key_path.startswith(index.path + u'.')]
+        setitem(doc, path, value)
+        for index in affected:
+            index.remove(doc_id)
+            index.add(doc_id, doc)
+
+    def delete(self, doc_id):
+        """ Remove the document with id `doc_id`.
+
+        :raises KeyError: If there is no document with id `doc_id`.
+        """
+        del self._docs[doc_id]
+        for index in self._indexes.itervalues():
+            index.remove(doc_id)
+
+    def __getitem__(self, doc_id):
+        return self._docs[doc_id]
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def find_ids(self, path, value):
+        """ Return the ids of all documents whose value at `path` equals
+        `value` (or, for `ListField`s, contains `value`).
+        """
+        index = self._indexes.get(path)
+        if index is not None:
+            ids = index.find(value)
+            if isinstance(index, _HashIndex):
+                return sorted(ids) if len(ids) > 1 else list(ids)
+            return ids
+        scan = _HashIndex(path, multi=True)
+        return [doc_id for doc_id, doc in self._docs.iteritems()
+                if value in scan.keys_of(doc)]
+
+    def find(self, path, value):
+        """ Return all documents whose value at `path` equals `value`.
+
+        :see: `DocumentCollection.find_ids`
+        """
+        docs = self._docs
+        return [docs[doc_id] for doc_id in self.find_ids(path, value)]
+
+    def find_range_ids(self, path, min=None, max=None, include_min=True,
+                       include_max=True):
+        """ Return the ids of all documents whose value at `path` is between
+        `min` and `max`, ordered by value.
+
+        :param min: The lower bound or `None` for no lower bound.
+        :param max: The upper bound or `None` for no upper bound.
+        :param include_min: Whether values equal to `min` match.
+        :param include_max: Whether values equal to `max` match.
+        """
+        index = self._indexes.get(path)
+        if isinstance(index, _SortedIndex):
+            return index.find_range(min, max, include_min, include_max)
+
+        scan = _SortedIndex(path, multi=True)
+        for doc_id, doc in self._docs.iteritems():
+            scan.add(doc_id, doc)
+        return scan.find_range(min, max, include_min, include_max)
+
+    def find_range(self, path, min=None, max=None, include_min=True,
+                   include_max=True):
+        """ Return all documents whose value at `path` is between `min` and
+        `max`, ordered by value.
+
+        :see: `DocumentCollection.find_range_ids`
+        """
+        docs = self._docs
+        return [docs[doc_id] for doc_id in
+                self.find_range_ids(path, min, max, include_min, include_max)]
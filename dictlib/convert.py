@@ -21,7 +21,11 @@
 from dictlib.utils import walk
 from dictlib.mapping import DotNotationAdapter
 import collections
-from dictlib.schema import Schema
+import re
+import types
+from dictlib.schema import Schema, DictField, ListField, NoneField, AnyField, \
+    AbstractNumericField, UnicodeField, EmailField, UrlField, EnumField, \
+    UuidField, BaseDatetimeField, DatetimeField, DateField, TimeField
 
 class Converter(object):
     """ A `Converter` can be used to convert a dictionary into another
@@ -137,63 +141,308 @@ class JsonConverter(Converter):
         key = key.decode(u'utf-8') if isinstance(key, str) else key
         return (key, self.schema.get_field(key).from_json(value))
 
-#class JsonSchemaConverter(Converter):
-#    """ A basic `Schema` to JSON Schema converter.
-#
-#    For reference, see http://tools.ietf.org/html/draft-zyp-json-schema-03
-#
-#    Some features that don't work yet include:
-#    * exclusive[Mininum,Maximum,minLength,maxLength]
-#    * enum on any list
-#    * AnyField (partially)
-#    """
-#    schema = Schema({unicode: FieldField(optional=True)})
-#    factory = dict
-#
-#    def to_json(self, schema):
-#        schema = Schema(super(JsonSchemaConverter, self).to_json(schema.get_schema()))
-#        return self._field_to_json(schema)
-#
-#    def _field_to_json(self, field):
-#        json_schema_doc = {}
-#        if not field.optional:
-#            json_schema_doc[u'required'] = True
-#        if field.title is not None:
-#            json_schema_doc[u'title'] = field.title
-#        if field.description is not None:
-#            json_schema_doc[u'description'] = field.description
-#        if field.default is not None:
-#            json_schema_doc[u'default'] = field.default
-#
-#        if isinstance(field, DictField):
-#            json_schema_doc[u'type'] = u'object'
-#            json_schema_doc[u'properties']= {}
-#            for subfield_name, subfield in field.get_schema().iteritems():
-#                json_schema_doc[u'properties'][subfield_name] = self._field_to_json(subfield)
-#        elif isinstance(field, ListField):
-#            json_schema_doc[u'type'] = u'array'
-#            if field.min_len is not None:
-#                json_schema_doc[u'minItems'] = field.min_len
-#            if field.max_len is not None:
-#                json_schema_doc[u'maxItems'] = field.max_len
-#            if len(field.fields) == 1:
-#                json_schema_doc[u'items'] = self.to_json(field.fields[0])
-#            else:
-#                json_schema_doc[u'items'] = [self.to_json(field) for field in field.fields]
-#        elif isinstance(field, NoneField):
-#            json_schema_doc[u'type'] = u'null'
-#        elif isinstance(field, AnyField):
-#            json_schema_doc[u'type'] = u'any'
-#        elif isinstance(field, AbstractNumericField):
-#            json_schema_doc[u'type'] = u'number'
-#            if field.min is not None:
-#                json_schema_doc[u'minimum'] = field.min
-#            if field.max is not None:
-#                json_schema_doc[u'maximum'] = field.max
-#        elif isinstance(field, UnicodeField):
-#            json_schema_doc[u'type'] = u'string'
-#
-#        return json_schema_doc
-#
-#    def from_json(self, json_schema_doc):
-#        raise NotImplementedError(u'from_json for JSON schemas is not yet implemented')
+def _freeze(value):
+    """ Return a hashable form of the JSON-like `value`.
+    """
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.iteritems())
+    elif isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _escape_pattern(s):
+    """ Escape the special characters of regular expressions in `s`. Unlike
+    `re.escape()`, other characters are not escaped, since escaping them is
+    invalid in JSON Schema (ECMA 262) patterns.
+    """
+    return re.sub(ur'([\\^$.|?*+()\[\]{}])', ur'\\\1', s)
+
+
+class JsonSchemaConverter(object):
+    """ A `Schema` to JSON Schema (draft 4) converter for single schemas and
+    registries of many schemas.
+
+    Each `DictField` is emitted once under `definitions` and referenced
+    through `$ref`. Definitions are identified by a hash of their JSON
+    Schema, so structurally identical sub-fields share a single definition,
+    even if they are different objects in different schemas. Definitions
+    are named after their `DictField` subclass or, for plain `DictField`s,
+    after the first key they appear under.
+
+    The translation of each field object is memoized across all schemas
+    exported with the same converter, so create a new converter after
+    changing schemas. Returned documents share sub-dictionaries; copy them
+    before modifying them.
+
+    Some features that don't work yet include:
+    * `Field` subclasses with their own constraints in `validate()`
+    * type keys other than strings (JSON object keys are always strings)
+    """
+    json_schema_uri = u'http://json-schema.org/draft-04/schema#'
+
+    _uuid_pattern = u'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-' \
+        u'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+    _date_patterns = {
+        DateField: u'^[0-9]{4}-[0-9]{2}-[0-9]{2}$',
+        TimeField: u'^[0-9]{2}:[0-9]{2}:[0-9]{2}$',
+    }
+
+    def __init__(self, use_refs=True):
+        """ Constructor.
+
+        :param use_refs: Whether to emit `DictField`s as definitions. If
+        `False`, they are inlined wherever they occur.
+        """
+        self.use_refs = use_refs
+        # Maps id(field) -> (field, JSON Schema); holding the field makes
+        # sure its id is not reused
+        self._field_docs = {}
+        # Maps id(schema) -> (schema, JSON Schema, names of the definitions
+        # it references) for exported schemas
+        self._schema_docs = {}
+        # Maps definition names to the names of the definitions they
+        # reference
+        self._definition_references = {}
+        # Maps the frozen form of a definition to its name and back
+        self._definition_names = {}
+        self._definitions = {}
+
+    def to_json(self, schema):
+        """ Return the JSON Schema of `schema` with the definitions it
+        references.
+        """
+        doc, names = self._schema_to_json(schema)
+        doc = dict(doc)
+        doc[u'$schema'] = self.json_schema_uri
+        if names:
+            doc[u'definitions'] = dict((name, self._definitions[name]) for name in names)
+        return doc
+
+    def export(self, schemas):
+        """ Return a registry document for many schemas, with the shared
+        definitions of all of them under `definitions` and the JSON Schema
+        of each schema under `schemas`. References in the schemas are
+        relative to the registry document.
+
+        :param schemas: A mapping of names to `Schema` instances.
+        """
+        docs = {}
+        names = set()
+        for name in sorted(schemas):
+            docs[name], schema_names = self._schema_to_json(schemas[name])
+            names.update(schema_names)
+        return {u'$schema': self.json_schema_uri,
+                u'definitions': dict((name, self._definitions[name]) for name in names),
+                u'schemas': docs}
+
+    def _schema_to_json(self, schema):
+        """ Return the (memoized) JSON Schema of the top-level `schema` and
+        the names of the definitions it references.
+        """
+        try:
+            return self._schema_docs[id(schema)][1:]
+        except KeyError:
+            pass
+        doc = self._object_to_json(schema)
+        names = self._collect_references(doc)
+        self._schema_docs[id(schema)] = (schema, doc, names)
+        return doc, names
+
+    def _collect_references(self, doc):
+        """ Return the names of the definitions referenced by `doc`, directly
+        or through other definitions.
+        """
+        names = set()
+        if not self.use_refs:
+            return names
+        stack = [doc]
+        while stack:
+            doc = stack.pop()
+            if isinstance(doc, dict):
+                ref = doc.get(u'$ref')
+                if ref is not None:
+                    name = ref[len(u'#/definitions/'):]
+                    if name not in names:
+                        names.add(name)
+                        names.update(self._references_of(name))
+                stack.extend(doc.itervalues())
+            elif isinstance(doc, list):
+                stack.extend(doc)
+        return names
+
+    def _references_of(self, name):
+        """ Return the (memoized) names of the definitions referenced by the
+        definition `name`.
+        """
+        try:
+            return self._definition_references[name]
+        except KeyError:
+            pass
+        names = self._definition_references[name] = \
+            self._collect_references(self._definitions[name])
+        return names
+
+    def _field_to_json(self, field, key=None):
+        """ Return the (memoized) JSON Schema of `field`.
+
+        :param key: The key of `field` in its dictionary, used to name
+        definitions.
+        """
+        try:
+            return self._field_docs[id(field)][1]
+        except KeyError:
+            pass
+        if isinstance(field, DictField):
+            doc = self._object_to_json(field)
+            if self.use_refs:
+                doc = {u'$ref': u'#/definitions/%s' % self._define(field, key, doc)}
+        else:
+            doc = self._value_to_json(field)
+        doc = self._add_annotations(field, doc)
+        self._field_docs[id(field)] = (field, doc)
+        return doc
+
+    def _define(self, field, key, doc):
+        """ Register `doc` as a definition and return its name.
+        """
+        frozen_doc = _freeze(doc)
+        try:
+            return self._definition_names[frozen_doc]
+        except KeyError:
+            pass
+        if field.__class__ not in (DictField, Schema):
+            base_name = field.__class__.__name__
+        else:
+            base_name = key if isinstance(key, basestring) else u'object'
+        name, i = base_name, 1
+        while name in self._definitions:
+            i += 1
+            name = u'%s_%d' % (base_name, i)
+        self._definition_names[frozen_doc] = name
+        self._definitions[name] = doc
+        return name
+
+    def _object_to_json(self, field):
+        """ Return the JSON Schema of the `DictField` `field` itself.
+        """
+        properties = {}
+        required = []
+        additional = []
+        for key, sub_field in field.get_schema().iteritems():
+            if isinstance(key, types.TypeType):
+                additional.append(self._field_to_json(sub_field))
+                continue
+            properties[key] = self._field_to_json(sub_field, key)
+            if not sub_field.optional:
+                required.append(key)
+        doc = {u'type': u'object', u'properties': properties}
+        if required:
+            doc[u'required'] = sorted(required)
+        if not additional:
+            doc[u'additionalProperties'] = False
+        elif len(additional) == 1:
+            doc[u'additionalProperties'] = additional[0]
+        else:
+            doc[u'additionalProperties'] = {u'anyOf': additional}
+        return doc
+
+    def _value_to_json(self, field):
+        doc = {}
+        if isinstance(field, ListField):
+            doc[u'type'] = u'array'
+            if field.min_len:
+                doc[u'minItems'] = field.min_len
+            if field.max_len is not None:
+                doc[u'maxItems'] = field.max_len
+            items = [self._field_to_json(element_field) for element_field in field.fields]
+            if len(items) == 1:
+                if items[0]:
+                    doc[u'items'] = items[0]
+            else:
+                doc[u'items'] = {u'anyOf': items}
+        elif isinstance(field, NoneField):
+            doc[u'type'] = u'null'
+        elif isinstance(field, AbstractNumericField):
+            doc[u'type'] = u'integer' if field.type in (int, long) else u'number'
+            if field.min is not None:
+                doc[u'minimum'] = field.min
+            if field.max is not None:
+                doc[u'maximum'] = field.max
+        elif isinstance(field, UnicodeField):
+            doc[u'type'] = u'string'
+            if field.length is not None:
+                doc[u'minLength'] = doc[u'maxLength'] = field.length
+            else:
+                if field.min_len is not None:
+                    doc[u'minLength'] = field.min_len
+                if field.max_len is not None:
+                    doc[u'maxLength'] = field.max_len
+                pattern = self._string_pattern(field)
+                if pattern is not None:
+                    doc[u'pattern'] = pattern
+            if isinstance(field, EmailField):
+                doc[u'format'] = u'email'
+            elif isinstance(field, UrlField):
+                doc[u'format'] = u'uri'
+        elif isinstance(field, EnumField):
+            doc[u'enum'] = [field.to_json(value) for value in field.values]
+        elif isinstance(field, UuidField):
+            doc[u'type'] = u'string'
+            doc[u'pattern'] = self._uuid_pattern
+        elif isinstance(field, DatetimeField):
+            doc[u'type'] = u'string'
+            doc[u'format'] = u'date-time'
+        elif isinstance(field, BaseDatetimeField):
+            doc[u'type'] = u'string'
+            doc[u'pattern'] = self._date_patterns[field.__class__]
+        return doc
+
+    def _string_pattern(self, field):
+        """ Return a single regular expression for the prefixes, required
+        characters and pattern of the `UnicodeField` `field` or `None`.
+        """
+        parts = []
+        if field.prefixes is not None:
+            parts.append(u'(?=%s)' % u'|'.join(_escape_pattern(prefix)
+                                                for prefix in field.prefixes))
+        for char in field.required_chars or u'':
+            parts.append(u'(?=[\\s\\S]*%s)' % _escape_pattern(char))
+        if field.match is not None:
+            source = field.match if isinstance(field.match, basestring) else field.match.pattern
+            parts.append(u'(?:%s)' % source)
+            if field.full_match:
+                parts.append(u'$')
+        return u'^' + u''.join(parts) if parts else None
+
+    def _add_annotations(self, field, doc):
+        """ Add title, description, default and `null` values to `doc`.
+        """
+        if field.can_be_none and not isinstance(field, (NoneField, AnyField)):
+            if isinstance(doc.get(u'type'), unicode):
+                doc = dict(doc)
+                doc[u'type'] = [doc[u'type'], u'null']
+            elif u'enum' in doc:
+                doc = dict(doc)
+                doc[u'enum'] = doc[u'enum'] + [None]
+            else:
+                doc = {u'anyOf': [doc, {u'type': u'null'}]}
+        annotations = {}
+        if field.title is not None:
+            annotations[u'title'] = field.title
+        if field.description is not None:
+            annotations[u'description'] = field.description
+        if field.default is not None and not callable(field.default) and \
+                not (isinstance(field.default, (list, dict)) and not field.default):
+            try:
+                annotations[u'default'] = field.to_json(field.default)
+            except Exception:
+                pass
+        if annotations:
+            if u'$ref' in doc:
+                # Keywords next to $ref are ignored
+                doc = {u'allOf': [doc]}
+            else:
+                doc = dict(doc)
+            doc.update(annotations)
+        return doc
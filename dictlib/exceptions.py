@@ -20,8 +20,15 @@
 
 class ValidationError(Exception):
     """ Thrown when validation fails.
+
+    The dotted path of the invalid field and the name of the violated
+    constraint (e. g. `type`, `min` or `required`) are available as the
+    `path` and `constraint` attributes, if known.
     """
-    pass
+    def __init__(self, message, path=None, constraint=None):
+        super(ValidationError, self).__init__(message)
+        self.path = path
+        self.constraint = constraint
 
 class SchemaFieldNotFound(Exception):
     """ Thrown when trying to access a non-existing schema field.
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Lazy views on JSON-decoded documents. Instead of converting a whole
+document with `DictField.from_json()`, the views convert each value only when
+it is read for the first time and cache the result.
+"""
+
+from dictlib.mapping import BaseDictAdapter, ObjectMappingAdapter
+from dictlib.schema import DictField, ListField
+import collections
+
+
+__all__ = (u'LazyJsonAdapter', u'LazyJsonList')
+
+
+def lazy_from_json(field, value):
+    """ Convert the JSON-decoded `value` of `field` like `field.from_json()`
+    does, but return lazy views for dictionaries and lists. Fields whose
+    `from_json()` is replaced, by a subclass or on the instance, convert
+    their values themselves.
+    """
+    if isinstance(field, DictField) and isinstance(value, collections.Mapping) and \
+            _has_from_json_of(field, DictField):
+        return LazyJsonAdapter(field, value)
+    elif isinstance(field, ListField) and field.storage is None and \
+            isinstance(value, list) and _has_from_json_of(field, ListField):
+        return LazyJsonList(field, value)
+    else:
+        return field.from_json(value)
+
+
+def _has_from_json_of(field, cls):
+    # Instrumented methods replaced on the instance are plain functions
+    return getattr(field.from_json, u'im_func', None) is cls.from_json.im_func
+
+
+def _materialize(value):
+    if isinstance(value, (LazyJsonAdapter, LazyJsonList)):
+        return value.materialize()
+    return value
+
+
+class LazyJsonAdapter(BaseDictAdapter):
+    """ A read-write view on a JSON-decoded dictionary which converts values
+    with the `from_json()` method of their schema field on first access.
+    Nested dictionaries and lists are returned as lazy views themselves.
+
+    The JSON-decoded dictionary is never modified. Values can also be
+    accessed as attributes, like with `ObjectMappingAdapter`.
+    """
+    def __init__(self, schema, json_doc):
+        """ Constructor.
+
+        :param schema: A `DictField` (usually a `Schema`) describing `json_doc`.
+        :param json_doc: A dictionary as decoded from JSON.
+        """
+        BaseDictAdapter.__init__(self)
+        self.__dict__[u'_schema'] = schema
+        self.__dict__[u'_json_doc'] = json_doc
+        self.__dict__[u'_removed'] = set()
+
+    def _get_json_value(self, key):
+        try:
+            return self._json_doc[key]
+        except KeyError:
+            if isinstance(key, unicode):
+                return self._json_doc[key.encode(u'utf-8')]
+            raise
+
+    def __getitem__(self, key):
+        try:
+            return self._doc[key]
+        except KeyError:
+            if key in self._removed:
+                raise
+        json_value = self._get_json_value(key)
+        value = lazy_from_json(self._schema.get_field(key), json_value)
+        self._doc[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._doc[key] = value
+        self._removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._doc.pop(key, None)
+        self._removed.add(key)
+
+    def __contains__(self, key):
+        if key in self._doc:
+            return True
+        if key in self._removed:
+            return False
+        try:
+            self._get_json_value(key)
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        keys = set(self._doc)
+        for key in self._json_doc:
+            key = key.decode(u'utf-8') if isinstance(key, str) else key
+            if key not in self._removed:
+                keys.add(key)
+        return list(keys)
+
+    def __getattr__(self, key):
+        try:
+            value = self[key]
+        except KeyError:
+            raise AttributeError(u'Object has no attribute %s' % key)
+        if isinstance(value, dict):
+            return ObjectMappingAdapter(value)
+        return value
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    @property
+    def is_materialized(self):
+        """ Whether all values have been converted already.
+        """
+        return len(self._doc) == len(self.keys())
+
+    def materialize(self):
+        """ Convert all values not yet converted and return the whole document
+        as a plain (nested) dictionary, equal to the result of
+        `DictField.from_json()`.
+        """
+        return dict((key, _materialize(self[key])) for key in self.keys())
+
+    @property
+    def doc(self):
+        """ The fully converted document as a plain dictionary.
+
+        :see: `LazyJsonAdapter.materialize`
+        """
+        return self.materialize()
+
+
+class LazyJsonList(collections.MutableSequence):
+    """ A view on a JSON-decoded list which converts elements with the
+    `ListField.element_from_json()` method on first access. Dictionaries and
+    lists are returned as lazy views if there is only one element field that
+    can handle them.
+
+    The JSON-decoded list is never modified. It is only copied when elements
+    are inserted or deleted; until then, the view holds a reference to it
+    and the converted elements by index.
+    """
+    def __init__(self, field, json_list):
+        """ Constructor.
+
+        :param field: A `ListField` describing `json_list`.
+        :param json_list: A list as decoded from JSON.
+        """
+        self._field = field
+        self._json_list = json_list
+        self._copied = False
+        # Maps indexes to converted or assigned elements
+        self._values = {}
+
+    def _index(self, index):
+        length = len(self._json_list)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(u'list index out of range')
+        return index
+
+    def _convert(self, index):
+        value = self._json_list[index]
+        fields = self._field.get_json_fields_for_type(type(value))
+        if len(fields) == 1:
+            value = lazy_from_json(fields[0], value)
+        else:
+            value = self._field.element_from_json(value)
+        self._values[index] = value
+        return value
+
+    def _copy(self):
+        if not self._copied:
+            self._json_list = list(self._json_list)
+            self._copied = True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        index = self._index(index)
+        try:
+            return self._values[index]
+        except KeyError:
+            return self._convert(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            raise TypeError(u'LazyJsonList does not support slice assignment')
+        self._values[self._index(index)] = value
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for i in sorted(xrange(*index.indices(len(self))), reverse=True):
+                del self[i]
+            return
+        index = self._index(index)
+        self._copy()
+        del self._json_list[index]
+        self._values = dict((i - 1 if i > index else i, value)
+                            for i, value in self._values.iteritems() if i != index)
+
+    def __len__(self):
+        return len(self._json_list)
+
+    def insert(self, index, value):
+        length = len(self._json_list)
+        if index < 0:
+            index = max(index + length, 0)
+        index = min(index, length)
+        self._copy()
+        self._json_list.insert(index, None)
+        self._values = dict((i + 1 if i >= index else i, element)
+                            for i, element in self._values.iteritems())
+        self._values[index] = value
+
+    def __eq__(self, other):
+        if isinstance(other, LazyJsonList):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def materialize(self):
+        """ Convert all elements not yet converted and return a plain list,
+        equal to the result of `ListField.from_json()`.
+        """
+        return [_materialize(self[i]) for i in xrange(len(self._json_list))]
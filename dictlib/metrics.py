@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Metrics of validated and decoded documents for production use.
+
+>>> metrics = ValidationMetrics(sinks=[FileSink(u'metrics.jsonl')], sample_rate=0.01)
+>>> metrics.install(schema)
+>>> schema.is_valid(doc)
+>>> metrics.flush()
+
+Installed schemas count the calls and failures of `validate()` (and thereby
+`is_valid()` and `is_partially_valid()`) and `from_json()`, and the
+failures by dotted path and violated constraint, taken from the `path` and
+`constraint` attributes of `ValidationError`. For a sample of the documents,
+the number of keys, the nesting depth and the lengths of lists are recorded
+in histograms with power-of-two buckets.
+
+Metrics are aggregated per thread without locking; `snapshot()` and
+`flush()` merge the data of all threads. Nothing is written to the sinks
+before `flush()` is called, so recording a call only costs a few dictionary
+updates.
+"""
+
+from dictlib.exceptions import ValidationError
+import collections
+import json
+import random
+import threading
+import time
+
+
+__all__ = (u'ValidationMetrics', u'MetricsSink', u'MemorySink', u'FileSink',
+           u'CallbackSink')
+
+
+def _bucket(value):
+    """ Return the smallest power of two which is at least `value`, or `0`.
+    """
+    return 1 << (value - 1).bit_length() if value > 0 else 0
+
+
+class _Histogram(object):
+    __slots__ = (u'buckets', u'count', u'total', u'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        bucket = _bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge_into(self, result):
+        buckets = result[u'buckets']
+        for bucket, count in self.buckets.items():
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        result[u'count'] += self.count
+        result[u'total'] += self.total
+        result[u'max'] = max(result[u'max'], self.max)
+
+
+class _ThreadMetrics(object):
+    """ The metrics recorded by a single thread.
+    """
+    def __init__(self):
+        # Maps (schema, operation) to [calls, failures]
+        self.calls = {}
+        # Maps (schema, path, constraint) to a count
+        self.failures = {}
+        # Maps (schema, operation, histogram name) to a _Histogram
+        self.histograms = {}
+
+
+def _measure(doc):
+    """ Return the number of keys in all (nested) mappings of `doc`, its
+    nesting depth and a list of the lengths of all lists in `doc`.
+    """
+    keys = 0
+    max_depth = 0
+    list_lengths = []
+    stack = [(doc, 1)]
+    while stack:
+        value, depth = stack.pop()
+        if isinstance(value, collections.Mapping):
+            keys += len(value)
+            children = value.itervalues()
+        elif isinstance(value, list):
+            list_lengths.append(len(value))
+            children = value
+        else:
+            continue
+        if depth > max_depth:
+            max_depth = depth
+        for child in children:
+            if isinstance(child, (collections.Mapping, list)):
+                stack.append((child, depth + 1))
+    return keys, max_depth, list_lengths
+
+
+class MetricsSink(object):
+    """ The base class of receivers of metrics snapshots.
+    """
+    def write(self, snapshot):
+        """ Process `snapshot`, a JSON-encodable dictionary as returned by
+        `ValidationMetrics.snapshot()`.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class MemorySink(MetricsSink):
+    """ Keeps all snapshots in the list `snapshots`.
+    """
+    def __init__(self):
+        self.snapshots = []
+
+    @property
+    def last(self):
+        """ The latest snapshot or `None`.
+        """
+        return self.snapshots[-1] if self.snapshots else None
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class FileSink(MetricsSink):
+    """ Appends each snapshot as a line of JSON to a file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, snapshot):
+        line = json.dumps(snapshot, sort_keys=True) + '\n'
+        with self._lock:
+            with open(self.path, u'ab') as f:
+                f.write(line)
+
+
+class CallbackSink(MetricsSink):
+    """ Passes each snapshot to a function, e. g. to forward it to a
+    monitoring system.
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, snapshot):
+        self.callback(snapshot)
+
+
+class ValidationMetrics(object):
+    """ Counts validations, decodings and failures of documents of installed
+    schemas and records histograms of document sizes for a sample of them.
+    """
+    def __init__(self, sinks=(), sample_rate=1.0):
+        """ Constructor.
+
+        :param sinks: `MetricsSink`s to write snapshots to on `flush()`.
+        :param sample_rate: The fraction of documents whose sizes are
+        recorded in histograms. Calls and failures are always counted.
+        """
+        self.sinks = list(sinks)
+        self.sample_rate = sample_rate
+        self._local = threading.local()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._installed = {}
+
+    def _thread_metrics(self):
+        try:
+            return self._local.metrics
+        except AttributeError:
+            metrics = self._local.metrics = _ThreadMetrics()
+            with self._lock:
+                self._threads.append(metrics)
+            return metrics
+
+    def install(self, schema, name=None):
+        """ Record metrics of calls of `validate()` and `from_json()` of the
+        schema instance `schema`.
+
+        :param name: The name of the schema in the metrics. Default: the name
+        of the schema class.
+        :raises RuntimeError: If the methods of `schema` are replaced already,
+        e. g. by a `ValidationProfiler`.
+        """
+        if u'validate' in schema.__dict__ or u'from_json' in schema.__dict__:
+            raise RuntimeError(u'Schema %r is instrumented already' % schema)
+        name = name or schema.__class__.__name__
+        schema.validate = self._wrap(name, u'validate', schema.validate)
+        schema.from_json = self._wrap(name, u'from_json', schema.from_json)
+        self._installed[schema] = name
+
+    def uninstall(self, schema):
+        """ Stop recording metrics of `schema`.
+
+        :raises KeyError: If `schema` is not installed.
+        """
+        del self._installed[schema]
+        del schema.validate
+        del schema.from_json
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        for schema in self._installed.keys():
+            self.uninstall(schema)
+        self.flush()
+
+    def _wrap(self, name, operation, method):
+        key = (name, operation)
+        sizes_keys = ((name, operation, u'keys'), (name, operation, u'depth'),
+                      (name, operation, u'list_length'))
+
+        def record(doc, *args, **kwargs):
+            metrics = self._thread_metrics()
+            counters = metrics.calls.get(key)
+            if counters is None:
+                counters = metrics.calls[key] = [0, 0]
+            counters[0] += 1
+            sample_rate = self.sample_rate
+            if sample_rate >= 1 or (sample_rate > 0 and random.random() < sample_rate):
+                self._record_sizes(metrics, sizes_keys, doc)
+            try:
+                return method(doc, *args, **kwargs)
+            except ValidationError as e:
+                counters[1] += 1
+                failure_key = (name, e.path or u'', e.constraint or u'unknown')
+                metrics.failures[failure_key] = metrics.failures.get(failure_key, 0) + 1
+                raise
+            except Exception:
+                counters[1] += 1
+                raise
+
+        return record
+
+    def _record_sizes(self, metrics, sizes_keys, doc):
+        keys, depth, list_lengths = _measure(doc)
+        histograms = metrics.histograms
+        for histogram_key, values in zip(sizes_keys, ((keys,), (depth,), list_lengths)):
+            if not values:
+                continue
+            histogram = histograms.get(histogram_key)
+            if histogram is None:
+                histogram = histograms[histogram_key] = _Histogram()
+            for value in values:
+                histogram.add(value)
+
+    def snapshot(self):
+        """ Return the metrics of all threads as a JSON-encodable dictionary:
+
+        >>> {u'time': 1318000000.0, u'schemas': {u'BookSchema': {
+        ...     u'validate': {u'calls': 10, u'failures': 2},
+        ...     u'from_json': {u'calls': 10, u'failures': 0},
+        ...     u'failures': {u'info.year': {u'type': 2}},
+        ...     u'histograms': {u'validate': {u'keys': {u'count': 10,
+        ...         u'total': 120, u'max': 14, u'buckets': {u'16': 10}}, ...}}}}}
+
+        Histogram buckets are keyed by their upper bound.
+        """
+        with self._lock:
+            threads = list(self._threads)
+        schemas = {}
+
+        def schema_result(name):
+            try:
+                return schemas[name]
+            except KeyError:
+                schemas[name] = result = {u'failures': {}, u'histograms': {}}
+                for operation in (u'validate', u'from_json'):
+                    result[operation] = {u'calls': 0, u'failures': 0}
+                return result
+
+        for metrics in threads:
+            # Copies of dictionaries are made atomically, so they can be
+            # read while other threads record metrics
+            for (name, operation), (calls, failures) in metrics.calls.copy().iteritems():
+                counters = schema_result(name)[operation]
+                counters[u'calls'] += calls
+                counters[u'failures'] += failures
+            for (name, path, constraint), count in metrics.failures.copy().iteritems():
+                failures = schema_result(name)[u'failures'].setdefault(path, {})
+                failures[constraint] = failures.get(constraint, 0) + count
+            for (name, operation, histogram_name), histogram in metrics.histograms.copy().iteritems():
+                histograms = schema_result(name)[u'histograms'].setdefault(operation, {})
+                result = histograms.setdefault(histogram_name, {
+                    u'count': 0, u'total': 0, u'max': 0, u'buckets': {}})
+                histogram.merge_into(result)
+
+        for result in schemas.itervalues():
+            for histograms in result[u'histograms'].itervalues():
+                for histogram in histograms.itervalues():
+                    histogram[u'buckets'] = dict((unicode(bucket), count) for bucket, count
+                                                 in histogram[u'buckets'].iteritems())
+        return {u'time': time.time(), u'schemas': schemas}
+
+    def flush(self):
+        """ Write a snapshot to all sinks.
+
+        :return: The snapshot.
+        """
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+        return snapshot
+
+    def reset(self):
+        """ Discard all recorded metrics.
+        """
+        with self._lock:
+            self._threads = []
+        self._local = threading.local()
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Profiling of schema validation per field and per constraint.
+
+>>> with ValidationProfiler(schema) as profiler:
+...     schema.validate(doc)
+>>> profiler.stats()[u'info.author.id'][u'time']
+>>> open(u'validation.folded', u'w').write(profiler.collapsed())
+
+While the profiler is active, the `validate()` and `find_invalid()` methods
+of each field of the schema are replaced by instrumented versions set on the
+field instances; they are deleted again when the profiler is stopped. The
+field classes are never changed, so once all profilers are stopped,
+validation runs exactly the same code as before.
+
+Equal fields are shared between schemas, so a field may be instrumented by
+several profilers, and other schemas using the field call the instrumented
+version, too, while a profiler is active. Each call is counted only by the
+profiler whose schema is being validated in the calling thread; validations
+of other schemas and in other threads are passed on to the original method
+and not counted.
+
+Fields are identified by their dotted path in the schema. Element fields of
+`ListField`s have the path of the list with `[]` appended, or `[0]`, `[1]`
+etc. if the list has several element fields. Values of type keys like
+`unicode` have `*` as their last path component.
+"""
+
+from dictlib.exceptions import ValidationError
+from dictlib.schema import Field, TypeField, AbstractNumericField, \
+    UnicodeField, EnumField, ListField, DictField, Schema
+import threading
+import timeit
+import types
+
+
+__all__ = (u'ValidationProfiler',)
+
+
+_timer = timeit.default_timer
+
+
+# The constraints checked by the `validate()` methods of the field classes,
+# as `(name, is_active(field), check(field, value))` tuples in the order
+# they are checked. A value of `None` is only checked by `none`.
+_NONE = (u'none', None, lambda f, v: v is not None or f.can_be_none)
+_TYPE = (u'type', None, lambda f, v: isinstance(v, f.type))
+_UNICODE_LENGTH_CHECKS = [
+    (u'min_len', lambda f: f.min_len is not None, lambda f, v: len(v) >= f.min_len),
+    (u'max_len', lambda f: f.max_len is not None, lambda f, v: len(v) <= f.max_len),
+    (u'prefixes', lambda f: f.prefixes is not None, lambda f, v: v.startswith(f.prefixes)),
+    (u'required_chars', lambda f: bool(f.required_chars),
+     lambda f, v: all(char in v for char in f.required_chars)),
+    (u'match', lambda f: f._pattern is not None,
+     lambda f, v: f._pattern.match(v) is not None),
+]
+
+def _is_enum_value(field, value):
+    try:
+        return value in field._value_set
+    except TypeError:
+        return False
+
+_CONSTRAINTS = {
+    Field: [_NONE],
+    TypeField: [_NONE, _TYPE],
+    AbstractNumericField: [
+        _NONE, _TYPE,
+        (u'min', lambda f: f.min is not None, lambda f, v: v >= f.min),
+        (u'max', lambda f: f.max is not None, lambda f, v: v <= f.max),
+    ],
+    UnicodeField: [_NONE, _TYPE,
+                   (u'length', lambda f: f.length is not None,
+                    lambda f, v: len(v) == f.length)] +
+        # A fixed length replaces all other constraints
+        [(name, lambda f, is_active=is_active: f.length is None and is_active(f), check)
+         for name, is_active, check in _UNICODE_LENGTH_CHECKS],
+    EnumField: [_NONE, (u'values', None, lambda f, v: _is_enum_value(f, v))],
+    ListField: [
+        _NONE, _TYPE,
+        (u'min_len', lambda f: f.min_len is not None, lambda f, v: len(v) >= f.min_len),
+        (u'max_len', lambda f: f.max_len is not None, lambda f, v: len(v) <= f.max_len),
+    ],
+    DictField: [_NONE, _TYPE],
+}
+_CONSTRAINTS[Schema] = _CONSTRAINTS[DictField]
+
+
+def _get_constraints(field):
+    """ Return the constraints of `field` and whether they fully describe its
+    `validate()` method, i. e. whether it is a method of a known class.
+    """
+    for cls in type(field).__mro__:
+        if u'validate' in cls.__dict__:
+            if cls in _CONSTRAINTS:
+                return [(name, check) for name, is_active, check in _CONSTRAINTS[cls]
+                        if is_active is None or is_active(field)], True
+            break
+    for cls in type(field).__mro__:
+        if cls in _CONSTRAINTS:
+            return [(name, check) for name, is_active, check in _CONSTRAINTS[cls]
+                    if is_active is None or is_active(field)], False
+    return [], False
+
+
+def _collect_paths(field, path, parent_path, key, paths):
+    """ Map each field reachable from `field` to a dictionary of the paths it
+    has, keyed by the path of its parent field and its key in the parent, or
+    `None` for list elements. Fields are shared between schemas and equal
+    sibling fields are a single instance, so one field may have many paths.
+    """
+    field_paths = paths.setdefault(field, {})
+    if (parent_path, key) in field_paths:
+        return
+    field_paths[(parent_path, key)] = path
+    if isinstance(field, DictField):
+        for key, sub_field in field.get_schema().iteritems():
+            segment = u'*' if isinstance(key, types.TypeType) else unicode(key)
+            _collect_paths(sub_field, u'%s.%s' % (path, segment) if path else segment,
+                           path, segment, paths)
+    elif isinstance(field, ListField):
+        if len(field.fields) == 1:
+            _collect_paths(field.fields[0], path + u'[]', path, None, paths)
+        else:
+            for i, sub_field in enumerate(field.fields):
+                _collect_paths(sub_field, u'%s[%d]' % (path, i), path, None, paths)
+
+
+# Maps each instrumented field to a tuple of its original `validate()` method
+# and the list of `(profiler, validate)` tuples of the profilers which
+# instrument it
+_instrumented = {}
+
+# The profiler whose schema is being validated in the current thread, as the
+# attribute `profiler`
+_session = threading.local()
+
+
+def _instrument(field):
+    """ Return the original `validate()` method of `field` and the list of
+    `(profiler, validate)` tuples of the profilers instrumenting it. The
+    method set on the field dispatches each call to the instrumented method
+    of the profiler which is validating its schema, if any.
+    """
+    try:
+        return _instrumented[field]
+    except KeyError:
+        original, entries = field.validate, []
+        _instrumented[field] = (original, entries)
+
+        def validate(value, *args, **kwargs):
+            # Calls nested in the validation of a profiled schema in this
+            # thread belong to its profiler, other calls only to the
+            # profiler of the field
+            active = getattr(_session, u'profiler', None)
+            if active is not None:
+                for profiler, profiled_validate in entries:
+                    if profiler is active:
+                        return profiled_validate(value, *args, **kwargs)
+                return original(value, *args, **kwargs)
+            for profiler, profiled_validate in entries:
+                if profiler.schema is field:
+                    return profiled_validate(value, *args, **kwargs)
+            return original(value, *args, **kwargs)
+
+        field.validate = validate
+        if not isinstance(field, (DictField, ListField)):
+            # Validate element lists through the instrumented validate()
+            field.find_invalid = types.MethodType(Field.find_invalid.im_func, field)
+        return original, entries
+
+
+def _uninstrument(field, profiler):
+    original, entries = _instrumented[field]
+    entries[:] = [entry for entry in entries if entry[0] is not profiler]
+    if not entries:
+        del _instrumented[field]
+        del field.validate
+        if u'find_invalid' in field.__dict__:
+            del field.find_invalid
+        if not field.__dict__:
+            object.__setattr__(field, u'_has_dict', False)
+
+
+class _Frame(object):
+    __slots__ = (u'path', u'field_name', u'stack', u'child_time', u'child_error')
+
+    def __init__(self, path, field_name, stack):
+        self.path = path
+        self.field_name = field_name
+        self.stack = stack
+        self.child_time = 0.0
+        self.child_error = None
+
+
+class ValidationProfiler(object):
+    """ Collects call counts, cumulative time and failure counts of the
+    validation of each field of a schema, by dotted path and by constraint
+    (`none`, `type`, `min`, `max`, `length`, `min_len`, `max_len`,
+    `prefixes`, `required_chars`, `match`, `values`).
+
+    Failures of `ListField`s caused by an invalid element are counted for the
+    constraint `elements`, failures of `DictField`s caused by an undefined
+    or a missing key for `undefined` and `required`, respectively. Failures
+    of sub-fields count as failures of their parent fields, too, but only
+    for the constraint which actually failed. Failures of fields with their
+    own `validate()` method whose `ValidationError` names no constraint are
+    counted for the constraint `validate`.
+
+    The constraints of plain fields are checked one by one while profiling,
+    so that their time can be measured; the time of constraints of lists and
+    dictionaries is not measured. A profiler is not thread-safe.
+    """
+    def __init__(self, schema, name=None):
+        """ Constructor.
+
+        :param schema: The `DictField` or `Schema` to profile.
+        :param name: The name of the root frame in `collapsed()`. Default:
+        the name of the schema class.
+        """
+        self.schema = schema
+        self.name = name or schema.__class__.__name__
+        self.active = False
+        self.reset()
+
+    def reset(self):
+        """ Discard all collected data.
+        """
+        self._paths = {}
+        self._constraints = {}
+        self._stacks = {}
+        self._frames = []
+
+    def start(self):
+        """ Instrument the fields of the schema.
+
+        :raises RuntimeError: If the schema is being profiled already, or if
+        the `validate()` method of a field was replaced by something else.
+        """
+        if self.active:
+            return
+        paths = {}
+        _collect_paths(self.schema, u'', None, None, paths)
+        if self.schema in _instrumented:
+            raise RuntimeError(u'Schema %r is being profiled already' % self.schema)
+        for field in paths:
+            if u'validate' in field.__dict__ and field not in _instrumented:
+                raise RuntimeError(u'Field %r is instrumented already' % field)
+        for field, field_paths in paths.iteritems():
+            first_path = min(field_paths.itervalues())
+            original, entries = _instrument(field)
+            entries.append((self, self._make_validate(field, original, field_paths,
+                                                      first_path)))
+        self._fields = list(paths)
+        self.active = True
+
+    def stop(self):
+        """ Restore the original methods of the fields.
+        """
+        if not self.active:
+            return
+        for field in self._fields:
+            _uninstrument(field, self)
+        self._fields = None
+        self.active = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _make_validate(self, field, original, field_paths, first_path):
+        constraints, is_complete = _get_constraints(field)
+        is_container = isinstance(field, (DictField, ListField))
+        run_constraints = is_complete and not is_container
+        # The names of the constraints counted for each call
+        checked = [name for name, check in constraints]
+        if isinstance(field, ListField):
+            checked.append(u'elements')
+        elif isinstance(field, DictField):
+            checked.extend((u'undefined', u'required'))
+        frames = self._frames
+        path_stats, constraint_stats = self._paths, self._constraints
+        stacks = self._stacks
+
+        def stat(stats, key):
+            try:
+                return stats[key]
+            except KeyError:
+                stats[key] = result = [0, 0.0, 0]
+                return result
+
+        def classify(error, frame):
+            """ Return the name of the constraint that caused `error` or
+            `None` if it was raised by a sub-field.
+            """
+            if error is frame.child_error:
+                return None
+            return error.constraint or u'validate'
+
+        def check_constraints(value, path, args, kwargs):
+            """ Check the constraints of a plain field one by one. The
+            original method is only called to raise its error.
+            """
+            for name, check in constraints:
+                counters = stat(constraint_stats, (path, name))
+                start = _timer()
+                is_valid = check(field, value)
+                counters[1] += _timer() - start
+                counters[0] += 1
+                if not is_valid:
+                    counters[2] += 1
+                    original(value, *args, **kwargs)
+                    return
+                if value is None:
+                    return
+
+        def validate(value, *args, **kwargs):
+            parent = frames[-1] if frames else None
+            field_name = args[0] if args else kwargs.get(u'field_name')
+            if parent is None:
+                path = field_paths.get((None, None), first_path)
+                stack = (self.name,) if path == u'' else (self.name, path)
+            else:
+                # Dictionaries pass the dotted name of the key to their
+                # values, list elements get no name
+                key = None
+                if field_name:
+                    key = field_name[len(parent.field_name) + 1:] \
+                        if parent.field_name else field_name
+                path = field_paths.get((parent.path, key))
+                if path is None:
+                    path = field_paths.get((parent.path, u'*'), first_path)
+                stack = parent.stack + (path.rsplit(u'.', 1)[-1],)
+            frame = _Frame(path, field_name, stack)
+            frames.append(frame)
+            if parent is None:
+                _session.profiler = self
+            failed = False
+            start = _timer()
+            try:
+                if run_constraints:
+                    check_constraints(value, path, args, kwargs)
+                else:
+                    original(value, *args, **kwargs)
+            except ValidationError as e:
+                failed = True
+                if parent is not None:
+                    parent.child_error = e
+                if not run_constraints:
+                    name = classify(e, frame)
+                    if name is not None:
+                        stat(constraint_stats, (path, name))[2] += 1
+                raise
+            finally:
+                elapsed = _timer() - start
+                frames.pop()
+                if parent is None:
+                    _session.profiler = None
+                if parent is not None:
+                    parent.child_time += elapsed
+                counters = stat(path_stats, path)
+                counters[0] += 1
+                counters[1] += elapsed
+                if failed:
+                    counters[2] += 1
+                stacks[stack] = stacks.get(stack, 0.0) + elapsed - frame.child_time
+                if not run_constraints:
+                    for name in checked:
+                        stat(constraint_stats, (path, name))[0] += 1
+
+        return validate
+
+    def stats(self):
+        """ Return the collected data as a dictionary mapping each dotted
+        path to a dictionary with the keys `calls`, `time` (in seconds,
+        including sub-fields), `failures` and `constraints`, which maps
+        constraint names to dictionaries with the keys `calls`, `time` and
+        `failures`. The path of the schema itself is `u''`.
+        """
+        result = {}
+        for path, (calls, time, failures) in self._paths.iteritems():
+            result[path] = {u'calls': calls, u'time': time, u'failures': failures,
+                            u'constraints': {}}
+        for (path, name), (calls, time, failures) in self._constraints.iteritems():
+            path_result = result.setdefault(path, {u'calls': 0, u'time': 0.0,
+                                                   u'failures': 0, u'constraints': {}})
+            path_result[u'constraints'][name] = {u'calls': calls, u'time': time,
+                                                 u'failures': failures}
+        return result
+
+    def collapsed(self):
+        """ Return the time spent in each field, excluding sub-fields, in
+        microseconds as collapsed stacks, one `frame;frame;... time` line
+        per stack, e. g. for `flamegraph.pl`.
+        """
+        lines = []
+        for stack, time in sorted(self._stacks.iteritems()):
+            lines.append(u'%s %d\n' % (u';'.join(stack), max(0, int(round(time * 1e6)))))
+        return u''.join(lines)
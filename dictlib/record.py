@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Compact, read-only records with a fixed set of keys.
+
+Record classes store each key in a slot instead of a per-instance
+dictionary, which makes them much smaller than dicts. They are usually
+generated from a schema with `Schema.record_class()`.
+"""
+
+import collections
+
+
+__all__ = (u'Record', u'make_record_class')
+
+
+class Record(object):
+    """ The base class of record classes. Records implement the read-only
+    mapping interface; keys of unset slots (e. g. missing optional fields)
+    are not contained in the record.
+
+    `Record` is registered as a virtual subclass of `collections.Mapping`
+    instead of inheriting from it, because the abstract base classes of
+    Python 2 don't define `__slots__` and would add a `__dict__` to every
+    record.
+    """
+    __slots__ = ()
+    #: The keys of this record class, in slot order
+    _keys = ()
+    #: Maps each key to the `__get__` method of its slot, which raises
+    #: `AttributeError` if the slot is unset
+    _getters = {}
+    #: Maps each key to the `__set__` method of its slot
+    _setters = {}
+    #: Maps keys of nested records to their record class
+    _nested = {}
+
+    @classmethod
+    def from_dict(cls, doc):
+        """ Create a record from the dictionary `doc`. Nested dictionaries are
+        converted to records if there is a nested record class for their key.
+
+        :raises KeyError: If `doc` contains a key unknown to this record class.
+        """
+        record = cls.__new__(cls)
+        setters, nested = cls._setters, cls._nested
+        for key, value in doc.iteritems():
+            if key in nested and isinstance(value, collections.Mapping):
+                value = nested[key].from_dict(value)
+            setters[key](record, value)
+        return record
+
+    def to_dict(self):
+        """ Return the contents of this record as a plain (nested) dictionary.
+        """
+        doc = {}
+        for key, getter in self._getters.iteritems():
+            try:
+                value = getter(self)
+            except AttributeError:
+                continue
+            if isinstance(value, Record):
+                value = value.to_dict()
+            doc[key] = value
+        return doc
+
+    def __getitem__(self, key):
+        try:
+            return self._getters[key](self)
+        except (KeyError, AttributeError):
+            raise KeyError(key)
+
+    def __iter__(self):
+        getters = self._getters
+        for key in self._keys:
+            try:
+                getters[key](self)
+            except AttributeError:
+                continue
+            yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __contains__(self, key):
+        try:
+            self._getters[key](self)
+            return True
+        except (KeyError, AttributeError):
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __setattr__(self, key, value):
+        raise AttributeError(u'%s is read-only' % self.__class__.__name__)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_dict())
+
+collections.Mapping.register(Record)
+
+
+def make_record_class(name, keys, nested=None):
+    """ Create a `Record` subclass with one slot per key.
+
+    :param name: The name of the new class.
+    :param keys: The keys of the record.
+    :param nested: An optional dictionary mapping keys to the record classes
+    used for nested dictionaries.
+    """
+    keys = tuple(keys)
+    slots = tuple('_%d' % i for i in range(len(keys)))
+    if isinstance(name, unicode):
+        name = name.encode(u'utf-8')
+    cls = type(name, (Record,), {'__slots__': slots})
+    cls._keys = keys
+    cls._getters = {}
+    cls._setters = {}
+    for key, slot in zip(keys, slots):
+        descriptor = cls.__dict__[slot]
+        cls._getters[key] = descriptor.__get__
+        cls._setters[key] = descriptor.__set__
+    cls._nested = dict(nested or {})
+    return cls
+
@@ -19,31 +19,267 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 from dictlib.exceptions import ValidationError, SchemaFieldNotFound
+from dictlib.record import make_record_class
+from dictlib.template import Template, DefaultFactory, CopyOnWriteDict
 from dictlib.utils import update_recursive
+import array
 import collections
+import copy
 import datetime
+import functools
+import inspect
+import multiprocessing
 import re
 import time
 import types
 import uuid
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
 
 
 class SchemaDefinitionError(Exception):
     pass
 
 
+_pattern_cache = {}
+
+def compile_pattern(pattern, full_match=False):
+    """ Return `pattern` as a compiled regular expression. Patterns given as
+    strings are compiled only once and cached.
+
+    :param pattern: A string or a compiled regular expression.
+    :param full_match: Whether the returned regular expression should only
+    match whole strings when used with `match()`.
+    """
+    key = (pattern, full_match)
+    try:
+        return _pattern_cache[key]
+    except KeyError:
+        if isinstance(pattern, basestring):
+            source, flags = pattern, 0
+        else:
+            source, flags = pattern.pattern, pattern.flags
+        if full_match:
+            compiled = re.compile(ur'(?:%s)\Z' % source, flags)
+        elif isinstance(pattern, basestring):
+            compiled = re.compile(source, flags)
+        else:
+            compiled = pattern
+        _pattern_cache[key] = compiled
+        return compiled
+
+
+class InternTable(object):
+    """ A bounded table of canonical values. Equal values looked up in the
+    table are replaced by a single shared object, reducing the memory used by
+    many documents with frequently repeated values. Once the table is full,
+    new values are no longer added.
+    """
+    def __init__(self, max_size=10000, max_value_len=64):
+        """ Constructor.
+
+        :param max_size: The maximum number of values in the table.
+        :param max_value_len: Values longer than this are never interned.
+        `None` means no limit.
+        """
+        self.max_size = max_size
+        self.max_value_len = max_value_len
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def intern(self, value):
+        """ Return the canonical object equal to `value`, adding `value` to
+        the table if there is none yet and the table is not full.
+        """
+        try:
+            return self._values[value]
+        except KeyError:
+            if len(self._values) < self.max_size and \
+                    (self.max_value_len is None or len(value) <= self.max_value_len):
+                self._values[value] = value
+            return value
+
+    def clear(self):
+        self._values.clear()
+
+
+#: The `InternTable` used by fields declared with `intern=True`
+default_intern_table = InternTable()
+
+
+_pattern_type = type(re.compile(u''))
+_MUTABLE_DEFAULT_TYPES = (list, dict, set, bytearray)
+_SCALAR_TYPES = frozenset([types.NoneType, bool, int, long, float, str, unicode])
+_takes_cache_by_class = {}
+
+
+def _takes_cache(field):
+    """ Return whether `validate()` of the `DictField` or `ListField` `field`
+    takes a `cache` argument; subclasses may override it without one.
+    """
+    try:
+        return _takes_cache_by_class[field.__class__]
+    except KeyError:
+        spec = inspect.getargspec(field.__class__.validate)
+        takes_cache = u'cache' in spec.args or spec.keywords is not None
+        _takes_cache_by_class[field.__class__] = takes_cache
+        return takes_cache
+
+
+class FieldTable(object):
+    """ A table of canonical fields (hash-consing). Structurally equal fields
+    looked up in the table are replaced by a single shared instance, which
+    is frozen, i. e. its definition can no longer be changed. Fields are
+    equal if they have the same class and the same definition slots; nested
+    fields are compared by their canonical instance, so that equal
+    subschemas are shared, too. Fields with instance attributes besides their
+    slots may hold state of their own and are never shared.
+
+    Canonical fields are referenced weakly and are dropped from the table
+    together with the last schema using them.
+    """
+    def __init__(self):
+        self._fields = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self._fields)
+
+    def canonical(self, field):
+        """ Return the canonical field equal to `field`, adding `field` to
+        the table if there is none yet. `field` is frozen in either case, so
+        that changing it after it was replaced fails instead of being
+        ignored. Fields with unhashable definition values or instance
+        attributes are returned unchanged.
+        """
+        if field._frozen or (field._has_dict and field.__dict__):
+            return field
+        try:
+            key = self._key(field)
+        except TypeError:
+            return field
+        object.__setattr__(field, u'_frozen', True)
+        return self._fields.setdefault(key, field)
+
+    def _key(self, field):
+        freeze = self._freeze
+        key = [field.__class__]
+        # The class schema of a DictField is defined by its class, so
+        # instances which were not extended only differ by their other slots
+        class_schema = field._get_class_schema() if isinstance(field, DictField) else None
+        for name in field._definition_slots:
+            value = getattr(field, name, None)
+            key.append(None if value is class_schema else freeze(value))
+        return tuple(key)
+
+    def _freeze(self, value):
+        """ Return a hashable representation of `value`.
+
+        :raises TypeError: If `value` cannot be represented.
+        """
+        value_type = type(value)
+        if value_type in _SCALAR_TYPES:
+            # Keep equal values of different types, e. g. 1 and 1.0, apart
+            return (value_type, value)
+        elif isinstance(value, Field):
+            # Fields are hashed by identity
+            return self.canonical(value)
+        elif isinstance(value, (list, tuple)):
+            return (type(value), tuple(self._freeze(item) for item in value))
+        elif isinstance(value, dict):
+            return (dict, frozenset((self._freeze(key), self._freeze(item))
+                                    for key, item in value.iteritems()))
+        elif isinstance(value, (set, frozenset)):
+            return (frozenset, frozenset(self._freeze(item) for item in value))
+        elif isinstance(value, _pattern_type):
+            return (_pattern_type, value.pattern, value.flags)
+        hash(value)
+        return (value_type, value)
+
+    def clear(self):
+        self._fields.clear()
+
+
+#: The `FieldTable` sharing the fields of all schema definitions
+default_field_table = FieldTable()
+
+
+class _FieldType(type):
+    """ The metaclass of fields. Fields store their definition in slots;
+    class attributes named like a slot are the defaults of the slot. They
+    are moved to `_slot_defaults` and assigned to new instances by
+    `Field.__new__()`.
+    """
+    def __new__(mcs, name, bases, namespace):
+        slot_names, slot_defaults, definition_slots = set(), {}, set()
+        for base in reversed(bases):
+            slot_names.update(getattr(base, u'_slot_names', ()))
+            slot_defaults.update(getattr(base, u'_slot_defaults', {}))
+            definition_slots.update(getattr(base, u'_definition_slots', ()))
+        own_slots = [slot for slot in namespace.get(u'__slots__', ())
+                     if slot not in (u'__dict__', u'__weakref__')]
+        slot_names.update(own_slots)
+        # Public slots define a field, private ones hold derived data
+        definition_slots.update(slot for slot in own_slots if not slot.startswith(u'_'))
+        definition_slots.update(namespace.get(u'_definition_slots', ()))
+        for key in list(namespace):
+            if key in slot_names:
+                slot_defaults[key] = namespace.pop(key)
+        namespace[u'_slot_names'] = frozenset(slot_names)
+        namespace[u'_slot_defaults'] = slot_defaults
+        namespace[u'_definition_slots'] = tuple(sorted(definition_slots))
+        cls = type.__new__(mcs, name, bases, namespace)
+        # Assigning through the slot descriptors is faster than setattr()
+        cls._default_setters = tuple((getattr(cls, slot).__set__, value)
+                                     for slot, value in slot_defaults.iteritems())
+        return cls
+
+
 class Field(object):
     """ The base class for schema fields. Do not use this class directly, but
     only its subclasses.
+
+    The definition of a field is stored in slots. Fields added to a schema
+    are replaced by their canonical instance from `default_field_table` and
+    become immutable: assigning to their definition raises `AttributeError`.
+    Only methods may be replaced on instances, e. g. for instrumentation.
     """
+    __metaclass__ = _FieldType
+    # Instance attributes not declared as slots are stored in `__dict__`,
+    # which is only created when the first one is set
+    __slots__ = (u'optional', u'default', u'can_be_none', u'title',
+                 u'description', u'_frozen', u'_has_dict', u'__dict__',
+                 u'__weakref__')
     default = None
     can_be_none = False
     description = None
     title = None
     optional = False
+    _frozen = False
+    _has_dict = False
+    # The types of JSON-decoded values `from_json()` can convert; `None`
+    # means that the field may be able to convert values of any type
+    json_type = None
+
+    def __new__(cls, *args, **kwargs):
+        field = object.__new__(cls)
+        for setter, value in cls._default_setters:
+            setter(field, value)
+        return field
 
-    """ The base class for fields in a `DictSchema`.
-    """
     def __init__(self, optional=None, default=None, can_be_none=None,
                  title=None, description=None):
         """ Constructor.
@@ -62,6 +298,37 @@ class Field(object):
         self.title = title if title is not None else self.title
         self.description = description if description is not None else self.description
 
+    def __setattr__(self, name, value):
+        if self._frozen and (name in self._definition_slots or (
+                name not in self._slot_names and
+                not isinstance(getattr(self.__class__, name, None), types.MethodType))):
+            raise AttributeError(u'Cannot change %s of a %s shared between schemas' %
+                                 (name, self.__class__.__name__))
+        if name not in self._slot_names:
+            object.__setattr__(self, u'_has_dict', True)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = dict(self.__dict__) if self._has_dict else {}
+        for name in self._slot_names:
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        """ Return a mutable shallow copy of this field.
+        """
+        field = self.__class__.__new__(self.__class__)
+        field.__setstate__(self.__getstate__())
+        object.__setattr__(field, u'_frozen', False)
+        return field
+
     def validate(self, value, field_name=u'', partial=False):
         """ Validate the field. Subclasses should invoke their parent's
         `validate()` method subsequently.
@@ -69,7 +336,20 @@ class Field(object):
         :raises: `ValidationError` if the given `value` is invalid.
         """
         if value is None and not self.can_be_none:
-            raise ValidationError(u'Field %s: Value cannot be None' % field_name)
+            raise ValidationError(u'Field %s: Value cannot be None' % field_name,
+                                  field_name, u'none')
+
+    def find_invalid(self, values):
+        """ Return the index of the first value in `values` which is invalid
+        for this field or `None` if all values are valid. Subclasses may
+        re-implement this to validate many values at once more efficiently.
+        """
+        for i, value in enumerate(values):
+            try:
+                self.validate(value)
+            except ValidationError:
+                return i
+        return None
 
     def from_json(self, value):
         """ Process value `value` from a dictionary decoded from JSON and
@@ -98,13 +378,14 @@ class Field(object):
 class AnyField(Field):
     """ A field that can hold any value of any type.
     """
-    pass
+    __slots__ = ()
 
 
 class TypeField(Field):
     """ A `TypeField` is an abstract baseclass for schema fields that have a specific
     Python type.
     """
+    __slots__ = ()
     type = None
 
     def validate(self, value, field_name=None, partial=False):
@@ -112,20 +393,23 @@ class TypeField(Field):
         if not isinstance(value, self.type) and \
                 not (value is None and self.can_be_none):
             raise ValidationError(u'Field %s: Value %r has wrong type %s' %
-                                  (field_name, value, type(value)))
+                                  (field_name, value, type(value)), field_name, u'type')
 
 
 class FieldField(TypeField):
     """ A `FieldField` can only have a `Field` instance as a value. This is
     used to convert schema definitions themselves.
     """
+    __slots__ = ()
     type = Field
 
 
 class NoneField(TypeField):
     """ A schema field with type None, i. e. a field that can only be `None`.
     """
+    __slots__ = ()
     type = types.NoneType
+    json_type = types.NoneType
 
     def __init__(self, optional=False, default=None, title=None, description=None):
         super(NoneField, self).__init__(optional=optional, default=default,
@@ -137,6 +421,9 @@ class AbstractNumericField(TypeField):
     """ The base class for numeric schema fields. In addition to the default
     parameters, numeric fields have `min` and `max` constructor parameters.
     """
+    __slots__ = (u'min', u'max')
+    json_type = (int, long, float)
+
     def __init__(self, optional=False, default=None, can_be_none=False,
                  min=None, max=None, title=None, description=None):
         """ See `TypeField`.
@@ -157,44 +444,71 @@ class AbstractNumericField(TypeField):
             return
 
         if self.min is not None and field_value < self.min:
-            raise ValidationError(u'Field %s: Value %s is smaller than %r' % (field_name, field_value, self.min))
+            raise ValidationError(u'Field %s: Value %s is smaller than %r' % (field_name, field_value, self.min),
+                                  field_name, u'min')
         if self.max is not None and field_value > self.max:
-            raise ValidationError(u'Field %s: Value %s is larger than %r' % (field_name, field_value, self.max))
+            raise ValidationError(u'Field %s: Value %s is larger than %r' % (field_name, field_value, self.max),
+                                  field_name, u'max')
 
 
 class IntField(AbstractNumericField):
     """ A schema field for `int` values.
     """
+    __slots__ = ()
     type = int
 
 
 class LongField(AbstractNumericField):
     """ A schema field for `long` values.
     """
+    __slots__ = ()
     type = long
 
 
 class FloatField(AbstractNumericField):
     """ A schema field for `float` values.
     """
+    __slots__ = ()
     type = float
 
 
 class UnicodeField(TypeField):
     """ A schema field for `unicode` values.
+
+    Values are checked from the cheapest constraint to the most expensive
+    one: length bounds, required prefixes, required characters and finally
+    the regular expression `match`.
     """
+    __slots__ = (u'length', u'min_len', u'max_len', u'match', u'prefixes',
+                 u'required_chars', u'full_match', u'intern_table', u'_pattern')
     type = unicode
+    json_type = (str, unicode)
     length = None
     min_len = None
     max_len = None
     match = None
+    prefixes = None
+    required_chars = None
+    full_match = False
 
     def __init__(self, optional=False, default=None, can_be_none=False,
                  length=None, min_len=None, max_len=None, match=None,
-                 title=None, description=None):
+                 prefixes=None, required_chars=None, full_match=None,
+                 intern=None, title=None, description=None):
         """ See parameters, see `TypeField`.
 
         :param match: A regular expression values of this field must match.
+        Either a compiled regular expression or a string, which is compiled
+        once and cached.
+        :param prefixes: A string or a tuple of strings; values must start
+        with one of them.
+        :param required_chars: A string of characters that must all occur in
+        values.
+        :param full_match: Whether `match` must match the whole value instead
+        of only its beginning. Default: `False`.
+        :param intern: Either `True` to share equal values decoded by
+        `from_json()` through `default_intern_table` or an `InternTable` to
+        use instead. Default: `None` (do not intern values).
         """
         super(UnicodeField, self).__init__(optional=optional, default=default,
                                            can_be_none=can_be_none, title=title,
@@ -203,6 +517,36 @@ class UnicodeField(TypeField):
         self.min_len = min_len if min_len is not None else self.min_len
         self.max_len = max_len if max_len is not None else self.max_len
         self.match = match if match is not None else self.match
+        self.prefixes = prefixes if prefixes is not None else self.prefixes
+        if isinstance(self.prefixes, basestring):
+            self.prefixes = (self.prefixes,)
+        self.required_chars = required_chars if required_chars is not None \
+            else self.required_chars
+        self.full_match = full_match if full_match is not None else self.full_match
+        self._pattern = compile_pattern(self.match, self.full_match) \
+            if self.match else None
+        self.intern_table = default_intern_table if intern is True else intern
+
+    def matches_format(self, value):
+        """ Check whether the unicode string `value` satisfies the prefix,
+        character and pattern constraints of this field.
+        """
+        if self.prefixes is not None and not value.startswith(self.prefixes):
+            return False
+        if self.required_chars:
+            for char in self.required_chars:
+                if char not in value:
+                    return False
+        return self._pattern is None or self._pattern.match(value) is not None
+
+    def _format_constraint(self, value):
+        """ Return the name of the format constraint `value` violates.
+        """
+        if self.prefixes is not None and not value.startswith(self.prefixes):
+            return u'prefixes'
+        if self.required_chars and any(char not in value for char in self.required_chars):
+            return u'required_chars'
+        return u'match'
 
     def validate(self, value, field_name=None, partial=False):
         super(UnicodeField, self).validate(value, field_name, partial)
@@ -211,23 +555,47 @@ class UnicodeField(TypeField):
 
         if self.length is not None and len(value) != self.length:
             raise ValidationError(u'Field %s: Value %s should have length %d' %
-                                  (field_name, value, self.length))
+                                  (field_name, value, self.length), field_name, u'length')
         else:
             if self.min_len is not None and len(value) < self.min_len:
                 raise ValidationError(u'Field %s: Value %s is shorter than min length %d' %
-                                      (field_name, value, self.min_len))
+                                      (field_name, value, self.min_len), field_name, u'min_len')
             if self.max_len is not None and len(value) > self.max_len:
                 raise ValidationError(u'Field %s: Value %s is longer than max length %d' %
-                                      (field_name, value, self.max_len))
-            if self.match and not self.match.match(value):
+                                      (field_name, value, self.max_len), field_name, u'max_len')
+            if not self.matches_format(value):
                 raise ValidationError(u'Field %s: Value %s has wrong format' %
-                                      (field_name, value))
+                                      (field_name, value), field_name,
+                                      self._format_constraint(value))
+
+    def find_invalid(self, values):
+        # The checks below are those of UnicodeField.validate() only
+        if type(self).validate.im_func is not UnicodeField.validate.im_func:
+            return super(UnicodeField, self).find_invalid(values)
+        length, min_len, max_len = self.length, self.min_len, self.max_len
+        value_type, can_be_none = self.type, self.can_be_none
+        matches_format = self.matches_format
+        for i, value in enumerate(values):
+            if value is None:
+                if can_be_none:
+                    continue
+                return i
+            if not isinstance(value, value_type):
+                return i
+            value_len = len(value)
+            if (length is not None and value_len != length) or \
+                    (min_len is not None and value_len < min_len) or \
+                    (max_len is not None and value_len > max_len) or \
+                    not matches_format(value):
+                return i
+        return None
 
     def from_json(self, v):
         if type(v) is str:
-            return v.decode(u'utf-8')
-        else:
-            return v
+            v = v.decode(u'utf-8')
+        if self.intern_table is not None and type(v) is unicode:
+            return self.intern_table.intern(v)
+        return v
 
     def to_json(self, v):
         if type(v) is unicode:
@@ -236,10 +604,118 @@ class UnicodeField(TypeField):
             return v
 
 
+class EnumField(Field):
+    """ A field whose values are restricted to a given set of values.
+
+    Membership is checked against a `frozenset`. Decoded values are replaced
+    by the equal object from `values`, so that each distinct value exists
+    only once in memory. Optionally, values are JSON-encoded as their index
+    in `values`.
+    """
+    __slots__ = (u'values', u'encode_as_int', u'_value_set', u'_canonical_values',
+                 u'_codes', u'_array_typecode')
+
+    def __init__(self, values, encode_as_int=False, optional=False,
+                 default=None, can_be_none=False, title=None,
+                 description=None):
+        """ See parameters, see `Field`.
+
+        :param values: A sequence of the allowed (hashable) values.
+        :param encode_as_int: Whether to JSON-encode values as their index in
+        `values` instead of the values themselves. Default: `False`.
+        """
+        super(EnumField, self).__init__(optional=optional, default=default,
+                                        can_be_none=can_be_none, title=title,
+                                        description=description)
+        self.values = tuple(values)
+        self.encode_as_int = encode_as_int
+        self._value_set = frozenset(self.values)
+        self._canonical_values = dict((value, value) for value in self.values)
+        self._codes = dict((value, code) for code, value in enumerate(self.values))
+        if encode_as_int:
+            self.json_type = (int, long)
+        # array.array() only accepts byte string type codes; 'I' is the
+        # 4 byte type code, 'l' and 'L' differ in size between platforms
+        self._array_typecode = 'B' if len(self.values) <= 0xff else \
+            'H' if len(self.values) <= 0xffff else 'I'
+
+    def validate(self, value, field_name=None, partial=False):
+        super(EnumField, self).validate(value, field_name, partial)
+        if value is None and self.can_be_none:
+            return
+
+        try:
+            is_valid = value in self._value_set
+        except TypeError:
+            is_valid = False
+        if not is_valid:
+            raise ValidationError(u'Field %s: Value %r is not one of the allowed values' %
+                                  (field_name, value), field_name, u'values')
+
+    def find_invalid(self, values):
+        # The checks below are those of EnumField.validate() only
+        if type(self).validate.im_func is not EnumField.validate.im_func:
+            return super(EnumField, self).find_invalid(values)
+        value_set, can_be_none = self._value_set, self.can_be_none
+        for i, value in enumerate(values):
+            try:
+                if value in value_set or (value is None and can_be_none):
+                    continue
+            except TypeError:
+                pass
+            return i
+        return None
+
+    def from_json(self, v):
+        if v is None:
+            return v
+        if self.encode_as_int:
+            if type(v) not in (int, long) or not 0 <= v < len(self.values):
+                raise ValidationError(u'Value %r is not the code of an allowed value' % (v,),
+                                      None, u'values')
+            return self.values[v]
+        try:
+            return self._canonical_values[v]
+        except KeyError:
+            if type(v) is str:
+                v = v.decode(u'utf-8')
+                return self._canonical_values.get(v, v)
+            return v
+
+    def to_json(self, v):
+        if v is None:
+            return v
+        if self.encode_as_int:
+            try:
+                return self._codes[v]
+            except (KeyError, TypeError):
+                raise ValidationError(u'Value %r is not one of the allowed values' % (v,),
+                                      None, u'values')
+        if type(v) is unicode:
+            return v.encode(u'utf-8')
+        return v
+
+    def encode_many(self, values):
+        """ Encode a sequence of values as a compact `array.array` of their
+        indexes in `values`.
+        """
+        codes = self._codes
+        return array.array(self._array_typecode, [codes[value] for value in values])
+
+    def decode_many(self, codes):
+        """ Decode a sequence of indexes, e. g. as returned by `encode_many()`,
+        to a list of values.
+        """
+        values = self.values
+        return [values[code] for code in codes]
+
+
 class UuidField(TypeField):
     """ A field that matches UUID string representations.
     """
+    __slots__ = ()
     type = uuid.UUID
+    json_type = (str, unicode)
 
     def to_json(self, v):
         return str(v)
@@ -251,13 +727,19 @@ class UuidField(TypeField):
 class EmailField(UnicodeField):
     """ A field that matches e-mail addresses of the form `user@domain.tld`.
     """
+    __slots__ = ()
     match = re.compile(ur'.+@.+')
+    required_chars = u'@'
 
 
 class UrlField(UnicodeField):
     """ A field that matches HTTP(S) URLs.
     """
-    match = re.compile(ur'https?://.+(:\d+)?(/(.+))?')
+    __slots__ = ()
+    # Equivalent to matching ur'https?://.+(:\d+)?(/(.+))?', but in
+    # constant time
+    match = re.compile(ur'https?://.')
+    prefixes = (u'http://', u'https://')
 
 
 class BaseDatetimeField(TypeField):
@@ -265,6 +747,9 @@ class BaseDatetimeField(TypeField):
 
     Values are JSON-encoded to unicode values in ISO date/time format.
     """
+    __slots__ = ()
+    json_type = (str, unicode)
+
     def from_json(self, v):
         timetuple = time.strptime(v, self.dt_format)
         return self.type(*timetuple[self.struct_time_index[0]:self.struct_time_index[1]])
@@ -277,6 +762,7 @@ class DatetimeField(BaseDatetimeField):
     """ A schema field for date/time values. JSON datetimes must be strings in
     the format *YYYY-MM-DDThh-mm-ssZ*.
     """
+    __slots__ = ()
     type = datetime.datetime
     dt_format = u'%Y-%m-%dT%H:%M:%SZ'
     struct_time_index = (0, 6)
@@ -286,6 +772,7 @@ class DateField(BaseDatetimeField):
     """ A schema field for date/time values. JSON datetimes must be strings in
     the format *YYYY-MM-DD*.
     """
+    __slots__ = ()
     type = datetime.date
     dt_format = u'%Y-%m-%d'
     struct_time_index = (0, 3)
@@ -295,6 +782,7 @@ class TimeField(BaseDatetimeField):
     """ A schema field for date/time values. JSON datetimes must be strings in
     the format *hh-mm-ss*.
     """
+    __slots__ = ()
     type = datetime.time
     dt_format = u'%H:%M:%S'
     struct_time_index = (3, 6)
@@ -302,11 +790,23 @@ class TimeField(BaseDatetimeField):
 
 class ListField(TypeField):
     """ A schema field for lists.
+
+    Each list element is dispatched by its exact type to the element fields
+    that can accept it. The dispatch tables are filled on first sight of a
+    type, so only elements with several candidate fields need to be tried
+    one after another.
     """
+    __slots__ = (u'fields', u'min_len', u'max_len', u'storage', u'typecode',
+                 u'_fields_by_type', u'_json_fields_by_type')
     type = list
+    json_type = list
+    typecode = None
+    #: Maps numeric element field classes to `array.array` type codes
+    array_typecodes = {IntField: 'l', FloatField: 'd'}
 
     def __init__(self, fields=None, optional=False, default=None, min_len=0,
-                 max_len=None, can_be_none=False, title=None, description=None):
+                 max_len=None, can_be_none=False, storage=None, title=None,
+                 description=None):
         """ Constructor.
 
         :param fields: A list of possible fields for the elements of the list.
@@ -317,6 +817,12 @@ class ListField(TypeField):
         Default: `None`.
         :param can_be_none: Whether the value of the field may be `None` instead
         of a list.
+        :param storage: `'array'` or `'numpy'` to decode lists with a single
+        `IntField` or `FloatField` element field into an `array.array` or a
+        NumPy array by `from_json()`. Such values are validated and encoded
+        as a whole. Default: `None` (decode into lists).
+        :raises SchemaDefinitionError: If `storage` is given, but cannot be
+        used with the element fields.
         """
         super(ListField, self).__init__(optional=optional, default=default or [],
                                         can_be_none=can_be_none)
@@ -324,57 +830,246 @@ class ListField(TypeField):
             fields = [AnyField()]
         elif not isinstance(fields, collections.Sequence):
             fields = [fields]
-        self.fields = fields
+        # Element fields may be given as plain dict schema definitions
+        self.fields = [default_field_table.canonical(
+                           DictField(field) if isinstance(field, dict) else field)
+                       for field in fields]
         self.min_len = min_len
         self.max_len = max_len
+        self._fields_by_type = {}
+        self._json_fields_by_type = {}
+
+        self.storage = storage
+        if storage is not None:
+            if len(self.fields) != 1 or \
+                    self.fields[0].__class__ not in self.array_typecodes:
+                raise SchemaDefinitionError(u'List storage %s requires a single '
+                                            u'IntField or FloatField' % storage)
+            self.typecode = self.array_typecodes[self.fields[0].__class__]
+            if storage == u'array':
+                self.type = (list, array.array)
+            elif storage == u'numpy':
+                if numpy is None:
+                    raise SchemaDefinitionError(u'List storage numpy requires NumPy')
+                self.type = (list, numpy.ndarray)
+            else:
+                raise SchemaDefinitionError(u'Unknown list storage %s' % storage)
+
+    def __setattr__(self, name, value):
+        super(ListField, self).__setattr__(name, value)
+        # The dispatch tables are derived from the element fields
+        if name == u'fields':
+            object.__setattr__(self, u'_fields_by_type', {})
+            object.__setattr__(self, u'_json_fields_by_type', {})
+
+    def get_fields_for_type(self, value_type):
+        """ Return the element fields whose `validate()` and `to_json()`
+        methods can accept values of type `value_type`, in declaration order.
+        """
+        try:
+            return self._fields_by_type[value_type]
+        except KeyError:
+            if value_type is types.NoneType:
+                fields = tuple(field for field in self.fields if field.can_be_none)
+            else:
+                fields = tuple(field for field in self.fields
+                               if getattr(field, u'type', None) is None or
+                               issubclass(value_type, field.type))
+            self._fields_by_type[value_type] = fields
+            return fields
+
+    def get_json_fields_for_type(self, value_type):
+        """ Return the element fields whose `from_json()` method can convert
+        JSON-decoded values of type `value_type`, in declaration order.
+        """
+        try:
+            return self._json_fields_by_type[value_type]
+        except KeyError:
+            fields = tuple(field for field in self.fields
+                           if field.json_type is None or
+                           issubclass(value_type, field.json_type) or
+                           (value_type is types.NoneType and field.can_be_none))
+            self._json_fields_by_type[value_type] = fields
+            return fields
 
     def from_json(self, v):
         assert isinstance(v, collections.Sequence)
-        for i, value in enumerate(v[:]):
-            # The first type that can handle this value wins
-            for field in self.fields:
-                try:
-                    v[i] = field.from_json(value)
-                    break
-                except:
-                    pass
-        return v
+        if self.storage == u'array':
+            return array.array(self.typecode, v)
+        elif self.storage == u'numpy':
+            return numpy.array(v, dtype=self.typecode)
+        return [self.element_from_json(value) for value in v]
+
+    def element_from_json(self, value):
+        """ Convert a single JSON-decoded list element. The first element
+        field that can handle the value wins; if there is none, the value is
+        returned unchanged.
+        """
+        for field in self.get_json_fields_for_type(type(value)):
+            try:
+                return field.from_json(value)
+            except Exception:
+                pass
+        return value
 
     def to_json(self, v):
+        if self.storage is not None and not isinstance(v, list):
+            return v.tolist()
         assert isinstance(v, collections.Sequence)
-        for i, value in enumerate(v[:]):
-            for field in self.fields:
-                if isinstance(value, field.type):
-                    v[i] = field.to_json(value)
+        result = []
+        for value in v:
+            fields = self.get_fields_for_type(type(value))
+            result.append(fields[0].to_json(value) if fields else value)
+        return result
+
+    def validate(self, field_value, field_name=None, partial=False, cache=None):
+        """ See `Field.validate`.
+
+        :param cache: An optional `ValidationCache` used to skip lists and
+        element dictionaries that have been validated before.
+        """
+        self._validate_length(field_value, field_name)
+
+        if self.storage is not None and not isinstance(field_value, list):
+            self._validate_array(field_value, field_name)
+            return
+
+        if cache is not None:
+            cache = cache.session()
+            cache_key = cache.make_key(self, field_value, partial)
+            if cache.contains(cache_key):
+                return
+
+        i = self._find_invalid_element(field_value, cache)
+        if i is not None:
+            raise self._element_error(field_name, i, field_value[i])
+
+        if cache is not None:
+            cache.add(cache_key)
+
+    def _find_invalid_element(self, field_value, cache=None):
+        """ Return the index of the first element of `field_value` which
+        matches none of the element fields, or `None`.
+        """
+        # Validate all items at once if there is only one element field
+        if cache is None and len(self.fields) == 1:
+            return self.fields[0].find_invalid(field_value)
+
+        # Check type of each list item
+        fields_by_type = self._fields_by_type
+        for i, value in enumerate(field_value):
+            try:
+                fields = fields_by_type[type(value)]
+            except KeyError:
+                fields = self.get_fields_for_type(type(value))
+
+            is_valid = False
+            for field in fields:
+                # The element's own error message is discarded, so there is
+                # no need to build its field name
+                try:
+                    if cache is not None and isinstance(field, (DictField, ListField)) and \
+                            _takes_cache(field):
+                        field.validate(value, cache=cache)
+                    else:
+                        field.validate(value)
+                    is_valid = True
                     break
-        return v
+                except ValidationError:
+                    pass
 
-    def validate(self, field_value, field_name=None, partial=False):
+            if not is_valid:
+                return i
+        return None
+
+    def _element_error(self, field_name, i, value):
+        return ValidationError(u'Field %s[%d]: field_value %r has none of the listed fields' %
+                               (field_name, i, value), field_name, u'elements')
+
+    def _validate_length(self, field_value, field_name):
         super(ListField, self).validate(field_value, field_name)
 
         # Validate list length
         if self.min_len is not None and len(field_value) < self.min_len:
             raise ValidationError(u'Field %s: List has too few elements (%d)' %
-                                  (field_name, len(field_value)))
+                                  (field_name, len(field_value)), field_name, u'min_len')
         if self.max_len is not None and len(field_value) > self.max_len:
             raise ValidationError(u'Field %s: List has too many elements (%d)'
-                                  % (field_name, len(field_value)))
+                                  % (field_name, len(field_value)), field_name, u'max_len')
+
+    def _iter_validate(self, field_value, field_name, partial, work):
+        """ Validate like `validate()`, but yield whenever the work budget
+        `work` is used up. See `DictField.iter_validate`.
+        """
+        if not isinstance(field_value, list) or len(field_value) <= work[0]:
+            self.validate(field_value, field_name, partial)
+            work[0] -= len(field_value) if isinstance(field_value, list) else 1
+            if work[0] <= 0:
+                work[0] = work[1]
+                yield
+            return
+
+        self._validate_length(field_value, field_name)
+        if len(self.fields) == 1 and not isinstance(self.fields[0], (DictField, ListField)):
+            field = self.fields[0]
+            for start in xrange(0, len(field_value), work[1]):
+                i = field.find_invalid(field_value[start:start + work[1]])
+                if i is not None:
+                    raise self._element_error(field_name, start + i, field_value[start + i])
+                work[0] = work[1]
+                yield
+            return
 
-        # Check type of each list item
         for i, value in enumerate(field_value):
-            is_valid = False
-            for field in self.fields:
-                #if hasattr(field, u'type') and isinstance(value, field.type):
+            fields = self.get_fields_for_type(type(value))
+            if len(fields) == 1 and isinstance(fields[0], (DictField, ListField)):
+                # Nested containers are validated incrementally, too
                 try:
-                    field.validate(value, field_name=u'%s[%d]' % (field_name, i))
+                    for _ in fields[0]._iter_validate(value, None, False, work):
+                        yield
                     is_valid = True
-                    break
                 except ValidationError:
-                    pass
-
+                    is_valid = False
+            else:
+                is_valid = False
+                for field in fields:
+                    try:
+                        field.validate(value)
+                        is_valid = True
+                        break
+                    except ValidationError:
+                        pass
             if not is_valid:
-                raise ValidationError(u'Field %s[%d]: field_value %r has none of the listed fields' %
-                                      (field_name, i, value))
+                raise self._element_error(field_name, i, value)
+            work[0] -= 1
+            if work[0] <= 0:
+                work[0] = work[1]
+                yield
+
+    def _validate_array(self, field_value, field_name):
+        # The element type is guaranteed by the array type, so only the
+        # bounds of the element field need to be checked
+        if isinstance(field_value, array.array):
+            is_valid_type = field_value.typecode == self.typecode
+        else:
+            is_valid_type = field_value.ndim == 1 and \
+                field_value.dtype.kind == numpy.dtype(self.typecode).kind
+        if not is_valid_type:
+            raise ValidationError(u'Field %s: Value %r has wrong type %s' %
+                                  (field_name, field_value, type(field_value)),
+                                  field_name, u'type')
+
+        if not len(field_value):
+            return
+        field = self.fields[0]
+        if isinstance(field_value, array.array):
+            array_min, array_max = min, max
+        else:
+            array_min, array_max = numpy.min, numpy.max
+        if (field.min is not None and array_min(field_value) < field.min) or \
+                (field.max is not None and array_max(field_value) > field.max):
+            i = field.find_invalid(field_value)
+            raise self._element_error(field_name, i, field_value[i])
 
 
 class DictField(TypeField):
@@ -382,26 +1077,46 @@ class DictField(TypeField):
     insert direct `DictField` instances to a schema, or you could subclass
     `DictField` and re-use it in several schemas.
     """
-    type = collections.MutableMapping
+    __slots__ = (u'_schema', u'_json_keys')
+    _definition_slots = (u'_schema',)
+    # Read-only mappings like records are accepted, too
+    type = collections.Mapping
+    json_type = collections.Mapping
     _schema = {}
 
     def __init__(self, schema=None, **kwargs):
         super(DictField, self).__init__(**kwargs)
 
-        # Update schema definition from base classes, enabling sub-classing
-        # of schemas
-        self._schema = {}
-        for cls in reversed(filter(lambda cls: hasattr(cls, u'schema'),
-                                   self.__class__.__mro__)):
-            if not isinstance(cls.schema, dict):
-                raise SchemaDefinitionError(u'schema attribute in %s '
-                                            u'is not a dict, but should be' %
-                                            cls.__name__)
-            self.extend(cls.schema)
+        # Start from the merged schema of all base classes, which is built
+        # only once per class, enabling cheap sub-classing of schemas. It is
+        # shared until the schema is extended.
+        self._schema = self._get_class_schema()
+        self._json_keys = None
 
         if schema:
             self.extend(schema)
 
+    @classmethod
+    def _get_class_schema(cls):
+        """ Return the merged schema definition of all `schema` attributes in
+        the MRO of `cls`. The result is cached on the class and must not be
+        modified.
+        """
+        if u'_class_schema' not in cls.__dict__:
+            base_schemas = []
+            for base in reversed(cls.__mro__):
+                if u'schema' not in base.__dict__:
+                    continue
+                if not isinstance(base.schema, dict):
+                    raise SchemaDefinitionError(u'schema attribute in %s '
+                                                u'is not a dict, but should be' %
+                                                base.__name__)
+                base_schemas.append(base.schema)
+            class_schema = {}
+            _merge_schemas(class_schema, base_schemas)
+            cls._class_schema = class_schema
+        return cls._class_schema
+
     def extend(self, other_schema):
         """ Extend (overwrite) the current schema with fields from another
         schema.
@@ -409,45 +1124,59 @@ class DictField(TypeField):
         :param other_schema: Either a `DictField` instance or a dict schema
         definition
         :raises SchemaDefinitionError: If there is an error in the schema
-        definition
+        definition or if this field is shared between schemas
         """
-        if isinstance(other_schema, Schema):
-            other_schema = other_schema.schema
-        for key, field in other_schema.iteritems():
-            if not isinstance(field, (Field, dict)):
-                raise SchemaDefinitionError(u'Schema attribute %s is not a Field' %
-                                            key)
-            # Recursively
-            if isinstance(field, (DictField, dict)) and \
-                    key in self._schema and \
-                    isinstance(self._schema[key], DictField):
-                self._schema[key].extend(field._schema)
-            else:
-                self._schema[key] = field
-
-        self._schema = self._mangle_schema(self._schema)
-
-    def _mangle_schema(self, schema):
-        # Take care that _mangle_schema(_mangle_schema(schema)) == _mangle_schema(schema)
-        # for all values of schema
-        # Convert all dictionaries in the schema definition by DictFields
-        mangled_schema = {}
-        if isinstance(schema, DictField):
-            schema = schema._schema
-        for key, value in schema.iteritems():
-            if isinstance(value, dict):
-                mangled_subschema = self._mangle_schema(value)
-                mangled_schema[key] = DictField(mangled_subschema)
-            else:
-                mangled_schema[key] = value
-        return mangled_schema
+        self._extend_all([other_schema])
 
-    def validate(self, field_value, field_name=None, partial=False):
+    def _extend_all(self, other_schemas):
+        """ Extend the schema with each of `other_schemas` in turn, like
+        `extend()`, but extend each nested `DictField` only once.
+        """
+        if self._frozen:
+            raise SchemaDefinitionError(u'Cannot extend a %s shared between schemas' %
+                                        self.__class__.__name__)
+        if self._schema is self._get_class_schema():
+            self._schema = dict(self._schema)
+        _merge_schemas(self._schema, [other_schema._schema
+                                      if isinstance(other_schema, DictField)
+                                      else other_schema
+                                      for other_schema in other_schemas])
+        self._json_keys = None
+
+    def _get_json_keys(self):
+        """ Return a dictionary mapping each declared key and its UTF-8
+        encoded form to a `(key, field)` tuple, where `key` is the key object
+        from the schema definition. Decoded documents share these key
+        objects instead of holding a copy of each key.
+        """
+        if self._json_keys is None:
+            json_keys = {}
+            for key, field in self._schema.iteritems():
+                if isinstance(key, types.TypeType):
+                    continue
+                json_keys[key] = (key, field)
+                if isinstance(key, unicode):
+                    json_keys[key.encode(u'utf-8')] = (key, field)
+            self._json_keys = json_keys
+        return self._json_keys
+
+    def validate(self, field_value, field_name=None, partial=False, cache=None):
+        """ See `Field.validate`.
+
+        :param cache: An optional `ValidationCache` used to skip dictionaries
+        and lists that have been validated before.
+        """
         super(DictField, self).validate(field_value, field_name, partial)
 
         if field_value is None and self.can_be_none:
             return
 
+        if cache is not None:
+            cache = cache.session()
+            cache_key = cache.make_key(self, field_value, partial)
+            if cache.contains(cache_key):
+                return
+
         type_field_names = set()
         # For all keys in the document, check if they are defined in the schema
         for key, value in field_value.iteritems():
@@ -455,28 +1184,88 @@ class DictField(TypeField):
                                          key)
             try:
                 field = self.get_field(key)
-                field.validate(value, full_field_name, partial)
+                if cache is not None and isinstance(field, (DictField, ListField)) and \
+                        _takes_cache(field):
+                    field.validate(value, full_field_name, partial, cache=cache)
+                else:
+                    field.validate(value, full_field_name, partial)
                 if key not in self._schema:
                     type_field_names.add(key)
             except SchemaFieldNotFound:
-                raise ValidationError(u'Field \'%s\' not defined in schema' % full_field_name)
+                raise ValidationError(u'Field \'%s\' not defined in schema' % full_field_name,
+                                      full_field_name, u'undefined')
 
-        # Check if all required keys are present in the document
         if not partial:
-            for key, field in self._schema.iteritems():
-                full_field_name = u'%s%s' % (u'%s.' % field_name if field_name else u'',
-                                             key)
-                if isinstance(key, types.TypeType):
-                    if not field.optional and not any(isinstance(fn, key) for fn in type_field_names):
-                        raise ValidationError(u'At least one field with key of type %s is required' % key)
-                elif not field.optional and key not in field_value:
-                    raise ValidationError(u'Field \'%s\' is missing' % full_field_name)
+            self._validate_required(field_value, field_name, type_field_names)
+
+        if cache is not None:
+            cache.add(cache_key)
+
+    def _validate_required(self, field_value, field_name, type_field_names):
+        """ Check if all required keys are present in the document.
+        """
+        for key, field in self._schema.iteritems():
+            full_field_name = u'%s%s' % (u'%s.' % field_name if field_name else u'',
+                                         key)
+            if isinstance(key, types.TypeType):
+                if not field.optional and not any(isinstance(fn, key) for fn in type_field_names):
+                    raise ValidationError(u'At least one field with key of type %s is required' % key,
+                                          field_name, u'required')
+            elif not field.optional and key not in field_value:
+                raise ValidationError(u'Field \'%s\' is missing' % full_field_name,
+                                      full_field_name, u'required')
+
+    def iter_validate(self, field_value, field_name=None, partial=False, budget=1000):
+        """ Return a generator which validates `field_value` step by step,
+        with the same checks and error messages as `validate()`. The
+        generator yields `None` after about `budget` keys and list elements
+        have been validated, and raises `ValidationError` if `field_value` is
+        invalid.
+
+        :param budget: The amount of work done between two steps.
+        """
+        return self._iter_validate(field_value, field_name, partial, [budget, budget])
+
+    def _iter_validate(self, field_value, field_name, partial, work):
+        super(DictField, self).validate(field_value, field_name, partial)
+
+        if field_value is None and self.can_be_none:
+            return
+
+        type_field_names = set()
+        for key, value in field_value.iteritems():
+            full_field_name = u'%s%s' % (u'%s.' % field_name if field_name else u'',
+                                         key)
+            try:
+                field = self.get_field(key)
+            except SchemaFieldNotFound:
+                raise ValidationError(u'Field \'%s\' not defined in schema' % full_field_name,
+                                      full_field_name, u'undefined')
+            if isinstance(field, (DictField, ListField)):
+                for _ in field._iter_validate(value, full_field_name, partial, work):
+                    yield
+            else:
+                field.validate(value, full_field_name, partial)
+            if key not in self._schema:
+                type_field_names.add(key)
+            work[0] -= 1
+            if work[0] <= 0:
+                work[0] = work[1]
+                yield
+
+        if not partial:
+            self._validate_required(field_value, field_name, type_field_names)
 
     def from_json(self, v):
+        json_keys = self._get_json_keys()
         doc = {}
         for key, value in v.iteritems():
-            key = key.decode(u'utf-8') if isinstance(key, str) else key
-            doc[key] = self.get_field(key).from_json(value)
+            try:
+                key, field = json_keys[key]
+            except KeyError:
+                key = key.decode(u'utf-8') if isinstance(key, str) else key
+                field = self.get_field(key)
+            doc[key] = field.from_json(value)
         return doc
 
     def to_json(self, v):
@@ -498,9 +1287,333 @@ class DictField(TypeField):
             raise SchemaFieldNotFound(u'Key %s not defined in schema' % key)
 
     def get_schema(self):
-        """ Returns the mangled schema definition.
+        """ Returns a copy of the mangled schema definition. The definition
+        itself is shared by all instances of a schema class; use `extend()`
+        to change it.
         """
-        return self._schema
+        return dict(self._schema)
+
+
+def _merge_schemas(schema, other_schemas):
+    """ Merge the schema definitions `other_schemas` one after another into
+    the mangled schema definition `schema` in-place. Only the entries of
+    `other_schemas` are mangled, i. e. plain dicts are converted to
+    `DictField`s. Nested `DictField`s already in `schema` are copied before
+    being extended, so definitions shared with other schemas are never
+    modified. All fields are replaced by their canonical instance from
+    `default_field_table`.
+
+    The definitions of each key are collected first, so that a nested
+    `DictField` extended by several of `other_schemas`, e. g. by each class
+    of a deep hierarchy, is copied and canonicalized only once.
+    """
+    definitions = {}
+    for other_schema in other_schemas:
+        for key, field in other_schema.iteritems():
+            if not isinstance(field, (Field, dict)):
+                raise SchemaDefinitionError(u'Schema attribute %s is not a Field' %
+                                            key)
+            definitions.setdefault(key, []).append(field)
+
+    for key, fields in definitions.iteritems():
+        # Dictionaries extend the dictionary before them, any other field
+        # replaces it
+        base = schema.get(key)
+        extensions = []
+        for field in fields:
+            if isinstance(field, (DictField, dict)) and isinstance(base, (DictField, dict)):
+                extensions.append(field)
+            else:
+                base, extensions = field, []
+
+        if isinstance(base, dict):
+            extensions.insert(0, base)
+            base = DictField()
+        elif extensions:
+            base = copy.copy(base)
+            base._schema = dict(base._schema)
+        if extensions:
+            # Recursively
+            base._extend_all(extensions)
+        schema[key] = default_field_table.canonical(base)
+
+
+def _has_type_keys(dict_field):
+    return any(isinstance(key, types.TypeType) for key in dict_field._schema)
+
+
+def _make_template(schema):
+    """ Return a `Template` of the values `Schema.create()` creates for the
+    schema definition `schema`.
+    """
+    values = {}
+    for key, field in schema.iteritems():
+        if isinstance(key, types.TypeType) or field.optional:
+            continue
+        if isinstance(field, DictField):
+            values[key] = _make_template(field._schema)
+        elif hasattr(field.default, u'__call__'):
+            values[key] = DefaultFactory(field.default)
+        else:
+            values[key] = field.default
+    return Template(values)
+
+def _make_record_class(dict_field, name):
+    if _has_type_keys(dict_field):
+        raise SchemaDefinitionError(u'Cannot create a record class for %s '
+                                    u'which has type keys' % name)
+    nested = {}
+    for key, field in dict_field._schema.iteritems():
+        if isinstance(field, DictField) and not _has_type_keys(field):
+            nested[key] = _make_record_class(field, u'%s_%s' % (name, key))
+    return make_record_class(name, dict_field._schema.keys(), nested)
+
+
+class _LengthOnlyList(list):
+    """ An empty list pretending to have `length` elements. It stands in for
+    a sharded list during validation, so that the length of the list is
+    checked, but not its elements.
+    """
+    def __init__(self, length):
+        super(_LengthOnlyList, self).__init__()
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+
+def _split_large_lists(field, doc, field_name, min_len, found):
+    """ Return `doc` with each list of at least `min_len` elements in
+    (nested) dictionaries replaced by a `_LengthOnlyList`, copying only the
+    dictionaries on the way to such lists. Append a `(field, field_name,
+    list)` tuple for each replaced list to `found`.
+    """
+    result = None
+    for key, value in doc.iteritems():
+        try:
+            sub_field = field.get_field(key)
+        except SchemaFieldNotFound:
+            continue
+        full_field_name = u'%s.%s' % (field_name, key) if field_name else key
+        if isinstance(sub_field, ListField) and type(value) is list and \
+                len(value) >= min_len:
+            found.append((sub_field, full_field_name, value))
+            replacement = _LengthOnlyList(len(value))
+        elif isinstance(sub_field, DictField) and type(value) is dict:
+            replacement = _split_large_lists(sub_field, value, full_field_name,
+                                             min_len, found)
+            if replacement is value:
+                continue
+        else:
+            continue
+        if result is None:
+            result = dict(doc)
+        result[key] = replacement
+    return result if result is not None else doc
+
+
+def _get_path_fields(dict_field, path):
+    """ Return a tuple of the fields the dotted `path` in `dict_field` may
+    refer to, which is empty if `path` is not defined. Segments following a
+    `ListField` are element indexes; all element fields are candidates.
+    """
+    fields = (dict_field,)
+    for key in path.split(u'.') if isinstance(path, basestring) else (path,):
+        found = []
+        for field in fields:
+            if isinstance(field, ListField):
+                try:
+                    int(key)
+                except ValueError:
+                    continue
+                found.extend(field.fields)
+            elif isinstance(field, DictField):
+                try:
+                    found.append(field.get_field(key))
+                except SchemaFieldNotFound:
+                    # Dictionaries with integer keys are addressed by digits
+                    if isinstance(key, basestring) and key.isdigit():
+                        schema = field._schema
+                        for key_type in (int, long):
+                            if key_type in schema:
+                                found.append(schema[key_type])
+                                break
+        # Several element fields may lead to the same field
+        fields = tuple(field for i, field in enumerate(found) if field not in found[:i])
+        if not fields:
+            break
+    return fields
+
+
+def _make_path_tree(dict_field, paths):
+    """ Return the dotted `paths` as a tree of nested dictionaries mapping
+    path segments to subtrees, where `None` stands for a whole subtree.
+
+    :raises SchemaFieldNotFound: If a path is not defined in `dict_field`.
+    """
+    tree = {}
+    for path in paths:
+        segments = path.split(u'.')
+        fields = (dict_field,)
+        for segment in segments:
+            # List elements are addressed without an index, also those of
+            # nested lists
+            while any(isinstance(field, ListField) for field in fields):
+                fields = [element_field for field in fields for element_field in
+                          (field.fields if isinstance(field, ListField) else (field,))]
+            found = []
+            for field in fields:
+                if isinstance(field, DictField):
+                    try:
+                        found.append(field.get_field(segment))
+                    except SchemaFieldNotFound:
+                        pass
+            if not found:
+                raise SchemaFieldNotFound(u'Path %s not defined in schema' % path)
+            fields = found
+        node = tree
+        for segment in segments[:-1]:
+            if segment in node and node[segment] is None:
+                # A parent path covers the path already
+                break
+            node = node.setdefault(segment, {})
+        else:
+            node[segments[-1]] = None
+    return tree
+
+
+_NOTHING_EXCLUDED = {}
+
+def _project(value, include, exclude, in_place):
+    """ Project `value` with the path trees `include` (`None` keeps all
+    keys) and `exclude`.
+    """
+    if include is None and not exclude:
+        return value
+    if isinstance(value, collections.Mapping):
+        if in_place:
+            for key in value.keys():
+                sub_exclude = exclude.get(key, _NOTHING_EXCLUDED)
+                if sub_exclude is None or (include is not None and key not in include):
+                    del value[key]
+                    continue
+                sub_include = include[key] if include is not None else None
+                if sub_include is not None or sub_exclude:
+                    _project(value[key], sub_include, sub_exclude, True)
+            return value
+        result = {}
+        # Only the included keys are looked at
+        for key in include if include is not None else value:
+            if key not in value:
+                continue
+            sub_exclude = exclude.get(key, _NOTHING_EXCLUDED)
+            if sub_exclude is None:
+                continue
+            sub_include = include[key] if include is not None else None
+            if sub_include is not None or sub_exclude:
+                result[key] = _project(value[key], sub_include, sub_exclude, False)
+            else:
+                result[key] = value[key]
+        return result
+    if isinstance(value, list):
+        if in_place:
+            for element in value:
+                _project(element, include, exclude, True)
+            return value
+        return [_project(element, include, exclude, False) for element in value]
+    return value
+
+
+def _get_element_container_field(list_field, element):
+    """ Return the `DictField` or `ListField` element field of `list_field`
+    for the container `element` or `None`. Of several dictionary fields, the
+    one defining most keys of `element` is chosen.
+    """
+    fields = [field for field in list_field.get_fields_for_type(type(element))
+              if isinstance(field, (DictField, ListField))]
+    if len(fields) <= 1:
+        return fields[0] if fields else None
+
+    def defined_keys(field):
+        if not isinstance(field, DictField):
+            return -1
+        return sum(1 for key in element if key in field._schema or type(key) in field._schema)
+
+    return max(fields, key=defined_keys)
+
+
+def _strip_unknown(field, value, in_place):
+    """ Remove the keys not defined in `field` from `value` or a copy of it.
+    """
+    if isinstance(field, DictField) and isinstance(value, collections.Mapping):
+        if in_place:
+            for key in value.keys():
+                try:
+                    sub_field = field.get_field(key)
+                except SchemaFieldNotFound:
+                    del value[key]
+                    continue
+                _strip_unknown(sub_field, value[key], True)
+            return value
+        result = {}
+        for key, sub_value in value.iteritems():
+            try:
+                sub_field = field.get_field(key)
+            except SchemaFieldNotFound:
+                continue
+            result[key] = _strip_unknown(sub_field, sub_value, False)
+        return result
+    if isinstance(field, ListField) and isinstance(value, list):
+        result = value
+        for i, element in enumerate(value):
+            if not isinstance(element, (collections.Mapping, list)):
+                continue
+            element_field = _get_element_container_field(field, element)
+            if element_field is None:
+                continue
+            stripped = _strip_unknown(element_field, element, in_place)
+            if not in_place:
+                if result is value:
+                    result = list(value)
+                result[i] = stripped
+        return result
+    return value
+
+
+# The lists validated by a worker process, set by _init_shard_worker()
+_shard_lists = None
+
+def _init_shard_worker(lists):
+    global _shard_lists
+    _shard_lists = lists
+
+def _validate_shard(task):
+    """ Validate the elements `start` to `end` of a list in a worker process
+    and return `None` or a `(list index, element index, message)` tuple for
+    the first invalid element.
+    """
+    list_index, start, end = task
+    field, field_name, values = _shard_lists[list_index]
+    i = field._find_invalid_element(values[start:end])
+    if i is None:
+        return None
+    i += start
+    return (list_index, i, unicode(field._element_error(field_name, i, values[i])))
+
+
+def _estimate_size(doc, limit):
+    """ Return the number of keys and elements of `doc` and all nested lists
+    and dictionaries, but stop counting once `limit` is reached.
+    """
+    size = 0
+    pending = [doc]
+    while pending and size < limit:
+        value = pending.pop()
+        size += len(value)
+        children = value.itervalues() if isinstance(value, dict) else value
+        pending.extend(child for child in children
+                       if isinstance(child, (list, dict)) and child)
+    return size
 
 
 class Schema(DictField):
@@ -508,6 +1621,12 @@ class Schema(DictField):
     `schema` attribute statically or use `Schema` directly and provide a
     `schema` argument.
     """
+    __slots__ = (u'_record_classes', u'_path_fields', u'_projections', u'_template')
+    _record_classes = None
+    _path_fields = None
+    _projections = None
+    _template = None
+
     def __init__(self, schema=None, title=None, description=None):
         """
         :param schema: A schema definition. This is a dictionary with field name/
@@ -543,6 +1662,10 @@ class Schema(DictField):
                                            _subschema=field._schema)
                 elif hasattr(field.default, u'__call__'):
                     doc[key] = field.default()
+                elif isinstance(field.default, _MUTABLE_DEFAULT_TYPES):
+                    # Fields are shared between schemas, and so are their
+                    # defaults; each document gets a copy of its own
+                    doc[key] = copy.deepcopy(field.default)
                 else:
                     doc[key] = field.default
 
@@ -550,25 +1673,246 @@ class Schema(DictField):
 
         return doc
 
-    def is_valid(self, doc):
+    def create_copy_on_write(self, initial=None):
+        """ Create a document like `create()`, but as a `CopyOnWriteDict`
+        which reads the default values from a template shared by all
+        documents created by this method and stores only the values set on
+        it. Nested dictionaries are copied on first write; use
+        `materialize()` of the document to get a plain dictionary.
+
+        :initial: A dictionary of initial values which overrule the initial
+        values from the schema description. Default: empty.
+        :return: A new `CopyOnWriteDict`.
+        """
+        if self._template is None:
+            self._template = _make_template(self._schema)
+        doc = CopyOnWriteDict(self._template)
+        if initial:
+            update_recursive(doc, initial)
+        return doc
+
+    def record_class(self, name=None):
+        """ Return a compact, read-only `Record` class with one slot per key
+        of this schema. Nested `DictField`s with fixed keys become nested
+        record classes; those with type keys are stored as they are. Records
+        can be validated like dictionaries.
+
+        :param name: The name of the record class. Default: the name of the
+        schema class with `Record` appended.
+        :raises SchemaDefinitionError: If this schema has type keys.
+        """
+        name = name or u'%sRecord' % self.__class__.__name__
+        if self._record_classes is None:
+            self._record_classes = {}
+        try:
+            return self._record_classes[name]
+        except KeyError:
+            cls = self._record_classes[name] = _make_record_class(self, name)
+            return cls
+
+    def _extend_all(self, other_schemas):
+        super(Schema, self)._extend_all(other_schemas)
+        self._record_classes = None
+        self._path_fields = None
+        self._projections = None
+        self._template = None
+
+    #: The minimum length of lists to shard with `validate(workers=N)`
+    shard_min_len = 10000
+
+    #: The maximum number of dotted paths whose fields are cached by
+    #: `validate_update()`
+    path_cache_size = 10000
+
+    def validate(self, doc, field_name=None, partial=False, cache=None,
+                 workers=None):
+        """ See `DictField.validate`.
+
+        :param workers: If set, lists of at least `shard_min_len` elements
+        are split into index ranges which are validated by a pool of
+        `workers` processes. The rest of the document is validated first.
+        If several elements are invalid, the error of the one with the
+        lowest index is raised. Documents are passed to the worker processes
+        when they are started, so on platforms without `fork()` the schema
+        and the document have to be picklable.
+        """
+        if workers is None or workers < 2:
+            return super(Schema, self).validate(doc, field_name, partial, cache)
+
+        lists = []
+        stripped_doc = _split_large_lists(self, doc, field_name, self.shard_min_len, lists)
+        # The cache cannot tell the lengths of `_LengthOnlyList`s apart
+        super(Schema, self).validate(stripped_doc, field_name, partial,
+                                     cache if stripped_doc is doc else None)
+        if not lists:
+            return
+
+        tasks = []
+        for list_index, (field, list_field_name, values) in enumerate(lists):
+            shard_len = -(-len(values) // (workers * 4))
+            tasks.extend((list_index, start, min(start + shard_len, len(values)))
+                         for start in xrange(0, len(values), shard_len))
+        pool = multiprocessing.Pool(workers, initializer=_init_shard_worker,
+                                    initargs=(lists,))
+        try:
+            results = pool.map(_validate_shard, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        errors = [result for result in results if result is not None]
+        if errors:
+            list_index, i, message = min(errors)
+            raise ValidationError(message, lists[list_index][1], u'elements')
+
+    def validate_async(self, doc, partial=False, budget=1000, loop=None,
+                       executor=None, offload_size=None):
+        """ Validate `doc` without blocking the event loop `loop` for long:
+        validation is done in steps of about `budget` keys and list elements
+        (see `DictField.iter_validate`), each run as a separate callback of
+        the loop. Alternatively, documents of at least `offload_size` keys
+        and list elements, counted at all levels, are validated with
+        `validate()` in `executor`.
+
+        The returned future has the result `None` if `doc` is valid and the
+        `ValidationError` of `validate()` otherwise, e. g. in a trollius
+        coroutine:
+
+        >>> yield From(schema.validate_async(doc))
+
+        :param loop: The event loop. Default: the current asyncio event loop.
+        :param executor: The executor for `loop.run_in_executor()`. Default:
+        the default executor of `loop`.
+        :param offload_size: The size of documents to validate in `executor`.
+        Default: never offload documents.
+        :return: A future.
+        """
+        if loop is None:
+            if asyncio is None:
+                raise RuntimeError(u'validate_async() needs asyncio or trollius')
+            loop = asyncio.get_event_loop()
+
+        if offload_size is not None and _estimate_size(doc, offload_size) >= offload_size:
+            return loop.run_in_executor(executor, functools.partial(
+                self.validate, doc, partial=partial))
+
+        if hasattr(loop, u'create_future'):
+            future = loop.create_future()
+        else:
+            future = asyncio.Future(loop=loop)
+        steps = self.iter_validate(doc, partial=partial, budget=budget)
+
+        def step():
+            if future.cancelled():
+                steps.close()
+                return
+            try:
+                next(steps)
+            except StopIteration:
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                loop.call_soon(step)
+
+        loop.call_soon(step)
+        return future
+
+    def is_valid(self, doc, cache=None):
         """ Check if the `doc` dictionary is a valid schema instance.
 
         :param doc: A nested dictionary.
+        :param cache: An optional `ValidationCache`.
         :return: `True` if the `doc` is valid, `False` otherwise.
         """
         try:
-            self.validate(doc)
+            self.validate(doc, cache=cache)
             return True
         except ValidationError:
             return False
 
-    def is_partially_valid(self, doc):
+    def validate_update(self, flat_update):
+        """ Validate an update document in dot notation, e. g.
+        `{u'info.author.name': u'x', u'tags.3': u'y'}`, without applying it
+        to a document. Each value is validated against the field of its
+        path; values of `ListField` elements, given by their index, must
+        match one of the element fields.
+
+        The fields of each path are resolved once and cached.
+
+        :raises ValidationError: If a path is not defined in the schema or
+        if a value is invalid.
+        """
+        path_fields = self._path_fields
+        if path_fields is None:
+            path_fields = self._path_fields = {}
+        for path, value in flat_update.iteritems():
+            try:
+                fields = path_fields[path]
+            except KeyError:
+                fields = _get_path_fields(self, path)
+                if len(path_fields) < self.path_cache_size:
+                    path_fields[path] = fields
+            if not fields:
+                raise ValidationError(u'Field \'%s\' not defined in schema' % path,
+                                      path, u'undefined')
+            if len(fields) == 1:
+                fields[0].validate(value, path)
+                continue
+            for field in fields:
+                try:
+                    field.validate(value, path)
+                    break
+                except ValidationError:
+                    pass
+            else:
+                raise ValidationError(u'Field %s: Value %r matches none of the listed fields' %
+                                      (path, value), path, u'elements')
+
+    def project(self, doc, include=None, exclude=None, in_place=False):
+        """ Return `doc` reduced to the dotted paths in `include`, without
+        the dotted paths in `exclude`. Paths below a `ListField` apply to
+        all elements, e. g. `u'orders.sku'`. Subtrees which are neither
+        included nor contain an excluded path are not traversed.
+
+        :param include: The paths to keep, including everything below them.
+        Default: `None` (keep all keys).
+        :param exclude: The paths to remove.
+        :param in_place: Whether to remove the keys from `doc` itself instead
+        of building a copy. A copy consists of new dictionaries and lists on
+        the way to the projected values; all other values are shared with
+        `doc`.
+        :raises SchemaFieldNotFound: If a path is not defined in the schema.
+        """
+        key = (tuple(include) if include is not None else None, tuple(exclude or ()))
+        projections = self._projections
+        if projections is None:
+            projections = self._projections = {}
+        try:
+            include_tree, exclude_tree = projections[key]
+        except KeyError:
+            include_tree = _make_path_tree(self, key[0]) if include is not None else None
+            exclude_tree = _make_path_tree(self, key[1])
+            if len(projections) < self.path_cache_size:
+                projections[key] = (include_tree, exclude_tree)
+        return _project(doc, include_tree, exclude_tree, in_place)
+
+    def strip_unknown(self, doc, in_place=False):
+        """ Return `doc` without the keys not defined in the schema, in
+        nested dictionaries and lists, too.
+
+        :param in_place: Whether to remove the keys from `doc` itself instead
+        of building a copy. See `project()`.
+        """
+        return _strip_unknown(self, doc, in_place)
+
+    def is_partially_valid(self, doc, cache=None):
         """ Check if `doc` partially matches the schema. A partial match only
         checks if the fields in `doc` match the schema, but not if all required
         fields are present. This may be useful for updating documents.
         """
         try:
-            self.validate(doc, partial=True)
+            self.validate(doc, partial=True, cache=cache)
             return True
         except ValidationError:
             return False
@@ -577,4 +1921,5 @@ class Schema(DictField):
 class AnySchema(Schema):
     """ A schema that matches all kinds of documents.
     """
+    __slots__ = ()
     schema = {unicode: AnyField(optional=True)}
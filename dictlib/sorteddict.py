@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Dictionaries which keep their keys sorted by key, by value or by the
+result of a function.
+
+The order is maintained incrementally in a list of sorted sublists of
+bounded size, so inserting, deleting and updating values takes logarithmic
+time (plus moving at most a few thousand references within one sublist)
+instead of re-sorting all keys on every read:
+
+>>> scores = ValueSortedDict({u'anna': 3, u'bob': 5})
+>>> scores[u'carl'] = 4
+>>> list(scores.islice(stop=2, reverse=True))
+[u'bob', u'carl']
+"""
+
+from dictlib.mapping import BaseDictAdapter
+import bisect
+import copy
+import itertools
+
+
+__all__ = (u'SortedDict', u'ValueSortedDict', u'FunctionSortedDict')
+
+
+class _Max(object):
+    """ A value that is larger than any other value.
+    """
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return self is other
+
+    def __gt__(self, other):
+        return self is not other
+
+    def __ge__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __hash__(self):
+        return id(self)
+
+_MAX = _Max()
+
+
+class _SortedList(object):
+    """ A sorted list of items, stored as a list of sorted sublists with at
+    most `2 * load` items each. `_maxes` holds the largest item of each
+    sublist, so that the sublist of an item is found with `bisect`, and
+    `_tree` is a Fenwick tree of the sublist lengths for converting between
+    positions and sublists in logarithmic time. The tree is rebuilt lazily
+    when sublists are split or removed.
+    """
+    def __init__(self, items=(), load=1000):
+        self._load = load
+        self._lists = []
+        self._maxes = []
+        self._tree = None
+        items = sorted(items)
+        for i in xrange(0, len(items), load):
+            self._lists.append(items[i:i + load])
+            self._maxes.append(items[min(i + load, len(items)) - 1])
+        self._len = len(items)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, item):
+        lists, maxes = self._lists, self._maxes
+        if not lists:
+            lists.append([item])
+            maxes.append(item)
+            self._tree = None
+        else:
+            pos = bisect.bisect_left(maxes, item)
+            if pos == len(maxes):
+                pos -= 1
+                lists[pos].append(item)
+                maxes[pos] = item
+            else:
+                bisect.insort(lists[pos], item)
+            if len(lists[pos]) > 2 * self._load:
+                sublist = lists[pos]
+                lists.insert(pos + 1, sublist[self._load:])
+                del sublist[self._load:]
+                maxes.insert(pos, sublist[-1])
+                self._tree = None
+            else:
+                self._update_tree(pos, 1)
+        self._len += 1
+
+    def remove(self, item):
+        """ Remove `item`.
+
+        :raises ValueError: If `item` is not in the list.
+        """
+        lists, maxes = self._lists, self._maxes
+        pos = bisect.bisect_left(maxes, item)
+        if pos == len(maxes):
+            raise ValueError(u'%r not in list' % (item,))
+        sublist = lists[pos]
+        index = bisect.bisect_left(sublist, item)
+        if sublist[index] != item:
+            raise ValueError(u'%r not in list' % (item,))
+        del sublist[index]
+        if sublist:
+            maxes[pos] = sublist[-1]
+            self._update_tree(pos, -1)
+        else:
+            del lists[pos]
+            del maxes[pos]
+            self._tree = None
+        self._len -= 1
+
+    def _build_tree(self):
+        tree = [0] + [len(sublist) for sublist in self._lists]
+        for i in xrange(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+        return tree
+
+    def _update_tree(self, pos, delta):
+        tree = self._tree
+        if tree is None:
+            return
+        i = pos + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _position(self, pos, index):
+        """ Convert the index within the sublist `pos` to a position.
+        """
+        tree = self._tree or self._build_tree()
+        while pos > 0:
+            index += tree[pos]
+            pos -= pos & -pos
+        return index
+
+    def _locate(self, position):
+        """ Convert `position` to a `(sublist, index)` tuple.
+        """
+        tree = self._tree or self._build_tree()
+        pos = 0
+        bit = 1
+        while bit * 2 < len(tree):
+            bit *= 2
+        while bit:
+            i = pos + bit
+            if i < len(tree) and tree[i] <= position:
+                position -= tree[i]
+                pos = i
+            bit //= 2
+        return pos, position
+
+    def bisect_left(self, item):
+        pos = bisect.bisect_left(self._maxes, item)
+        if pos == len(self._maxes):
+            return self._len
+        return self._position(pos, bisect.bisect_left(self._lists[pos], item))
+
+    def bisect_right(self, item):
+        pos = bisect.bisect_right(self._maxes, item)
+        if pos == len(self._maxes):
+            return self._len
+        return self._position(pos, bisect.bisect_right(self._lists[pos], item))
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self._len
+        if not 0 <= position < self._len:
+            raise IndexError(u'list index out of range')
+        pos, index = self._locate(position)
+        return self._lists[pos][index]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._lists)
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(reversed(sublist) for sublist
+                                             in reversed(self._lists))
+
+    def islice(self, start, stop, reverse=False):
+        """ Iterate over the items at positions `start` to `stop`, or
+        backwards from `stop - 1` to `start`.
+        """
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        if not reverse:
+            pos, index = self._locate(start)
+            count = stop - start
+            for sublist in itertools.islice(self._lists, pos, None):
+                for item in itertools.islice(sublist, index, index + count):
+                    yield item
+                count -= len(sublist) - index
+                if count <= 0:
+                    return
+                index = 0
+        else:
+            pos, index = self._locate(stop - 1)
+            count = stop - start
+            while pos >= 0:
+                sublist = self._lists[pos]
+                for i in xrange(index, max(index - count, -1), -1):
+                    yield sublist[i]
+                count -= index + 1
+                if count <= 0:
+                    return
+                pos -= 1
+                index = len(self._lists[pos]) - 1
+
+
+class SortedDict(BaseDictAdapter):
+    """ A dictionary whose keys are always sorted. Keys are iterated in
+    sorted order; positional access, range queries and iteration over a
+    slice of the keys take logarithmic time plus the number of keys
+    returned.
+
+    The values are stored in a plain dictionary, available as the `doc`
+    attribute; it must not be changed directly. Sorted dictionaries can be
+    wrapped by `DotNotationAdapter` and `ObjectMappingAdapter`.
+    """
+    def __init__(self, doc=None):
+        """ Constructor.
+
+        :param doc: An optional mapping or iterable of `(key, value)` pairs
+        to copy into the new dictionary.
+        """
+        BaseDictAdapter.__init__(self, dict(doc or ()))
+        self.__dict__[u'_sorted'] = _SortedList(self._sort_item(key, value)
+                                                for key, value in self._doc.iteritems())
+
+    def _sort_item(self, key, value):
+        """ Return the item to sort `key` by.
+        """
+        return key
+
+    def _key(self, item):
+        """ Return the key of the sort item `item`.
+        """
+        return item
+
+    def _bounds(self, bound):
+        """ Return the lowest and highest sort item for the sort value `bound`.
+        """
+        return bound, bound
+
+    def __getitem__(self, key):
+        return self._doc[key]
+
+    def __setitem__(self, key, value):
+        doc = self._doc
+        if key in doc:
+            old_item = self._sort_item(key, doc[key])
+            new_item = self._sort_item(key, value)
+            if old_item != new_item:
+                self._sorted.remove(old_item)
+                self._sorted.add(new_item)
+        else:
+            self._sorted.add(self._sort_item(key, value))
+        doc[key] = value
+
+    def __delitem__(self, key):
+        value = self._doc.pop(key)
+        self._sorted.remove(self._sort_item(key, value))
+
+    def __contains__(self, key):
+        return key in self._doc
+
+    def __len__(self):
+        return len(self._doc)
+
+    def __iter__(self):
+        return itertools.imap(self._key, self._sorted)
+
+    def __reversed__(self):
+        return itertools.imap(self._key, reversed(self._sorted))
+
+    def keys(self):
+        return list(self)
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        doc = self._doc
+        return (doc[key] for key in self)
+
+    def iteritems(self):
+        doc = self._doc
+        return ((key, doc[key]) for key in self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def clear(self):
+        self._doc.clear()
+        self.__dict__[u'_sorted'] = _SortedList()
+
+    def copy(self):
+        new = copy.copy(self)
+        BaseDictAdapter.__init__(new, dict(self._doc))
+        new.__dict__[u'_sorted'] = _SortedList(self._sorted)
+        return new
+
+    def peekitem(self, index=-1):
+        """ Return the `(key, value)` tuple at position `index`.
+
+        :raises IndexError: If `index` is out of range.
+        """
+        key = self._key(self._sorted[index])
+        return key, self._doc[key]
+
+    def index(self, key):
+        """ Return the position of `key`.
+
+        :raises KeyError: If `key` is not in the dictionary.
+        """
+        item = self._sort_item(key, self._doc[key])
+        return self._sorted.bisect_left(item)
+
+    def bisect_left(self, bound):
+        """ Return the position of the first key whose sort value is not
+        smaller than `bound`.
+        """
+        return self._sorted.bisect_left(self._bounds(bound)[0])
+
+    def bisect_right(self, bound):
+        """ Return the position of the first key whose sort value is larger
+        than `bound`.
+        """
+        return self._sorted.bisect_right(self._bounds(bound)[1])
+
+    def islice(self, start=None, stop=None, reverse=False):
+        """ Iterate over the keys at positions `start` to `stop`, like
+        `itertools.islice()` on the sorted keys.
+
+        :param reverse: Whether to iterate in descending order. Positions are
+        counted in the order of iteration, so `islice(stop=k, reverse=True)`
+        yields the `k` largest keys (or keys with the largest values).
+        """
+        length = len(self._sorted)
+        start, stop, step = slice(start, stop).indices(length)
+        if reverse:
+            start, stop = length - stop, length - start
+        return itertools.imap(self._key, self._sorted.islice(start, stop, reverse))
+
+    def irange(self, min=None, max=None, inclusive=(True, True), reverse=False):
+        """ Iterate over the keys whose sort value lies between `min` and
+        `max`.
+
+        :param min: The lower bound or `None` for no lower bound.
+        :param max: The upper bound or `None` for no upper bound.
+        :param inclusive: A tuple of two booleans, whether keys equal to
+        `min` and `max` are included, respectively.
+        :param reverse: Whether to iterate in descending order.
+        """
+        if min is None:
+            start = 0
+        elif inclusive[0]:
+            start = self.bisect_left(min)
+        else:
+            start = self.bisect_right(min)
+        if max is None:
+            stop = len(self._sorted)
+        elif inclusive[1]:
+            stop = self.bisect_right(max)
+        else:
+            stop = self.bisect_left(max)
+        return itertools.imap(self._key, self._sorted.islice(start, stop, reverse))
+
+    def __repr__(self):
+        return u'%s(%r)' % (self.__class__.__name__, self.items())
+
+
+class FunctionSortedDict(SortedDict):
+    """ A dictionary whose keys are sorted by the result of
+    `function(key, value)`; keys with equal results are sorted by key.
+
+    The function must return the same result for the same key and value,
+    so values must not be changed in place in a way that changes the
+    result.
+    """
+    def __init__(self, function, doc=None):
+        """ Constructor.
+
+        :param function: A function `function(key, value)` returning the
+        value to sort `key` by.
+        :param doc: See `SortedDict`.
+        """
+        self.__dict__[u'_function'] = function
+        SortedDict.__init__(self, doc)
+
+    def _sort_item(self, key, value):
+        return (self._function(key, value), key)
+
+    def _key(self, item):
+        return item[1]
+
+    def _bounds(self, bound):
+        return (bound,), (bound, _MAX)
+
+
+def _value(key, value):
+    return value
+
+
+class ValueSortedDict(FunctionSortedDict):
+    """ A dictionary whose keys are sorted by their values; keys with equal
+    values are sorted by key.
+    """
+    def __init__(self, doc=None):
+        """ Constructor.
+
+        :param doc: See `SortedDict`.
+        """
+        FunctionSortedDict.__init__(self, _value, doc)
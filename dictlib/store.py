@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" An embedded, append-only document store in a single file.
+
+Documents are appended to the file as records, each consisting of a header
+(flags, length of the document id, length of the payload), the UTF-8 encoded
+document id and the payload. The payload is the JSON encoding of the document
+or, if a `BinaryCodec` is given, its binary encoding. Deleting a document
+appends a record without payload. An index in memory maps each document id
+to the position of its latest payload; it is rebuilt by scanning the file
+when the store is opened.
+
+Documents are read through `mmap` by slicing a `memoryview`, so that no data
+is copied before decoding. JSON payloads are decoded lazily with
+`LazyJsonAdapter`, which converts values with `DictField.from_json()` on
+first access.
+"""
+
+from dictlib.lazy import lazy_from_json
+import collections
+import json
+import mmap
+import os
+import struct
+
+
+__all__ = (u'DocumentStore', u'DocumentStoreError')
+
+
+class DocumentStoreError(Exception):
+    """ Thrown when a store file is not in the expected format.
+    """
+    pass
+
+
+_FILE_HEADER = 'DLS\x01'
+_RECORD_HEADER = struct.Struct('<BII')
+
+_DOCUMENT = 0
+_DELETED = 1
+
+
+class DocumentStore(collections.Mapping):
+    """ A read-mostly store of documents of a schema, indexed by document id.
+
+    The store is a read-only mapping of document ids to documents; documents
+    are added with `append()` or `append_many()` and removed with `delete()`.
+    Appending a document with an existing id replaces it. Replaced and
+    deleted documents take up space in the file until `compact()` is called.
+
+    >>> with DocumentStore(u'books.db', BookSchema()) as store:
+    ...     store.append(u'1', {u'title': u'Emil'})
+    ...     print store[u'1'][u'title']
+    """
+    def __init__(self, path, schema, codec=None, lazy=True, validate=True):
+        """ Open the store in the file `path`, creating it if necessary.
+        A partially written record at the end of the file (e. g. after a
+        crash) is removed.
+
+        :param path: The path of the store file.
+        :param schema: The `Schema` of the documents.
+        :param codec: An optional `BinaryCodec` for `schema`. Default: store
+        documents as JSON.
+        :param lazy: Whether to return JSON-encoded documents as
+        `LazyJsonAdapter`s instead of converting them completely.
+        Default: `True`.
+        :param validate: Whether to validate documents before appending them.
+        Default: `True`.
+        :raises DocumentStoreError: If the file is not a store file.
+        """
+        self.path = path
+        self.schema = schema
+        self.codec = codec
+        self.lazy = lazy
+        self.validate = validate
+        self._index = {}
+        self._garbage = 0
+        self._mmap = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, u'ab')
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() == 0:
+            self._file.write(_FILE_HEADER)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._read_file = open(self.path, u'rb')
+        self._mapped_size = 0
+        self._map(0)
+        if self._mmap[:len(_FILE_HEADER)] != _FILE_HEADER:
+            self.close()
+            raise DocumentStoreError(u'%s is not a document store' % self.path)
+        self._load_index()
+
+    def _map(self, size):
+        """ Make sure that at least `size` bytes of the file are mapped.
+        """
+        if size <= self._mapped_size and self._mmap is not None:
+            return
+        # Previous maps are not closed explicitly, since buffers on them may
+        # still exist; they are unmapped when they are garbage collected
+        self._mmap = mmap.mmap(self._read_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapped_size = len(self._mmap)
+
+    def _load_index(self):
+        index, data = self._index, self._mmap
+        end = len(data)
+        offset = len(_FILE_HEADER)
+        while offset < end:
+            if offset + _RECORD_HEADER.size > end:
+                break
+            flags, id_length, length = _RECORD_HEADER.unpack_from(data, offset)
+            id_offset = offset + _RECORD_HEADER.size
+            payload_offset = id_offset + id_length
+            if payload_offset + length > end:
+                break
+            doc_id = data[id_offset:payload_offset].decode(u'utf-8')
+            if doc_id in index:
+                self._garbage += 1
+            if flags == _DOCUMENT:
+                index[doc_id] = (payload_offset, length)
+            elif flags == _DELETED:
+                index.pop(doc_id, None)
+                self._garbage += 1
+            else:
+                raise DocumentStoreError(u'Invalid record at offset %d in %s' %
+                                         (offset, self.path))
+            offset = payload_offset + length
+
+        if offset < end:
+            # Remove a partially written record
+            self._file.truncate(offset)
+            self._file.seek(0, os.SEEK_END)
+            self._mmap = None
+            self._map(0)
+
+    def _encode(self, doc):
+        if self.validate:
+            self.schema.validate(doc)
+        if self.codec is not None:
+            return self.codec.encode(doc)
+        return json.dumps(self.schema.to_json(doc), separators=(',', ':'))
+
+    def _write(self, records):
+        """ Write `records`, a list of `(flags, doc_id, payload)` tuples, and
+        add them to the index.
+        """
+        chunks = []
+        offset = self._file.tell()
+        for flags, doc_id, payload in records:
+            encoded_id = doc_id.encode(u'utf-8') if isinstance(doc_id, unicode) else doc_id
+            chunks.append(_RECORD_HEADER.pack(flags, len(encoded_id), len(payload)))
+            chunks.append(encoded_id)
+            chunks.append(payload)
+            offset += _RECORD_HEADER.size + len(encoded_id)
+
+            doc_id = encoded_id.decode(u'utf-8')
+            if doc_id in self._index:
+                self._garbage += 1
+            if flags == _DOCUMENT:
+                self._index[doc_id] = (offset, len(payload))
+            else:
+                self._index.pop(doc_id, None)
+                self._garbage += 1
+            offset += len(payload)
+        self._file.write(''.join(chunks))
+        self._file.flush()
+
+    def sync(self):
+        """ Flush all appended documents to disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, doc_id, doc, sync=True):
+        """ Append the document `doc` with the id `doc_id`, replacing any
+        document with the same id.
+
+        :param sync: Whether to flush the document to disk with `fsync()`
+        before returning. Default: `True`.
+        :raises ValidationError: If `doc` is not valid.
+        """
+        self._write([(_DOCUMENT, doc_id, self._encode(doc))])
+        if sync:
+            self.sync()
+
+    def append_many(self, items, sync_every=1000):
+        """ Append many documents, flushing them to disk in batches.
+
+        :param items: An iterable of `(doc_id, doc)` tuples.
+        :param sync_every: The number of documents written and flushed to
+        disk at once.
+        :return: The number of documents appended.
+        :raises ValidationError: If a document is not valid. Documents of
+        previous batches have been appended already.
+        """
+        count = 0
+        batch = []
+        for doc_id, doc in items:
+            batch.append((_DOCUMENT, doc_id, self._encode(doc)))
+            if len(batch) >= sync_every:
+                self._write(batch)
+                self.sync()
+                count += len(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+            count += len(batch)
+        self.sync()
+        return count
+
+    def delete(self, doc_id, sync=True):
+        """ Delete the document with the id `doc_id`.
+
+        :raises KeyError: If there is no such document.
+        """
+        if doc_id not in self._index:
+            raise KeyError(doc_id)
+        self._write([(_DELETED, doc_id, '')])
+        if sync:
+            self.sync()
+
+    def get_raw(self, doc_id):
+        """ Return a `memoryview` of the encoded document with the id
+        `doc_id`. The view is backed by the mapped file.
+
+        :raises KeyError: If there is no such document.
+        """
+        offset, length = self._index[doc_id]
+        self._map(offset + length)
+        return memoryview(buffer(self._mmap, offset, length))
+
+    def _decode(self, data):
+        if self.codec is not None:
+            return self.codec.decode(data)
+        json_doc = json.loads(data.tobytes())
+        if self.lazy:
+            return lazy_from_json(self.schema, json_doc)
+        return self.schema.from_json(json_doc)
+
+    def __getitem__(self, doc_id):
+        return self._decode(self.get_raw(doc_id))
+
+    def __contains__(self, doc_id):
+        return doc_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def scan(self):
+        """ Iterate over all documents in the order they were appended,
+        yielding `(doc_id, doc)` tuples. Documents are decoded one at a time.
+        """
+        positions = sorted((offset, length, doc_id)
+                           for doc_id, (offset, length) in self._index.iteritems())
+        if positions:
+            self._map(positions[-1][0] + positions[-1][1])
+        data = self._mmap
+        for offset, length, doc_id in positions:
+            yield doc_id, self._decode(memoryview(buffer(data, offset, length)))
+
+    @property
+    def garbage(self):
+        """ The number of replaced and deleted records which `compact()`
+        would remove.
+        """
+        return self._garbage
+
+    def compact(self):
+        """ Rewrite the store file without replaced and deleted documents.
+        Records are copied without decoding them.
+        """
+        self.sync()
+        positions = sorted((offset, length, doc_id)
+                           for doc_id, (offset, length) in self._index.iteritems())
+        if positions:
+            self._map(positions[-1][0] + positions[-1][1])
+        data = self._mmap
+
+        compact_path = self.path + u'.compact'
+        with open(compact_path, u'wb') as f:
+            f.write(_FILE_HEADER)
+            for offset, length, doc_id in positions:
+                start = offset - len(doc_id.encode(u'utf-8')) - _RECORD_HEADER.size
+                f.write(buffer(data, start, offset + length - start))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.rename(compact_path, self.path)
+        self._index = {}
+        self._garbage = 0
+        self._open()
+
+    def close(self):
+        """ Close the store file.
+        """
+        self._mmap = None
+        self._mapped_size = 0
+        if not self._file.closed:
+            self._file.close()
+        self._read_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
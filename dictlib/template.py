@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Copy-on-write documents over shared templates of default values. Most
+documents created from a schema differ from its defaults in a few fields
+only, so instead of creating the whole nested structure for each document
+like `Schema.create()` does, a `CopyOnWriteDict` reads the defaults from a
+`Template` shared by all documents of the schema and stores only the values
+set on it:
+
+>>> doc = schema.create_copy_on_write()
+>>> doc[u'info'][u'title'] = u'Pippi'
+>>> doc.materialize()
+{u'info': {u'title': u'Pippi', u'year': 1945}}
+"""
+
+from dictlib.mapping import BaseDictAdapter
+import collections
+import copy
+
+
+__all__ = (u'Template', u'DefaultFactory', u'CopyOnWriteDict')
+
+
+#: Types of default values which are copied before they are handed out, so
+#: changes of a document never reach the template
+_MUTABLE_TYPES = (list, dict, set, bytearray)
+
+_NOTHING_REMOVED = frozenset()
+
+
+class DefaultFactory(object):
+    """ A default value in a `Template` which is created for each document
+    by calling `function` without arguments, e. g. `datetime.datetime.now`.
+    """
+    __slots__ = (u'function',)
+
+    def __init__(self, function):
+        self.function = function
+
+
+class Template(object):
+    """ The default values of a dictionary, shared by all `CopyOnWriteDict`s
+    created from it. `values` maps each key to its default value, a
+    `DefaultFactory` or a nested `Template`. A template must not be changed
+    once it is in use.
+    """
+    __slots__ = (u'values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def materialize(self):
+        """ Return the default values as a new plain (nested) dictionary.
+        """
+        return dict((key, _materialize_default(value))
+                    for key, value in self.values.iteritems())
+
+
+def _materialize_default(value):
+    if isinstance(value, Template):
+        return value.materialize()
+    elif isinstance(value, DefaultFactory):
+        return value.function()
+    elif isinstance(value, _MUTABLE_TYPES):
+        return copy.deepcopy(value)
+    return value
+
+
+class CopyOnWriteDict(BaseDictAdapter):
+    """ A dictionary which reads through to a shared `Template` and stores
+    only the values which differ from it. Nested templates are returned as
+    `CopyOnWriteDict`s themselves, which are kept for later writes but do
+    not copy any value before one is set. Default values created by a
+    `DefaultFactory` and mutable default values are copied on first access.
+
+    The dictionary of the stored values is available as the `_doc`
+    attribute; the `doc` attribute returns the whole document as a plain
+    dictionary.
+    """
+    def __init__(self, template, doc=None):
+        """ Constructor.
+
+        :param template: The `Template` of the default values.
+        :param doc: An optional dictionary of the values which differ from
+        `template`. It is used, not copied.
+        """
+        BaseDictAdapter.__init__(self, doc)
+        self.__dict__[u'_template'] = template
+        # Keys of the template which were deleted; a set is only created for
+        # the first deletion
+        self.__dict__[u'_removed'] = _NOTHING_REMOVED
+
+    def __getitem__(self, key):
+        try:
+            return self._doc[key]
+        except KeyError:
+            if key in self._removed:
+                raise
+        value = self._template.values[key]
+        if isinstance(value, Template):
+            value = CopyOnWriteDict(value)
+        elif isinstance(value, (DefaultFactory,) + _MUTABLE_TYPES):
+            value = _materialize_default(value)
+        else:
+            return value
+        self._doc[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._doc[key] = value
+        if key in self._removed:
+            self._removed.remove(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._doc.pop(key, None)
+        if key in self._template.values:
+            if self._removed is _NOTHING_REMOVED:
+                self.__dict__[u'_removed'] = set()
+            self._removed.add(key)
+
+    def __contains__(self, key):
+        if key in self._doc:
+            return True
+        return key in self._template.values and key not in self._removed
+
+    def keys(self):
+        keys = set(self._doc)
+        removed = self._removed
+        keys.update(key for key in self._template.values if key not in removed)
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def materialize(self):
+        """ Return the whole document as a plain (nested) dictionary, equal to
+        the result of `Schema.create()` with the same changes applied. The
+        document itself is not changed.
+        """
+        removed = self._removed
+        doc = dict((key, _materialize_default(value))
+                   for key, value in self._template.values.iteritems()
+                   if key not in removed and key not in self._doc)
+        for key, value in self._doc.iteritems():
+            if isinstance(value, CopyOnWriteDict):
+                value = value.materialize()
+            doc[key] = value
+        return doc
+
+    @property
+    def doc(self):
+        """ The whole document as a plain dictionary.
+
+        :see: `CopyOnWriteDict.materialize`
+        """
+        return self.materialize()
+
+    def __repr__(self):
+        return u'%s(%r)' % (self.__class__.__name__, self.materialize())
+
+
+collections.MutableMapping.register(CopyOnWriteDict)
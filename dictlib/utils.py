@@ -18,8 +18,12 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import array
 import collections
 
+# Sequences which can be extended by setting the item at their length
+_MUTABLE_SEQUENCE_TYPES = (collections.MutableSequence, array.array)
+
 def update_recursive(doc, update_doc, skip_none=False):
     """
     Updates the dictionary-like object `doc` with the value from `update_doc`
@@ -174,15 +178,15 @@ def setitem(doc, key, value):
                     # Assume it's a dict
                     sub_container = dict()
 
-                if isinstance(container, collections.MutableSequence) and key == len(container):
-                    container.__setslice__(key, key+1, [sub_container])
+                if isinstance(container, _MUTABLE_SEQUENCE_TYPES) and key == len(container):
+                    container.append(sub_container)
                 else:
                     container.__setitem__(key, sub_container)
 
             container = container.__getitem__(key)
 
-    if isinstance(container, collections.MutableSequence) and key == len(container):
-        container.__setslice__(key, key+1, [value])
+    if isinstance(container, _MUTABLE_SEQUENCE_TYPES) and key == len(container):
+        container.append(value)
     else:
         container.__setitem__(key, value)
 
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Allocation budgets for the main dictlib operations.
+
+Each operation is called many times while its results are kept alive, and
+the allocations per call are measured with every meter available:
+
+ - `peak_bytes`: the peak of memory traced by `tracemalloc` during a single
+   call, including temporary objects
+ - `bytes`: the memory traced by `tracemalloc` that is still allocated after
+   the call
+ - `blocks`: the change of `sys.getallocatedblocks()` per call
+ - `gc_objects`: the change of the number of objects tracked by the garbage
+   collector per call, i. e. containers, instances, frames etc.
+
+`bytes`, `blocks` and `gc_objects` only count objects which are still alive
+after the call, so they do not see temporary objects at all. Only
+`peak_bytes` sees temporary objects directly, but `tracemalloc` is not
+available on Python 2.
+
+With `--calls`, the number of Python and built-in functions called per
+call, including resumed generators, is counted as the meter `calls` as
+well. It is no allocation meter, but hints at temporary work on Python 2:
+it counts the frames of helper functions and generators and the calls of
+methods like `keys()` which copy their results. Counting calls is slow and
+changes with any refactoring, so it is not part of the unit tests, and
+its budgets are checked with a tolerance relative to the budget.
+
+`tracemalloc` and `sys.getallocatedblocks()` are not available on all Python
+versions, so budgets are stored per meter in `allocation_budgets.json`.
+Operations without a budget for a meter are not checked by it. Record the
+budgets after an intended change and check them:
+
+    python -m tests.allocations record --calls
+    python -m tests.allocations check
+"""
+
+from dictlib.binary import BinaryCodec
+from dictlib.lazy import lazy_from_json
+from dictlib.mapping import DotNotationAdapter, ObjectMappingAdapter
+from dictlib.utils import getitem, setitem, walk, update_recursive
+from tests.benchmarks import make_flat_schema, make_flat_doc, make_deep_schema, \
+    make_deep_doc, make_list_schema, make_list_doc, make_nested_dict
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            u'allocation_budgets.json')
+
+#: Registered operations as `(name, function)` tuples
+OPERATIONS = []
+
+#: Tolerances of meters relative to the budget, instead of the absolute
+#: tolerance of `check_budgets()`
+RELATIVE_TOLERANCES = {u'calls': 0.1}
+
+def operation(name):
+    """ Register the decorated function as the operation `name`. The
+    function returns a function without arguments which runs the operation
+    once.
+    """
+    def register(function):
+        OPERATIONS.append((name, function))
+        return function
+    return register
+
+
+# Operations
+# ----------
+
+@operation(u'schema.validate.flat')
+def op_validate_flat():
+    schema, doc = make_flat_schema(20), make_flat_doc(random.Random(20), 20)
+    return lambda: schema.validate(doc)
+
+@operation(u'schema.validate.deep')
+def op_validate_deep():
+    schema, doc = make_deep_schema(10), make_deep_doc(random.Random(10), 10)
+    return lambda: schema.validate(doc)
+
+@operation(u'schema.validate.lists')
+def op_validate_lists():
+    schema, doc = make_list_schema(), make_list_doc(random.Random(100), 100)
+    return lambda: schema.validate(doc)
+
+@operation(u'schema.create')
+def op_create():
+    schema = make_deep_schema(10)
+    return lambda: schema.create()
+
+@operation(u'schema.create_copy_on_write')
+def op_create_copy_on_write():
+    schema = make_deep_schema(10)
+    return lambda: schema.create_copy_on_write()
+
+@operation(u'dictfield.from_json')
+def op_from_json():
+    schema = make_flat_schema(20)
+    json_doc = schema.to_json(make_flat_doc(random.Random(20), 20))
+    return lambda: schema.from_json(json_doc)
+
+@operation(u'dictfield.to_json')
+def op_to_json():
+    schema, doc = make_flat_schema(20), make_flat_doc(random.Random(20), 20)
+    return lambda: schema.to_json(doc)
+
+@operation(u'lazy_from_json.getitem')
+def op_lazy_getitem():
+    schema = make_flat_schema(20)
+    json_doc = schema.to_json(make_flat_doc(random.Random(20), 20))
+    return lambda: lazy_from_json(schema, json_doc)[u'field_0']
+
+@operation(u'binarycodec.encode')
+def op_binary_encode():
+    schema, doc = make_flat_schema(20), make_flat_doc(random.Random(20), 20)
+    codec = BinaryCodec(schema)
+    return lambda: codec.encode(doc)
+
+@operation(u'binarycodec.decode')
+def op_binary_decode():
+    schema, doc = make_flat_schema(20), make_flat_doc(random.Random(20), 20)
+    codec = BinaryCodec(schema)
+    data = codec.encode(doc)
+    return lambda: codec.decode(data)
+
+@operation(u'utils.getitem')
+def op_getitem():
+    doc = make_nested_dict(random.Random(5), 5, 2)
+    return lambda: getitem(doc, u'k0.k1.k0.k1.k0')
+
+@operation(u'utils.setitem')
+def op_setitem():
+    doc = make_nested_dict(random.Random(5), 5, 2)
+    return lambda: setitem(doc, u'k0.k1.k0.k1.k0', 1)
+
+@operation(u'utils.walk')
+def op_walk():
+    doc = make_nested_dict(random.Random(4), 4, 4)
+    return lambda: list(walk(doc))
+
+@operation(u'utils.update_recursive')
+def op_update_recursive():
+    rnd = random.Random(4)
+    doc, update = make_nested_dict(rnd, 4, 4), make_nested_dict(rnd, 4, 4)
+    return lambda: update_recursive(doc, update)
+
+@operation(u'dotnotationadapter.get')
+def op_dot_notation_get():
+    adapter = DotNotationAdapter(make_nested_dict(random.Random(5), 5, 2))
+    return lambda: adapter[u'k0.k1.k0.k1.k0']
+
+@operation(u'objectmappingadapter.getattr')
+def op_object_mapping_getattr():
+    adapter = ObjectMappingAdapter(make_nested_dict(random.Random(5), 5, 2))
+    # Returns a new adapter for the nested dictionary
+    return lambda: adapter.k0.k1.k0.k1
+
+
+# Measurement
+# -----------
+
+def _call_many(function, results):
+    for i in xrange(len(results)):
+        results[i] = function()
+
+def count_calls(function, number):
+    """ Return the number of function calls made by `number` calls of
+    `function`, not counting the calls of `function` itself.
+    """
+    counter = [0]
+
+    def profile(frame, event, arg):
+        if event == u'call' or event == u'c_call':
+            counter[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        for i in xrange(number):
+            function()
+    finally:
+        sys.setprofile(None)
+    # Subtract the calls of `function` and of `sys.setprofile()`
+    return counter[0] - number - 1
+
+def measure_allocations(function, number=1000, calls=False):
+    """ Return a dictionary mapping the name of each available meter to the
+    allocations per call of `function`. The results of all calls are kept
+    alive until the measurement is finished.
+
+    :param calls: Whether to count the function calls per call as well.
+    """
+    # Warm up caches, e. g. of compiled patterns and dispatch tables
+    for i in xrange(10):
+        function()
+    measurements = {}
+    if calls:
+        measurements[u'calls'] = float(count_calls(function, number)) / number
+    results = [None] * number
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        gc.collect()
+        # The counter of tracked objects does not drop below zero, so keep
+        # it high enough for the objects the operation releases
+        padding = [[] for i in xrange(1000)]
+        before = gc.get_count()[0]
+        _call_many(function, results)
+        measurements[u'gc_objects'] = float(gc.get_count()[0] - before) / number
+        del padding
+
+        if hasattr(sys, u'getallocatedblocks'):
+            results = [None] * number
+            before = sys.getallocatedblocks()
+            _call_many(function, results)
+            measurements[u'blocks'] = float(sys.getallocatedblocks() - before) / number
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        results = [None] * number
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            _call_many(function, results)
+            measurements[u'bytes'] = float(tracemalloc.get_traced_memory()[0] - before) / number
+        finally:
+            tracemalloc.stop()
+        peak = 0
+        for i in xrange(10):
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                result = function()
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+            finally:
+                tracemalloc.stop()
+        measurements[u'peak_bytes'] = float(peak)
+    return measurements
+
+def measure_operations(pattern=None, number=1000, calls=False):
+    """ Return a dictionary mapping each meter to a dictionary of the
+    allocations per call of each operation whose name contains `pattern`.
+
+    :param calls: Whether to count the function calls per call as well.
+    """
+    measurements = {}
+    for name, function in OPERATIONS:
+        if pattern and pattern not in name:
+            continue
+        for meter, value in measure_allocations(function(), number, calls).iteritems():
+            measurements.setdefault(meter, {})[name] = value
+    return measurements
+
+def load_budgets(path=BUDGETS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_budgets(measurements, path=BUDGETS_PATH):
+    """ Store `measurements`, rounded up to two decimals, as budgets in
+    `path`, keeping budgets of meters not measured.
+    """
+    budgets = load_budgets(path)
+    for meter, values in measurements.iteritems():
+        meter_budgets = budgets.setdefault(meter, {})
+        for name, value in values.iteritems():
+            meter_budgets[name] = math.ceil(value * 100) / 100
+    with open(path, u'w') as f:
+        json.dump(budgets, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def check_budgets(measurements, budgets, tolerance=0.25):
+    """ Return a sorted list of `(meter, operation, budget, measured)` tuples
+    for all operations whose allocations exceed their budget by more than
+    `tolerance`, which allows for the few objects allocated by the
+    measurement itself. Meters in `RELATIVE_TOLERANCES` may exceed their
+    budgets by the given fraction of the budget instead.
+    """
+    exceeded = []
+    for meter, values in measurements.iteritems():
+        meter_budgets = budgets.get(meter, {})
+        for name, value in values.iteritems():
+            budget = meter_budgets.get(name)
+            if budget is None:
+                continue
+            if meter in RELATIVE_TOLERANCES:
+                allowed = budget * (1 + RELATIVE_TOLERANCES[meter])
+            else:
+                allowed = budget + tolerance
+            if value > allowed:
+                exceeded.append((meter, name, budget, value))
+    return sorted(exceeded)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'Measure or check dictlib allocation budgets.')
+    parser.add_argument(u'command', choices=(u'record', u'check'))
+    parser.add_argument(u'-k', u'--filter', help=u'only measure operations containing this string')
+    parser.add_argument(u'--number', type=int, default=1000)
+    parser.add_argument(u'--calls', action=u'store_true',
+                        help=u'count function calls as well (slow)')
+    args = parser.parse_args(argv)
+
+    measurements = measure_operations(args.filter, args.number, args.calls)
+    if args.command == u'record':
+        save_budgets(measurements)
+    budgets = load_budgets()
+    for meter, values in sorted(measurements.iteritems()):
+        for name, value in sorted(values.iteritems()):
+            print u'%-12s %-32s %10.2f %10s' % (meter, name, value,
+                                                budgets.get(meter, {}).get(name, u'-'))
+    exceeded = check_budgets(measurements, budgets)
+    for meter, name, budget, value in exceeded:
+        print u'%s: %s allocates %.2f per call, budget is %.2f' % (meter, name, value, budget)
+    return 1 if exceeded else 0
+
+if __name__ == u'__main__':
+    sys.exit(main())
@@ -0,0 +1,1047 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+""" Benchmark suite for the main dictlib APIs.
+
+Each benchmark runs on deterministic synthetic documents in several sizes.
+Run the suite and write the results to a JSON file, then compare the
+results to a stored baseline:
+
+    python -m tests.benchmarks run -o results.json
+    python -m tests.benchmarks compare tests/benchmark_baseline.json results.json
+
+`compare` exits with status 1 if a benchmark got slower than the baseline
+by more than the noise threshold (default: 10%), or if the results violate
+a bound. Bounds compare benchmarks of the same run, e. g. that an optimized
+operation stays faster than the straightforward implementation it
+replaces, so they hold on any machine. Use `run -k validate` to run only
+the benchmarks whose names contain `validate`.
+"""
+
+from dictlib.bidict import BiDict
+from dictlib.binary import BinaryCodec
+from dictlib.cache import ValidationCache
+from dictlib.collection import DocumentCollection
+from dictlib.convert import Converter, JsonSchemaConverter
+from dictlib.exceptions import ValidationError
+from dictlib.mapping import DotNotationAdapter, ObjectMappingAdapter
+from dictlib.metrics import ValidationMetrics
+from dictlib.profiling import ValidationProfiler
+from dictlib.schema import Schema, DictField, IntField, FloatField, UnicodeField, \
+    ListField, DatetimeField, DateField, TimeField, EmailField, UrlField, EnumField
+from dictlib.sorteddict import SortedDict, ValueSortedDict
+from dictlib.store import DocumentStore
+from dictlib.utils import getitem, setitem, walk, update_recursive, map_dict
+import argparse
+import atexit
+import copy
+import datetime
+import itertools
+import json
+import operator
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+
+#: Registered benchmarks as `(name, sizes, function)` tuples
+BENCHMARKS = []
+
+def benchmark(name, sizes):
+    """ Register the decorated function as the benchmark `name`. The
+    function is called with each size in `sizes` and returns a function
+    without arguments which runs the benchmarked operation once.
+    """
+    def register(function):
+        BENCHMARKS.append((name, sizes, function))
+        return function
+    return register
+
+
+#: Bounds of benchmark times as `(name, reference, bound)` tuples
+BOUNDS = []
+
+def bound(name, reference, factor):
+    """ Require the benchmark `name` (including its size, e. g.
+    `schema.project[100]`) to take at most `factor` times as long as the
+    benchmark `reference`, or at most `factor` seconds if `reference` is
+    `None`.
+    """
+    BOUNDS.append((name, reference, factor))
+
+
+# Synthetic corpora
+# -----------------
+
+_FIELD_TYPES = (u'int', u'float', u'unicode', u'datetime', u'list')
+
+def make_flat_schema(n_fields):
+    """ Return a schema with `n_fields` fields of various types.
+    """
+    fields = {}
+    for i in range(n_fields):
+        field_type = _FIELD_TYPES[i % len(_FIELD_TYPES)]
+        fields[u'field_%d' % i] = {
+            u'int': lambda: IntField(min=0),
+            u'float': lambda: FloatField(),
+            u'unicode': lambda: UnicodeField(max_len=100),
+            u'datetime': lambda: DatetimeField(),
+            u'list': lambda: ListField(UnicodeField()),
+        }[field_type]()
+    return Schema(fields)
+
+def make_flat_doc(rnd, n_fields):
+    """ Return a document for `make_flat_schema(n_fields)`.
+    """
+    doc = {}
+    for i in range(n_fields):
+        field_type = _FIELD_TYPES[i % len(_FIELD_TYPES)]
+        doc[u'field_%d' % i] = {
+            u'int': lambda: rnd.randint(0, 10 ** 6),
+            u'float': lambda: rnd.random(),
+            u'unicode': lambda: u'value-%d' % rnd.randint(0, 1000),
+            u'datetime': lambda: datetime.datetime(2011, 1, 1) +
+                datetime.timedelta(seconds=rnd.randint(0, 10 ** 8)),
+            u'list': lambda: [u'tag-%d' % rnd.randint(0, 10) for j in range(3)],
+        }[field_type]()
+    return doc
+
+def make_deep_schema(depth):
+    """ Return a schema of `depth` nested dictionaries.
+    """
+    fields = {u'id': IntField(), u'name': UnicodeField()}
+    for i in range(depth):
+        fields = {u'id': IntField(), u'name': UnicodeField(), u'child': fields}
+    return Schema(fields)
+
+def make_deep_doc(rnd, depth):
+    doc = {u'id': rnd.randint(0, 1000), u'name': u'leaf'}
+    for i in range(depth):
+        doc = {u'id': rnd.randint(0, 1000), u'name': u'level-%d' % i, u'child': doc}
+    return doc
+
+def make_list_schema():
+    return Schema({u'orders': ListField({u'id': IntField(), u'sku': UnicodeField(),
+                                         u'quantity': IntField(min=1),
+                                         u'price': FloatField()})})
+
+def make_list_doc(rnd, length):
+    return {u'orders': [{u'id': i, u'sku': u'sku-%d' % rnd.randint(0, 100),
+                         u'quantity': rnd.randint(1, 10), u'price': rnd.random() * 100}
+                        for i in range(length)]}
+
+def make_list_update(rnd, n_paths, length):
+    """ Return a flat update in dot notation of `n_paths` values of a
+    document of `make_list_doc(rnd, length)`.
+    """
+    update = {}
+    for i in range(n_paths):
+        j = rnd.randrange(length)
+        if i % 2:
+            update[u'orders.%d.quantity' % j] = rnd.randint(1, 10)
+        else:
+            update[u'orders.%d' % j] = {u'id': j, u'sku': u'sku-%d' % rnd.randint(0, 100),
+                                        u'quantity': rnd.randint(1, 10), u'price': 1.0}
+    return update
+
+def make_adversarial_strings(length):
+    """ Return a list of `(field, value)` tuples of invalid values of
+    `length` characters, which are expensive to reject for naive regular
+    expressions.
+    """
+    value = u'a' * length
+    return [(EmailField(), value), (UrlField(), value), (UrlField(), u'http:/' + value),
+            (UnicodeField(match=ur'(a+)+b', prefixes=u'b'), value)]
+
+def make_nested_dict(rnd, depth, width):
+    """ Return a schemaless dictionary with `width` keys per level and
+    `depth` levels.
+    """
+    if depth == 0:
+        return rnd.randint(0, 1000)
+    return dict((u'k%d' % i, make_nested_dict(rnd, depth - 1, width)) for i in range(width))
+
+def make_schema_class(n_fields, depth):
+    """ Build a `Schema` subclass with `depth` levels of inheritance, each
+    level adding `n_fields` flat fields and `n_fields` fields to a nested
+    dictionary.
+    """
+    cls = Schema
+    for level in range(depth):
+        fields = dict((u'f%d_%d' % (level, i), IntField()) for i in range(n_fields))
+        fields[u'nested'] = dict((u'n%d_%d' % (level, i), IntField())
+                                 for i in range(n_fields))
+        cls = type('Schema%d' % level, (cls,), {u'schema': fields})
+    return cls
+
+def make_schema_registry(n_schemas, n_shared=20):
+    """ Return a dictionary of `n_schemas` schemas, which all use some of
+    `n_shared` `DictField` subclasses (as new instances), each with own
+    fields.
+    """
+    rnd = random.Random(n_schemas)
+    shared = []
+    for i in range(n_shared):
+        fields = dict((u'field_%d' % j, rnd.choice([IntField(min=0), FloatField(),
+                                                    UnicodeField(max_len=100),
+                                                    DatetimeField()]))
+                      for j in range(rnd.randint(5, 10)))
+        if shared:
+            fields[u'nested'] = rnd.choice(shared)()
+        shared.append(type('Shared%d' % i, (DictField,), {u'schema': fields}))
+    registry = {}
+    for i in range(n_schemas):
+        fields = dict((u'part_%d' % j, cls()) for j, cls in
+                      enumerate(rnd.sample(shared, 8)))
+        fields.update((u'own_%d' % j, IntField(max=j)) for j in range(5))
+        fields[u'items'] = ListField(rnd.choice(shared)())
+        registry[u'schema_%d' % i] = Schema(fields)
+    return registry
+
+
+# Schema benchmarks
+# -----------------
+
+@benchmark(u'schema.construction', sizes=(20, 80))
+def bench_schema_construction(size):
+    # 10 levels of `size` fields each
+    return lambda: make_schema_class(size, 10)()
+
+@benchmark(u'schema.construction.depth', sizes=(20, 80))
+def bench_schema_construction_depth(size):
+    # `size` levels of 20 fields each, all extending the same nested
+    # dictionary. Creating classes with deep MROs takes superlinear time in
+    # Python itself, so only merging the class schema is timed.
+    cls = make_schema_class(20, size)
+
+    def construct():
+        # Drop the class schema cached by the previous run
+        if u'_class_schema' in cls.__dict__:
+            del cls._class_schema
+        cls()
+    return construct
+
+# Doubling the fields or the depth takes about twice as long; merging the
+# nested dictionary again for each level takes four times as long. Allow
+# 2.5 times per doubling, compared over two doublings to even out noise.
+bound(u'schema.construction[80]', u'schema.construction[20]', 6.25)
+bound(u'schema.construction.depth[80]', u'schema.construction.depth[20]', 6.25)
+
+@benchmark(u'schema.instantiation', sizes=(20, 40))
+def bench_schema_instantiation(size):
+    # Compare to schema.construction: further instances reuse the class
+    # schema
+    cls = make_schema_class(size, 10)
+    cls()
+    return cls
+
+bound(u'schema.instantiation[40]', u'schema.construction[20]', 0.01)
+
+@benchmark(u'schema.validate.flat', sizes=(10, 100))
+def bench_validate_flat(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    return lambda: schema.validate(doc)
+
+@benchmark(u'schema.validate.deep', sizes=(5, 50))
+def bench_validate_deep(size):
+    schema, doc = make_deep_schema(size), make_deep_doc(random.Random(size), size)
+    return lambda: schema.validate(doc)
+
+@benchmark(u'schema.validate.wide', sizes=(1000,))
+def bench_validate_wide(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    return lambda: schema.validate(doc)
+
+@benchmark(u'schema.validate.lists', sizes=(100, 10000, 100000))
+def bench_validate_lists(size):
+    schema, doc = make_list_schema(), make_list_doc(random.Random(size), size)
+    return lambda: schema.validate(doc)
+
+@benchmark(u'schema.validate.workers', sizes=(100000,))
+def bench_validate_workers(size):
+    # The list is sharded across two worker processes
+    schema, doc = make_list_schema(), make_list_doc(random.Random(size), size)
+    return lambda: schema.validate(doc, workers=2)
+
+# Faster than validate() with several CPUs; with a single CPU, starting the
+# workers and collecting their results costs less than half the time
+bound(u'schema.validate.workers[100000]', u'schema.validate.lists[100000]', 1.5)
+
+def make_repeated_docs(size):
+    """ Return a schema and `size` documents sharing an equal sub-document
+    of 50 keys.
+    """
+    schema = Schema({u'id': IntField(),
+                     u'config': dict((u'option%d' % i, UnicodeField()) for i in range(50))})
+    config = dict((u'option%d' % i, u'value%d' % i) for i in range(50))
+    return schema, [{u'id': i, u'config': dict(config)} for i in range(size)]
+
+@benchmark(u'schema.validate.repeated', sizes=(10, 500))
+def bench_validate_repeated(size):
+    schema, docs = make_repeated_docs(size)
+    return lambda: [schema.validate(doc) for doc in docs]
+
+@benchmark(u'schema.validate.repeated.cached', sizes=(10, 500))
+def bench_validate_repeated_cached(size):
+    # A new cache for each run, so the first sub-document is a miss
+    schema, docs = make_repeated_docs(size)
+
+    def validate_cached():
+        cache = ValidationCache()
+        for doc in docs:
+            schema.validate(doc, cache=cache)
+    return validate_cached
+
+bound(u'schema.validate.repeated.cached[500]', u'schema.validate.repeated[500]', 0.5)
+
+@benchmark(u'schema.iter_validate.step', sizes=(100, 10000))
+def bench_iter_validate_step(size):
+    # The first step of 1000 keys and list elements
+    schema, doc = make_list_schema(), make_list_doc(random.Random(size), size)
+    return lambda: next(schema.iter_validate(doc, budget=1000), None)
+
+# A step blocks an event loop for a fraction of the time of validate()
+bound(u'schema.iter_validate.step[10000]', u'schema.validate.lists[10000]', 0.1)
+
+@benchmark(u'schema.validate_update', sizes=(10, 100))
+def bench_validate_update(size):
+    schema, update = make_list_schema(), make_list_update(random.Random(size), size, 1000)
+    return lambda: schema.validate_update(update)
+
+@benchmark(u'schema.validate_update.by_document', sizes=(10, 100))
+def bench_validate_updated_document(size):
+    # Applying the update to a copy of the document and validating it
+    schema, update = make_list_schema(), make_list_update(random.Random(size), size, 1000)
+    doc = make_list_doc(random.Random(1000), 1000)
+
+    def validate_updated_document():
+        updated = copy.deepcopy(doc)
+        for path, value in update.iteritems():
+            setitem(updated, path, value)
+        schema.validate(updated)
+    return validate_updated_document
+
+bound(u'schema.validate_update[100]', u'schema.validate_update.by_document[100]', 0.1)
+
+@benchmark(u'schema.project', sizes=(10, 100))
+def bench_project(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    include = [u'field_%d' % i for i in range(0, size, 10)]
+    return lambda: schema.project(doc, include=include)
+
+@benchmark(u'schema.project.by_deleting', sizes=(10, 100))
+def bench_project_by_deleting(size):
+    # Copying the document and deleting the paths not included
+    doc = make_flat_doc(random.Random(size), size)
+    include = set(u'field_%d' % i for i in range(0, size, 10))
+
+    def project_by_deleting():
+        projected = copy.deepcopy(doc)
+        adapter = DotNotationAdapter(projected)
+        for path in [path for path in projected if path not in include]:
+            del adapter[path]
+        return projected
+    return project_by_deleting
+
+bound(u'schema.project[100]', u'schema.project.by_deleting[100]', 0.2)
+
+@benchmark(u'schema.strip_unknown', sizes=(10, 100))
+def bench_strip_unknown(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    doc.update((u'unknown_%d' % i, i) for i in range(0, size, 5))
+    return lambda: schema.strip_unknown(doc)
+
+@benchmark(u'schema.validate.after_profiling', sizes=(10, 100))
+def bench_validate_after_profiling(size):
+    # Compare to schema.validate.flat: a stopped profiler leaves no overhead
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    with ValidationProfiler(schema):
+        schema.validate(doc)
+    return lambda: schema.validate(doc)
+
+# Instrumented methods left on the fields would at least double the time
+# of validating the flat fields
+bound(u'schema.validate.after_profiling[100]', u'schema.validate.flat[100]', 1.25)
+
+@benchmark(u'schema.validate.metrics', sizes=(10, 100))
+def bench_validate_with_metrics(size):
+    # Compare to schema.validate.flat: counting calls without sampling sizes
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    ValidationMetrics(sample_rate=0).install(schema)
+    return lambda: schema.validate(doc)
+
+@benchmark(u'schema.validate.metrics.sampled', sizes=(10, 100))
+def bench_validate_with_sampled_metrics(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    ValidationMetrics(sample_rate=1).install(schema)
+    return lambda: schema.validate(doc)
+
+# Counting a call costs a fraction of validating ten fields
+bound(u'schema.validate.metrics[10]', u'schema.validate.flat[10]', 1.25)
+
+@benchmark(u'stringfields.reject_long', sizes=(1000, 1000000))
+def bench_reject_long_strings(size):
+    # Long inputs are rejected by the prefilters before any regular
+    # expression is run
+    fields_and_values = make_adversarial_strings(size)
+    return lambda: [field.find_invalid([value]) for field, value in fields_and_values]
+
+bound(u'stringfields.reject_long[1000000]', None, 0.1)
+
+@benchmark(u'urlfield.accept_long', sizes=(10, 1000000))
+def bench_accept_long_url(size):
+    field, value = UrlField(), u'http://example.com/' + u'a' * size
+    return lambda: field.find_invalid([value])
+
+bound(u'urlfield.accept_long[1000000]', None, 0.01)
+
+@benchmark(u'listfield.validate.unicode', sizes=(1000, 100000))
+def bench_validate_unicode_list(size):
+    field = ListField(UnicodeField(min_len=1, max_len=20, match=ur'[a-z]+'))
+    value = [u'hello', u'world'] * (size // 2)
+    return lambda: field.validate(value, u'l')
+
+def make_mixed_list(size):
+    """ Return the element fields of a list with elements of several types
+    and a list of `size` such elements.
+    """
+    fields = [IntField(), UnicodeField(), DictField({u'a': IntField()})]
+    return fields, [1, u'hello', {u'a': 2}] * (size // 3)
+
+@benchmark(u'listfield.validate.mixed', sizes=(300, 30000))
+def bench_validate_mixed_list(size):
+    fields, value = make_mixed_list(size)
+    field = ListField(fields)
+    return lambda: field.validate(value, u'l')
+
+@benchmark(u'listfield.validate.mixed.try_each', sizes=(300, 30000))
+def bench_validate_mixed_list_by_trying(size):
+    # Trying the element fields in order for each element instead of
+    # dispatching by type
+    fields, value = make_mixed_list(size)
+
+    def try_each():
+        for element in value:
+            for field in fields:
+                try:
+                    field.validate(element)
+                    break
+                except ValidationError:
+                    pass
+    return try_each
+
+# Elements are validated with the fields of their type only, instead of
+# failing with the fields before them
+bound(u'listfield.validate.mixed[30000]', u'listfield.validate.mixed.try_each[30000]', 0.5)
+
+@benchmark(u'listfield.to_json.mixed', sizes=(300, 30000))
+def bench_mixed_list_to_json(size):
+    fields, value = make_mixed_list(size)
+    field = ListField(fields)
+    return lambda: field.to_json(value)
+
+@benchmark(u'listfield.validate.floats', sizes=(1000, 100000))
+def bench_validate_float_list(size):
+    field = ListField(FloatField(min=0.0))
+    value = field.from_json([float(i) for i in range(size)])
+    return lambda: field.validate(value, u'l')
+
+@benchmark(u'listfield.validate.floats.array', sizes=(1000, 100000))
+def bench_validate_float_array(size):
+    field = ListField(FloatField(min=0.0), storage=u'array')
+    value = field.from_json([float(i) for i in range(size)])
+    return lambda: field.validate(value, u'l')
+
+# The element type of an array is guaranteed, so only its minimum and
+# maximum are checked instead of validating each element
+bound(u'listfield.validate.floats.array[100000]', u'listfield.validate.floats[100000]', 0.1)
+
+@benchmark(u'enumfield.find_invalid', sizes=(10, 500))
+def bench_enum_find_invalid(size):
+    values = [u'value%d' % i for i in range(size)]
+    field = EnumField(values)
+    docs = values * (10000 // size)
+    return lambda: field.find_invalid(docs)
+
+@benchmark(u'enumfield.find_invalid.alternation', sizes=(10, 500))
+def bench_alternation_find_invalid(size):
+    # The same check with a regular expression instead of an EnumField
+    values = [u'value%d' % i for i in range(size)]
+    field = UnicodeField(match=re.compile(u'|'.join(values) + u'$'))
+    docs = values * (10000 // size)
+    return lambda: field.find_invalid(docs)
+
+bound(u'enumfield.find_invalid[500]', u'enumfield.find_invalid.alternation[500]', 1)
+
+@benchmark(u'jsonschema.export', sizes=(10, 100))
+def bench_json_schema_export(size):
+    # A new converter for each export, i. e. without memoized fields
+    registry = make_schema_registry(size)
+    return lambda: JsonSchemaConverter().export(registry)
+
+@benchmark(u'jsonschema.export.inlined', sizes=(10, 100))
+def bench_json_schema_export_inlined(size):
+    registry = make_schema_registry(size)
+    return lambda: JsonSchemaConverter(use_refs=False).export(registry)
+
+@benchmark(u'jsonschema.export.memoized', sizes=(10, 100))
+def bench_json_schema_export_memoized(size):
+    # Exporting the registry again with the same converter
+    registry = make_schema_registry(size)
+    converter = JsonSchemaConverter()
+    converter.export(registry)
+    return lambda: converter.export(registry)
+
+# The schemas and the definitions they reference are only translated and
+# walked once
+bound(u'jsonschema.export.memoized[100]', u'jsonschema.export[100]', 0.1)
+
+@benchmark(u'schema.registry', sizes=(10, 100))
+def bench_schema_registry(size):
+    return lambda: make_schema_registry(size)
+
+@benchmark(u'schema.create', sizes=(10, 100))
+def bench_create(size):
+    schema = make_flat_schema(size)
+    return schema.create
+
+@benchmark(u'schema.create.deep', sizes=(5, 50))
+def bench_create_deep(size):
+    schema = make_deep_schema(size)
+    return schema.create
+
+@benchmark(u'schema.create_copy_on_write', sizes=(10, 100))
+def bench_create_copy_on_write(size):
+    schema = make_flat_schema(size)
+    return schema.create_copy_on_write
+
+@benchmark(u'schema.create_copy_on_write.deep', sizes=(5, 50))
+def bench_create_copy_on_write_deep(size):
+    schema = make_deep_schema(size)
+    return schema.create_copy_on_write
+
+bound(u'schema.create_copy_on_write.deep[5]', u'schema.create.deep[5]', 1)
+
+@benchmark(u'copyonwritedict.materialize', sizes=(5, 50))
+def bench_materialize_copy_on_write(size):
+    doc = make_deep_schema(size).create_copy_on_write()
+    doc[u'child'][u'child'][u'name'] = u'changed'
+    return doc.materialize
+
+def make_record_docs(size):
+    """ Return a schema with 10 integer fields and `size` documents.
+    """
+    schema = Schema(dict((u'field%d' % i, IntField()) for i in range(10)))
+    return schema, [dict((u'field%d' % i, 1000 + i) for i in range(10)) for j in range(size)]
+
+@benchmark(u'record.from_dict', sizes=(10, 1000))
+def bench_record_from_dict(size):
+    schema, docs = make_record_docs(size)
+    cls = schema.record_class()
+    return lambda: [cls.from_dict(doc) for doc in docs]
+
+@benchmark(u'record.to_dict', sizes=(10, 1000))
+def bench_record_to_dict(size):
+    schema, docs = make_record_docs(size)
+    cls = schema.record_class()
+    records = [cls.from_dict(doc) for doc in docs]
+    return lambda: [record.to_dict() for record in records]
+
+@benchmark(u'record.deepcopy', sizes=(10, 1000))
+def bench_record_deepcopy(size):
+    # Copying the dictionaries instead of converting them to records
+    schema, docs = make_record_docs(size)
+    return lambda: copy.deepcopy(docs)
+
+# Converting between records and dictionaries takes less than half the
+# time of copying the dictionaries
+bound(u'record.from_dict[1000]', u'record.deepcopy[1000]', 0.5)
+bound(u'record.to_dict[1000]', u'record.deepcopy[1000]', 0.5)
+
+@benchmark(u'dictfield.from_json', sizes=(10, 100))
+def bench_from_json(size):
+    schema = make_flat_schema(size)
+    json_doc = schema.to_json(make_flat_doc(random.Random(size), size))
+    return lambda: schema.from_json(json_doc)
+
+@benchmark(u'dictfield.to_json', sizes=(10, 100))
+def bench_to_json(size):
+    schema, doc = make_flat_schema(size), make_flat_doc(random.Random(size), size)
+    return lambda: schema.to_json(doc)
+
+@benchmark(u'dictfield.json.lists', sizes=(1000,))
+def bench_json_lists(size):
+    schema, doc = make_list_schema(), make_list_doc(random.Random(size), size)
+    return lambda: schema.from_json(schema.to_json(doc))
+
+@benchmark(u'datetimefields', sizes=(1000,))
+def bench_datetime_fields(size):
+    rnd = random.Random(size)
+    fields = (DatetimeField(), DateField(), TimeField())
+    values = [datetime.datetime(2011, 1, 1) + datetime.timedelta(seconds=rnd.randint(0, 10 ** 8))
+              for i in range(size)]
+    values = [(value, value.date(), value.time().replace(microsecond=0)) for value in values]
+    def run():
+        for value in values:
+            for field, v in zip(fields, value):
+                field.validate(v)
+                field.from_json(field.to_json(v))
+    return run
+
+
+# Utility benchmarks
+# ------------------
+
+@benchmark(u'utils.getitem', sizes=(3, 10))
+def bench_getitem(size):
+    doc = make_nested_dict(random.Random(size), size, 2)
+    key = u'.'.join([u'k1'] * size)
+    return lambda: getitem(doc, key)
+
+@benchmark(u'utils.setitem', sizes=(3, 10))
+def bench_setitem(size):
+    doc = make_nested_dict(random.Random(size), size, 2)
+    key = u'.'.join([u'k1'] * size)
+    return lambda: setitem(doc, key, 1)
+
+@benchmark(u'utils.walk', sizes=(4, 8))
+def bench_walk(size):
+    doc = make_nested_dict(random.Random(size), size, 3)
+    return lambda: list(walk(doc))
+
+@benchmark(u'utils.update_recursive', sizes=(4, 8))
+def bench_update_recursive(size):
+    rnd = random.Random(size)
+    doc, update = make_nested_dict(rnd, size, 3), make_nested_dict(rnd, size, 2)
+    return lambda: update_recursive(doc, update)
+
+@benchmark(u'utils.map_dict', sizes=(4, 8))
+def bench_map_dict(size):
+    doc = make_nested_dict(random.Random(size), size, 3)
+    return lambda: map_dict(doc, lambda key, value: (key.encode(u'utf-8'), value))
+
+
+# Adapter and converter benchmarks
+# --------------------------------
+
+@benchmark(u'dotnotationadapter.get', sizes=(3, 10))
+def bench_dot_notation_get(size):
+    adapter = DotNotationAdapter(make_nested_dict(random.Random(size), size, 2))
+    key = u'.'.join([u'k0'] * size)
+    return lambda: adapter[key]
+
+@benchmark(u'dotnotationadapter.set', sizes=(3, 10))
+def bench_dot_notation_set(size):
+    adapter = DotNotationAdapter()
+    key = u'.'.join([u'k0'] * size)
+    def run():
+        adapter[key] = 42
+    return run
+
+@benchmark(u'objectmappingadapter.getattr', sizes=(3, 10))
+def bench_object_mapping(size):
+    adapter = ObjectMappingAdapter(make_nested_dict(random.Random(size), size, 2))
+    def run():
+        obj = adapter
+        for i in range(size):
+            obj = obj.k0
+    return run
+
+@benchmark(u'converter.from_schema', sizes=(10, 100))
+def bench_converter_from_schema(size):
+    converter = Converter(rename=[(u'field_0', u'renamed')])
+    doc = make_flat_doc(random.Random(size), size)
+    return lambda: converter.from_schema(doc)
+
+@benchmark(u'converter.to_schema', sizes=(10, 100))
+def bench_converter_to_schema(size):
+    converter = Converter(rename=[(u'field_0', u'renamed')])
+    doc = converter.from_schema(make_flat_doc(random.Random(size), size))
+    return lambda: converter.to_schema(doc)
+
+
+# Sorted dictionary benchmarks
+# ----------------------------
+
+def make_scores(size):
+    """ Return a dictionary of `size` scores by player and a list of 10
+    score updates.
+    """
+    scores = dict((u'player%d' % i, i % 1000) for i in range(size))
+    updates = [(u'player%d' % ((i * 7919) % size), (i * 104729) % 1000) for i in range(10)]
+    return scores, updates
+
+@benchmark(u'valuesorteddict.top10', sizes=(100, 10000))
+def bench_value_sorted_dict_top10(size):
+    plain, updates = make_scores(size)
+    scores = ValueSortedDict(plain)
+
+    def top10():
+        for key, value in updates:
+            scores[key] = value
+            list(scores.islice(stop=10, reverse=True))
+    return top10
+
+@benchmark(u'valuesorteddict.top10.sorted', sizes=(100, 10000))
+def bench_sorted_top10(size):
+    # The same leaderboard with a plain dictionary, sorted for each read
+    scores, updates = make_scores(size)
+
+    def top10():
+        for key, value in updates:
+            scores[key] = value
+            sorted(scores.iteritems(), key=operator.itemgetter(1, 0))[-10:]
+    return top10
+
+bound(u'valuesorteddict.top10[10000]', u'valuesorteddict.top10.sorted[10000]', 1)
+
+@benchmark(u'sorteddict.irange', sizes=(1000, 100000))
+def bench_sorted_dict_irange(size):
+    d = SortedDict((i * 3, i) for i in range(size))
+    return lambda: list(d.irange(1500, 1800, inclusive=(True, False)))
+
+@benchmark(u'sorteddict.irange.sorted', sizes=(1000, 100000))
+def bench_sorted_irange(size):
+    # The same range read from a plain dictionary, sorted for each read
+    plain = dict((i * 3, i) for i in range(size))
+    return lambda: [key for key, value in sorted(plain.iteritems()) if 1500 <= key < 1800]
+
+bound(u'sorteddict.irange[100000]', u'sorteddict.irange.sorted[100000]', 1)
+
+@benchmark(u'sorteddict.setitem', sizes=(1000, 100000))
+def bench_sorted_dict_setitem(size):
+    d = SortedDict((i * 3, i) for i in range(size))
+    keys = range(1, 3000, 3)
+    return lambda: [d.__setitem__(key, key) for key in keys]
+
+
+# Bidirectional dictionary benchmarks
+# -----------------------------------
+
+@benchmark(u'bidict.construct', sizes=(100, 10000))
+def bench_bidict_construct(size):
+    pairs = [(i, u'slug-%d' % i) for i in range(size)]
+    return lambda: BiDict(pairs)
+
+@benchmark(u'bidict.construct.two_dicts', sizes=(100, 10000))
+def bench_two_dicts_construct(size):
+    pairs = [(i, u'slug-%d' % i) for i in range(size)]
+
+    def two_dicts():
+        forward, backward = {}, {}
+        for key, value in pairs:
+            forward[key] = value
+            backward[value] = key
+    return two_dicts
+
+@benchmark(u'bidict.inverse', sizes=(100, 10000))
+def bench_bidict_inverse(size):
+    d = BiDict((i, u'slug-%d' % i) for i in range(size))
+    values = d.values()
+    return lambda: [d.inverse[value] for value in values]
+
+# Bulk construction is not slower than filling two dictionaries by hand
+bound(u'bidict.construct[10000]', u'bidict.construct.two_dicts[10000]', 1)
+
+
+# Document collection benchmarks
+# ------------------------------
+
+@benchmark(u'documentcollection.insert.sorted', sizes=(10000, 40000))
+def bench_collection_insert_sorted(size):
+    # Inserting documents in random order into a sorted index
+    schema = Schema({u'year': IntField()})
+    docs = [{u'year': (i * 7919) % size} for i in range(size)]
+
+    def insert():
+        collection = DocumentCollection(schema)
+        collection.create_index(u'year')
+        for doc in docs:
+            collection.insert(doc)
+    return insert
+
+# Inserting is logarithmic; a flat sorted list makes it linear, so that
+# loading takes about 16 times as long for 4 times the documents
+bound(u'documentcollection.insert.sorted[40000]', u'documentcollection.insert.sorted[10000]', 6)
+
+def make_collection_docs(size):
+    """ Return a schema and `size` documents with a year out of 100 and a
+    nested author id out of 1000.
+    """
+    schema = Schema({u'year': IntField(), u'info': {u'author': {u'id': IntField()}}})
+    return schema, [{u'year': 1900 + i % 100, u'info': {u'author': {u'id': i % 1000}}}
+                    for i in range(size)]
+
+@benchmark(u'documentcollection.find', sizes=(1000, 100000))
+def bench_collection_find(size):
+    schema, docs = make_collection_docs(size)
+    collection = DocumentCollection(schema, docs)
+    collection.create_index(u'info.author.id', kind=u'hash')
+    return lambda: collection.find(u'info.author.id', 7)
+
+@benchmark(u'documentcollection.find.scan', sizes=(1000, 100000))
+def bench_collection_find_by_scanning(size):
+    schema, docs = make_collection_docs(size)
+    return lambda: [doc for doc in docs if getitem(doc, u'info.author.id') == 7]
+
+@benchmark(u'documentcollection.find_range', sizes=(1000, 100000))
+def bench_collection_find_range(size):
+    schema, docs = make_collection_docs(size)
+    collection = DocumentCollection(schema, docs)
+    collection.create_index(u'year')
+    return lambda: collection.find_range(u'year', 1950, 1951)
+
+@benchmark(u'documentcollection.find_range.scan', sizes=(1000, 100000))
+def bench_collection_find_range_by_scanning(size):
+    schema, docs = make_collection_docs(size)
+    return lambda: [doc for doc in docs if 1950 <= getitem(doc, u'year') <= 1951]
+
+@benchmark(u'documentcollection.set', sizes=(1000, 100000))
+def bench_collection_set(size):
+    # Moving a document between two keys of a sorted index
+    schema, docs = make_collection_docs(size)
+    collection = DocumentCollection(schema, docs)
+    collection.create_index(u'year')
+    years = itertools.cycle([1960, 1961])
+    return lambda: collection.set(5, u'year', next(years))
+
+# Both indexes return the 0.1% and 2% of the documents they find without
+# looking at the others
+bound(u'documentcollection.find[100000]', u'documentcollection.find.scan[100000]', 0.01)
+bound(u'documentcollection.find_range[100000]', u'documentcollection.find_range.scan[100000]', 0.1)
+# Updating a sorted index does not depend on the number of documents
+bound(u'documentcollection.set[100000]', u'documentcollection.set[1000]', 2)
+
+
+# Binary codec benchmarks
+# ------------------------
+
+def make_codec_docs(size):
+    """ Return a schema and `size` documents with fields of each type
+    supported by `BinaryCodec`.
+    """
+    schema = Schema({
+        u'id': IntField(),
+        u'name': UnicodeField(),
+        u'score': FloatField(),
+        u'tags': ListField(UnicodeField()),
+        u'position': {u'x': IntField(), u'y': IntField()},
+    })
+    return schema, [{u'id': i, u'name': u'name%d' % i, u'score': i / 3.0,
+                     u'tags': [u'a', u'b'], u'position': {u'x': i, u'y': -i}}
+                    for i in range(size)]
+
+@benchmark(u'binarycodec.encode', sizes=(10, 1000))
+def bench_binary_encode(size):
+    schema, docs = make_codec_docs(size)
+    codec = BinaryCodec(schema)
+    return lambda: [codec.encode(doc) for doc in docs]
+
+@benchmark(u'binarycodec.encode.json', sizes=(10, 1000))
+def bench_json_encode(size):
+    schema, docs = make_codec_docs(size)
+    return lambda: [json.dumps(schema.to_json(doc)) for doc in docs]
+
+@benchmark(u'binarycodec.decode', sizes=(10, 1000))
+def bench_binary_decode(size):
+    schema, docs = make_codec_docs(size)
+    codec = BinaryCodec(schema)
+    data = [codec.encode(doc) for doc in docs]
+    return lambda: [codec.decode(d) for d in data]
+
+@benchmark(u'binarycodec.decode.json', sizes=(10, 1000))
+def bench_json_decode(size):
+    schema, docs = make_codec_docs(size)
+    data = [json.dumps(schema.to_json(doc)) for doc in docs]
+    return lambda: [schema.from_json(json.loads(d)) for d in data]
+
+# Encoding skips to_json() and the key names; decoding in Python keeps up
+# with the C JSON parser followed by from_json()
+bound(u'binarycodec.encode[1000]', u'binarycodec.encode.json[1000]', 1)
+bound(u'binarycodec.decode[1000]', u'binarycodec.decode.json[1000]', 1.5)
+
+
+# Document store benchmarks
+# -------------------------
+
+def make_store(name, size, binary):
+    """ Return a new `DocumentStore` in a temporary directory, which is
+    removed on exit, and `size` `(doc_id, doc)` tuples to store.
+    """
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    schema = Schema({u'id': IntField(), u'name': UnicodeField(),
+                     u'tags': ListField(UnicodeField())})
+    docs = [(unicode(i), {u'id': i, u'name': u'name%d' % i, u'tags': [u'a', u'b']})
+            for i in range(size)]
+    store = DocumentStore(os.path.join(directory, name), schema,
+                          codec=BinaryCodec(schema) if binary else None)
+    return store, docs
+
+@benchmark(u'documentstore.append_many', sizes=(100, 10000))
+def bench_store_append_many(size):
+    # Documents are flushed to disk with fsync() every 1000 documents
+    store, docs = make_store(u'append.db', size, False)
+    return lambda: store.append_many(docs)
+
+@benchmark(u'documentstore.append_many.binary', sizes=(100, 10000))
+def bench_store_append_many_binary(size):
+    store, docs = make_store(u'append.db', size, True)
+    return lambda: store.append_many(docs)
+
+@benchmark(u'documentstore.get', sizes=(100, 10000))
+def bench_store_get(size):
+    store, docs = make_store(u'get.db', size, False)
+    store.append_many(docs)
+    return lambda: [store[doc_id][u'name'] for doc_id, doc in docs]
+
+@benchmark(u'documentstore.get.binary', sizes=(100, 10000))
+def bench_store_get_binary(size):
+    store, docs = make_store(u'get.db', size, True)
+    store.append_many(docs)
+    return lambda: [store[doc_id][u'name'] for doc_id, doc in docs]
+
+@benchmark(u'documentstore.scan', sizes=(100, 10000))
+def bench_store_scan(size):
+    store, docs = make_store(u'scan.db', size, False)
+    store.append_many(docs)
+    return lambda: list(store.scan())
+
+
+# Runner
+# ------
+
+def time_function(function, repeat=5, min_time=0.05):
+    """ Return the minimum and median time per call of `function`, which is
+    called often enough for each of the `repeat` measurements to take at
+    least `min_time` seconds.
+    """
+    number = 1
+    while True:
+        t = timeit.Timer(function).timeit(number)
+        if t >= min_time or number >= 10 ** 6:
+            break
+        number *= 10 if t < min_time / 10 else 2
+    times = sorted(timeit.Timer(function).repeat(repeat, number))
+    return {u'min': times[0] / number,
+            u'median': times[len(times) // 2] / number,
+            u'number': number,
+            u'repeat': repeat}
+
+def run_benchmarks(pattern=None, repeat=5, min_time=0.05, out=None):
+    """ Run all benchmarks whose names contain `pattern` and return the
+    results as a JSON-encodable dictionary.
+
+    :param out: An optional file to report progress to.
+    """
+    results = {}
+    for name, sizes, function in BENCHMARKS:
+        for size in sizes:
+            full_name = u'%s[%d]' % (name, size)
+            if pattern and pattern not in full_name:
+                continue
+            results[full_name] = time_function(function(size), repeat, min_time)
+            if out is not None:
+                out.write(u'%-40s %12.3fus\n' % (full_name, results[full_name][u'min'] * 1e6))
+    return {u'python': platform.python_version(),
+            u'platform': platform.platform(),
+            u'results': results}
+
+def check_bounds(results, bounds=BOUNDS):
+    """ Return a list of `(name, reference, bound, measured)` tuples for
+    all bounds violated by the result dictionary `results` of
+    `run_benchmarks()`. `measured` is the time of `name` in seconds or
+    relative to the time of `reference`. Bounds of benchmarks missing in
+    `results` are skipped.
+    """
+    times = dict((name, result[u'min']) for name, result in results[u'results'].iteritems())
+    violated = []
+    for name, reference, factor in bounds:
+        if name not in times or (reference is not None and reference not in times):
+            continue
+        measured = times[name] / times[reference] if reference is not None else times[name]
+        if measured > factor:
+            violated.append((name, reference, factor, measured))
+    return violated
+
+def compare_results(baseline, current, threshold=0.1):
+    """ Compare the minimum times of two result dictionaries of
+    `run_benchmarks()`.
+
+    :return: A list of `(name, baseline time, current time, ratio)` tuples
+    for benchmarks slower than the baseline by more than `threshold`, and a
+    list of all tuples, both sorted by name.
+    """
+    rows = []
+    for name in sorted(set(baseline[u'results']) & set(current[u'results'])):
+        before = baseline[u'results'][name][u'min']
+        after = current[u'results'][name][u'min']
+        rows.append((name, before, after, after / before if before else float(u'inf')))
+    regressions = [row for row in rows if row[3] > 1 + threshold]
+    return regressions, rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'Run or compare dictlib benchmarks.')
+    subparsers = parser.add_subparsers(dest=u'command')
+    run_parser = subparsers.add_parser(u'run', help=u'run the benchmarks')
+    run_parser.add_argument(u'-o', u'--output', help=u'write JSON results to this file')
+    run_parser.add_argument(u'-k', u'--filter', help=u'only run benchmarks containing this string')
+    run_parser.add_argument(u'--repeat', type=int, default=5)
+    run_parser.add_argument(u'--min-time', type=float, default=0.05)
+    compare_parser = subparsers.add_parser(u'compare', help=u'compare results to a baseline')
+    compare_parser.add_argument(u'baseline')
+    compare_parser.add_argument(u'results')
+    compare_parser.add_argument(u'--threshold', type=float, default=0.1,
+                                help=u'relative slowdown to tolerate as noise (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.command == u'run':
+        results = run_benchmarks(args.filter, args.repeat, args.min_time, out=sys.stdout)
+        if args.output:
+            with open(args.output, u'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        current = json.load(f)
+    regressions, rows = compare_results(baseline, current, args.threshold)
+    for name, before, after, ratio in rows:
+        flag = u'REGRESSION' if ratio > 1 + args.threshold else \
+            u'improved' if ratio < 1 - args.threshold else u''
+        print u'%-40s %12.3fus %12.3fus %6.2fx %s' % (name, before * 1e6, after * 1e6, ratio, flag)
+    print u'%d benchmarks compared, %d regressions' % (len(rows), len(regressions))
+    violated = check_bounds(current)
+    for name, reference, factor, measured in violated:
+        if reference is None:
+            print u'BOUND VIOLATED: %s takes %.6fs, bound is %.6fs' % (name, measured, factor)
+        else:
+            print u'BOUND VIOLATED: %s takes %.2fx the time of %s, bound is %.2fx' % (
+                name, measured, reference, factor)
+    return 1 if regressions or violated else 0
+
+if __name__ == u'__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from tests.allocations import OPERATIONS, measure_allocations, measure_operations, \
+    load_budgets, check_budgets
+import unittest
+
+
+class TestAllocationBudgets(unittest.TestCase):
+    def test_operations_stay_within_budgets(self):
+        budgets = load_budgets()
+        exceeded = check_budgets(measure_operations(), budgets)
+
+        self.assertEquals([], [u'%s: %s allocates %.2f per call, budget is %.2f' % row
+                               for row in exceeded])
+
+    def test_all_operations_have_a_budget(self):
+        measured_meters = measure_allocations(lambda: None, number=10, calls=True).keys()
+        budgets = load_budgets()
+        for meter in measured_meters:
+            if meter in budgets:
+                self.assertEquals(sorted(name for name, function in OPERATIONS),
+                                  sorted(budgets[meter]))
+
+    def test_retained_objects_are_counted(self):
+        self.assertEquals(0, round(measure_allocations(lambda: 1)[u'gc_objects']))
+        self.assertEquals(2, round(measure_allocations(lambda: [[]])[u'gc_objects']))
+
+    def test_calls_are_counted_on_request(self):
+        function = lambda: len([x for x in {}.copy().keys()])
+        self.assertFalse(u'calls' in measure_allocations(function, number=10))
+
+        measurements = measure_allocations(function, calls=True)
+        self.assertEquals(0, round(measurements[u'gc_objects']))
+        self.assertEquals(3, round(measurements[u'calls']))
+        self.assertEquals(4, round(measure_allocations(lambda: list(x for x in (1, 2, 3)),
+                                                       calls=True)[u'calls']))
+
+    def test_check_budgets(self):
+        measurements = {u'gc_objects': {u'a': 1.0, u'b': 3.0, u'c': 5.0}}
+        budgets = {u'gc_objects': {u'a': 1.0, u'b': 2.0}, u'blocks': {u'a': 0.0}}
+
+        self.assertEquals([(u'gc_objects', u'b', 2.0, 3.0)], check_budgets(measurements, budgets))
+
+    def test_calls_are_checked_relative_to_the_budget(self):
+        measurements = {u'calls': {u'a': 105.0, u'b': 115.0, u'c': 1.5}}
+        budgets = {u'calls': {u'a': 100.0, u'b': 100.0, u'c': 1.0}}
+
+        self.assertEquals([(u'calls', u'b', 100.0, 115.0), (u'calls', u'c', 1.0, 1.5)],
+                          check_budgets(measurements, budgets))
+
+
+if __name__ == u'__main__':
+    unittest.main()
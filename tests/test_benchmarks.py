@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from tests.benchmarks import BENCHMARKS, BOUNDS, run_benchmarks, compare_results, \
+    check_bounds
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_all_benchmarks_run(self):
+        for name, sizes, function in BENCHMARKS:
+            function(sizes[0])()
+
+    def test_run_benchmarks_returns_results_by_name(self):
+        results = run_benchmarks(u'utils.getitem[3]', repeat=1, min_time=0.001)
+
+        self.assertEquals([u'utils.getitem[3]'], results[u'results'].keys())
+        self.assertTrue(results[u'results'][u'utils.getitem[3]'][u'min'] > 0)
+
+    def test_compare_results_flags_regressions_beyond_threshold(self):
+        baseline = {u'results': {u'a': {u'min': 1.0}, u'b': {u'min': 1.0}, u'c': {u'min': 1.0}}}
+        current = {u'results': {u'a': {u'min': 1.05}, u'b': {u'min': 1.5}, u'd': {u'min': 1.0}}}
+
+        regressions, rows = compare_results(baseline, current, threshold=0.1)
+        self.assertEquals([u'b'], [row[0] for row in regressions])
+        self.assertEquals([u'a', u'b'], [row[0] for row in rows])
+
+    def test_check_bounds(self):
+        results = {u'results': {u'a': {u'min': 1.0}, u'b': {u'min': 3.0}, u'c': {u'min': 0.5}}}
+        bounds = [(u'a', u'b', 0.5), (u'b', u'a', 2.0), (u'c', None, 1.0),
+                  (u'b', None, 2.0), (u'a', u'd', 1.0)]
+
+        self.assertEquals([(u'b', u'a', 2.0, 3.0), (u'b', None, 2.0, 3.0)],
+                          check_bounds(results, bounds))
+
+    def test_bounds_refer_to_benchmarks(self):
+        names = set(u'%s[%d]' % (name, size) for name, sizes, function in BENCHMARKS
+                    for size in sizes)
+        for name, reference, factor in BOUNDS:
+            self.assertTrue(name in names, name)
+            self.assertTrue(reference is None or reference in names, reference)
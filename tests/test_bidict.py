@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.bidict import BiDict
+from dictlib.mapping import DotNotationAdapter, ObjectMappingAdapter
+import unittest
+
+
+class TestBiDict(unittest.TestCase):
+    def test_forward_and_inverse_lookup(self):
+        d = BiDict({1: u'emil', 2: u'pippi'})
+
+        self.assertEquals(u'emil', d[1])
+        self.assertEquals(2, d.inverse[u'pippi'])
+        self.assertTrue(d.inverse.inverse is d)
+        self.assertEquals(BiDict([(u'emil', 1), (u'pippi', 2)]), d.inverse)
+
+    def test_bulk_construction_rejects_duplicate_values(self):
+        self.assertRaises(ValueError, BiDict, [(1, u'a'), (2, u'a')])
+        self.assertEquals({1: u'b'}, BiDict([(1, u'a'), (1, u'b')]).doc)
+
+    def test_inverse_is_a_live_view(self):
+        d = BiDict()
+        inverse = d.inverse
+        d[1] = u'a'
+        inverse[u'b'] = 2
+
+        self.assertEquals(1, inverse[u'a'])
+        self.assertEquals(u'b', d[2])
+        del inverse[u'a']
+        self.assertFalse(1 in d)
+        self.assertEquals(1, len(d))
+
+    def test_overwrite_evicts_old_inverse_entry(self):
+        d = BiDict({1: u'a'})
+        d[1] = u'b'
+
+        self.assertEquals({u'b': 1}, d.inverse.doc)
+        d[1] = u'b'
+        self.assertEquals({1: u'b'}, d.doc)
+
+    def test_duplicate_value_raises_error_unless_forced(self):
+        d = BiDict({1: u'a', 2: u'b'})
+
+        self.assertRaises(ValueError, d.__setitem__, 2, u'a')
+        self.assertEquals({1: u'a', 2: u'b'}, d.doc)
+        d.forceput(2, u'a')
+        self.assertEquals({2: u'a'}, d.doc)
+        self.assertEquals({u'a': 2}, d.inverse.doc)
+
+    def test_dict_methods(self):
+        d = BiDict({1: u'a'})
+        d.update({2: u'b'})
+        copy = d.copy()
+
+        self.assertEquals(u'b', d.pop(2))
+        self.assertFalse(u'b' in d.inverse)
+        self.assertEquals(u'b', copy[2])
+        self.assertEquals(2, copy.inverse[u'b'])
+        d.clear()
+        self.assertEquals(0, len(d.inverse))
+
+    def test_works_with_adapters(self):
+        d = BiDict({u'a': 1})
+
+        self.assertEquals(1, ObjectMappingAdapter(d).a)
+        DotNotationAdapter(d)[u'b'] = 2
+        self.assertEquals(u'b', d.inverse[2])
+        self.assertEquals(u'a', ObjectMappingAdapter(d.inverse)[1])
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.binary import BinaryCodec, BinaryFormatError
+from dictlib.exceptions import SchemaFieldNotFound
+from dictlib.schema import Schema, UnicodeField, IntField, LongField, \
+    FloatField, ListField, UuidField, EnumField, NoneField, DatetimeField, \
+    DateField, TimeField, AnyField
+import array
+import datetime
+import struct
+import unittest
+import uuid
+
+
+class TestBinaryCodec(unittest.TestCase):
+    def setUp(self):
+        class BookSchema(Schema):
+            schema = {
+                u'title': UnicodeField(),
+                u'year': IntField(optional=True),
+                u'copies': LongField(),
+                u'price': FloatField(can_be_none=True),
+                u'id': UuidField(),
+                u'state': EnumField([u'draft', u'published']),
+                u'nothing': NoneField(),
+                u'created': DatetimeField(),
+                u'day': DateField(),
+                u'time': TimeField(),
+                u'author': {u'name': UnicodeField(), u'größe': IntField()},
+                u'tags': ListField(UnicodeField()),
+                u'mixed': ListField([IntField(), UnicodeField(can_be_none=True)]),
+                u'samples': ListField(FloatField(), storage=u'array'),
+                u'extra': {unicode: IntField(can_be_none=True)},
+                u'any': AnyField(),
+            }
+        self.schema = BookSchema()
+        self.codec = BinaryCodec(self.schema, version=3)
+        self.doc = {
+            u'title': u'Kästner',
+            u'copies': 10 ** 30,
+            u'price': None,
+            u'id': uuid.uuid4(),
+            u'state': u'published',
+            u'nothing': None,
+            u'created': datetime.datetime(2011, 5, 4, 3, 2, 1, 123456),
+            u'day': datetime.date(1899, 2, 23),
+            u'time': datetime.time(23, 59, 58, 999999),
+            u'author': {u'name': u'Erich', u'größe': 170},
+            u'tags': [u'a', u'ß'],
+            u'mixed': [1, u'x', None],
+            u'samples': array.array('d', [1.5, 2.5]),
+            u'extra': {u'a': 1, u'ö': None},
+            u'any': {u'nested': [1, 2]},
+        }
+
+    def test_round_trip(self):
+        data = self.codec.encode(self.doc)
+
+        self.assertEquals(str, type(data))
+        self.assertEquals(self.doc, self.codec.decode(data))
+
+    def test_decode_from_memoryview_and_bytearray(self):
+        data = self.codec.encode(self.doc)
+
+        self.assertEquals(self.doc, self.codec.decode(memoryview(data)))
+        self.assertEquals(self.doc, self.codec.decode(bytearray(data)))
+
+    def test_decode_from_offset(self):
+        first = self.codec.encode(self.doc)
+        data = first + self.codec.encode({u'title': u'b', u'copies': 1, u'price': 1.0,
+                                          u'id': self.doc[u'id'], u'state': u'draft'})
+
+        doc, offset = self.codec.decode_from(data)
+        self.assertEquals(self.doc, doc)
+        self.assertEquals(len(first), offset)
+        doc, offset = self.codec.decode_from(data, offset)
+        self.assertEquals(u'b', doc[u'title'])
+        self.assertEquals(len(data), offset)
+
+    def test_missing_optional_keys_stay_missing(self):
+        doc = {u'title': u'a', u'tags': []}
+
+        self.assertEquals(doc, self.codec.decode(self.codec.encode(doc)))
+
+    def test_encoding_is_smaller_than_json(self):
+        import json
+        doc = {u'title': u'a', u'year': 2011, u'tags': [u'x', u'y'],
+               u'author': {u'name': u'b', u'größe': 180}}
+
+        self.assertTrue(len(self.codec.encode(doc)) <
+                        len(json.dumps(self.schema.to_json(doc))))
+
+    def test_unknown_key_raises_error(self):
+        self.assertRaises(SchemaFieldNotFound, self.codec.encode, {u'unknown': 1})
+
+    def test_version_mismatch_raises_error(self):
+        data = self.codec.encode(self.doc)
+
+        self.assertRaises(BinaryFormatError, BinaryCodec(self.schema, version=4).decode, data)
+        self.assertRaises(BinaryFormatError, self.codec.decode, 'XYZ' + data[3:])
+        self.assertRaises(BinaryFormatError, self.codec.decode, 'DL')
+
+    def test_truncated_data_raises_error(self):
+        data = self.codec.encode(self.doc)
+
+        self.assertRaises(BinaryFormatError, self.codec.decode, data[:-5])
+
+    def test_packed_arrays_are_little_endian_with_explicit_widths(self):
+        schema = Schema({u'ints': ListField(IntField(), storage=u'array'),
+                         u'floats': ListField(FloatField(), storage=u'array')})
+        codec = BinaryCodec(schema)
+        doc = {u'ints': array.array('l', [1, -2]), u'floats': array.array('d', [0.5])}
+
+        data = codec.encode(doc)
+
+        self.assertTrue(struct.pack('<I2q', 2, 1, -2) in data)
+        self.assertTrue(struct.pack('<Id', 1, 0.5) in data)
+        self.assertEquals(doc, codec.decode(data))
+        self.assertEquals(doc, codec.decode(codec.encode({u'ints': [1, -2],
+                                                          u'floats': [0.5]})))
+
+    def test_list_elements_are_encoded_with_the_first_valid_field(self):
+        schema = Schema({u'values': ListField([EnumField([u'a', u'b']), UnicodeField()]),
+                         u'state': EnumField([u'a'])})
+        codec = BinaryCodec(schema)
+        doc = {u'values': [u'b', u'c', u'a']}
+
+        self.assertEquals(doc, codec.decode(codec.encode(doc)))
+        self.assertRaises(ValueError, codec.encode, {u'state': u'b'})
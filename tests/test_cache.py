@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.cache import ValidationCache
+from dictlib.exceptions import ValidationError
+from dictlib.schema import Schema, UnicodeField, IntField, ListField, DictField
+import unittest
+
+
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'author': {u'name': UnicodeField(), u'age': IntField()},
+            u'books': ListField({u'title': UnicodeField(),
+                                 u'author': {u'name': UnicodeField(),
+                                             u'age': IntField()}}),
+        })
+        author = {u'name': u'lemmy', u'age': 70}
+        self.doc = {u'author': author,
+                    u'books': [{u'title': u'a', u'author': dict(author)},
+                               {u'title': u'b', u'author': dict(author)}]}
+
+    def test_repeated_subdocuments_are_validated_once(self):
+        cache = ValidationCache()
+
+        self.schema.validate(self.doc, cache=cache)
+        misses = cache.misses
+        # The authors of both books are equal to the author of the document,
+        # and the schema fields of all authors are a single shared field
+        self.assertEquals(2, cache.hits)
+
+        self.schema.validate(self.doc, cache=cache)
+        self.assertEquals(3, cache.hits)
+        self.assertEquals(misses, cache.misses)
+
+        # Equal sub-documents in another document are cache hits
+        self.schema.validate({u'author': {u'name': u'lemmy', u'age': 70},
+                              u'books': []}, cache=cache)
+        self.assertEquals(4, cache.hits)
+
+    def test_modified_documents_are_validated_again(self):
+        cache = ValidationCache()
+        self.schema.validate(self.doc, cache=cache)
+
+        self.doc[u'books'][1][u'author'][u'age'] = u'seventy'
+        self.assertRaises(ValidationError, self.schema.validate, self.doc, cache=cache)
+        self.assertFalse(self.schema.is_valid(self.doc, cache=cache))
+
+    def test_values_of_different_types_are_distinguished(self):
+        cache = ValidationCache()
+        schema = Schema({u'a': {u'b': IntField()}})
+
+        self.assertTrue(schema.is_valid({u'a': {u'b': 1}}, cache=cache))
+        self.assertFalse(schema.is_valid({u'a': {u'b': 1.0}}, cache=cache))
+        self.assertFalse(schema.is_valid({u'a': {u'b': True, u'c': 1}}, cache=cache))
+
+    def test_partial_validation_is_cached_separately(self):
+        cache = ValidationCache()
+        doc = {u'author': {u'name': u'lemmy'}}
+
+        self.assertTrue(self.schema.is_partially_valid(doc, cache=cache))
+        self.assertFalse(self.schema.is_valid(doc, cache=cache))
+
+    def test_fields_validating_without_a_cache_are_supported(self):
+        class PointField(DictField):
+            def validate(self, value, field_name=None, partial=False):
+                super(PointField, self).validate(value, field_name, partial)
+                if value[u'x'] < 0:
+                    raise ValidationError(u'Negative point', field_name, u'x')
+        schema = Schema({u'point': PointField({u'x': IntField()}),
+                         u'points': ListField(PointField({u'x': IntField()}))})
+        cache = ValidationCache()
+
+        self.assertTrue(schema.is_valid({u'point': {u'x': 1}, u'points': [{u'x': 2}]},
+                                        cache=cache))
+        self.assertFalse(schema.is_valid({u'point': {u'x': -1}, u'points': []},
+                                         cache=cache))
+        self.assertFalse(schema.is_valid({u'point': {u'x': 1}, u'points': [{u'x': -2}]},
+                                         cache=cache))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ValidationCache(max_size=2)
+        schema = Schema({u'a': IntField()})
+
+        for i in range(3):
+            schema.validate({u'a': i}, cache=cache)
+        self.assertEquals(2, len(cache))
+
+        schema.validate({u'a': 0}, cache=cache)
+        self.assertEquals(0, cache.hits)
+        schema.validate({u'a': 2}, cache=cache)
+        self.assertEquals(1, cache.hits)
+
+    def test_unhashable_values_are_not_cached(self):
+        cache = ValidationCache()
+        schema = Schema({u'a': {unicode: ListField()}})
+
+        schema.validate({u'a': {u'x': [set()]}}, cache=cache)
+        schema.validate({u'a': {u'x': [set()]}}, cache=cache)
+        self.assertEquals(0, cache.hits)
+        self.assertEquals(0, len(cache))
+
+    def test_clear_removes_entries_and_resets_counters(self):
+        cache = ValidationCache()
+        self.schema.validate(self.doc, cache=cache)
+        self.schema.validate(self.doc, cache=cache)
+
+        cache.clear()
+
+        self.assertEquals((0, 0, 0), (len(cache), cache.hits, cache.misses))
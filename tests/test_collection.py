@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.collection import DocumentCollection
+from dictlib.exceptions import SchemaFieldNotFound
+from dictlib.schema import Schema, UnicodeField, IntField, ListField, \
+    DatetimeField
+import datetime
+import unittest
+
+
+class TestDocumentCollection(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'title': UnicodeField(),
+            u'year': IntField(),
+            u'created': DatetimeField(optional=True),
+            u'tags': ListField(UnicodeField()),
+            u'info': {u'author': {u'id': IntField(), u'name': UnicodeField()}},
+        })
+        self.docs = [
+            {u'title': u'a', u'year': 1931, u'tags': [u'x', u'y'],
+             u'info': {u'author': {u'id': 1, u'name': u'Erich'}}},
+            {u'title': u'b', u'year': 1929, u'tags': [u'y'],
+             u'info': {u'author': {u'id': 2, u'name': u'Astrid'}}},
+            {u'title': u'c', u'year': 1945, u'tags': [],
+             u'info': {u'author': {u'id': 1, u'name': u'Erich'}}},
+        ]
+        self.collection = DocumentCollection(self.schema, self.docs)
+
+    def test_schema_chooses_index_kind(self):
+        c = self.collection
+        c.create_index(u'info.author.id')
+        c.create_index(u'info.author.name')
+        c.create_index(u'tags')
+        c.create_index(u'created')
+        c.create_index(u'title', kind=u'sorted')
+
+        self.assertEquals(u'sorted', c.index_kind(u'info.author.id'))
+        self.assertEquals(u'hash', c.index_kind(u'info.author.name'))
+        self.assertEquals(u'hash', c.index_kind(u'tags'))
+        self.assertEquals(u'sorted', c.index_kind(u'created'))
+        self.assertEquals(u'sorted', c.index_kind(u'title'))
+        self.assertEquals(None, c.index_kind(u'year'))
+        try:
+            c.create_index(u'info.unknown')
+            self.fail()
+        except SchemaFieldNotFound as e:
+            self.assertEquals(u'Path info.unknown not defined in schema', unicode(e))
+        self.assertRaises(ValueError, c.create_index, u'year', kind=u'btree')
+
+    def test_find_with_and_without_index(self):
+        c = self.collection
+        for path, value, expected in [(u'info.author.name', u'Erich', [0, 2]),
+                                      (u'info.author.id', 2, [1]),
+                                      (u'tags', u'y', [0, 1]),
+                                      (u'title', u'z', [])]:
+            self.assertEquals(expected, c.find_ids(path, value))
+            c.create_index(path)
+            self.assertEquals(expected, c.find_ids(path, value))
+
+        self.assertEquals([self.docs[1]], c.find(u'info.author.id', 2))
+
+    def test_find_range(self):
+        c = self.collection
+        self.assertEquals([1, 0], c.find_range_ids(u'year', 1900, 1940))
+        c.create_index(u'year')
+
+        self.assertEquals([1, 0], c.find_range_ids(u'year', 1900, 1940))
+        self.assertEquals([1, 0, 2], c.find_range_ids(u'year'))
+        self.assertEquals([0, 2], c.find_range_ids(u'year', min=1931))
+        self.assertEquals([2], c.find_range_ids(u'year', min=1931, include_min=False))
+        self.assertEquals([1], c.find_range_ids(u'year', max=1931, include_max=False))
+        self.assertEquals([self.docs[0]], c.find_range(u'year', 1931, 1931))
+        self.assertEquals([0], c.find_ids(u'year', 1931))
+
+    def test_indexes_are_updated(self):
+        c = self.collection
+        c.create_index(u'year')
+        c.create_index(u'info.author.id')
+        c.create_index(u'tags')
+
+        doc_id = c.insert({u'title': u'd', u'year': 1931, u'tags': [u'x'],
+                           u'info': {u'author': {u'id': 3, u'name': u'Lisa'}}})
+        self.assertEquals([0, doc_id], c.find_ids(u'year', 1931))
+
+        c.update(0, dict(self.docs[0], year=1932))
+        self.assertEquals([doc_id], c.find_ids(u'year', 1931))
+        self.assertEquals([0], c.find_ids(u'year', 1932))
+
+        c.set(0, u'info.author.id', 3)
+        self.assertEquals([0, doc_id], c.find_ids(u'info.author.id', 3))
+        c.set(0, u'info.author', {u'id': 4, u'name': u'x'})
+        self.assertEquals([0], c.find_ids(u'info.author.id', 4))
+
+        c[1][u'tags'].append(u'z')
+        c.update(1)
+        self.assertEquals([1], c.find_ids(u'tags', u'z'))
+        c[1][u'year'] = 1930
+        c.update(1)
+        self.assertEquals([1], c.find_range_ids(u'year', 1930, 1930))
+        self.assertEquals([], c.find_ids(u'year', 1929))
+
+        c.delete(doc_id)
+        self.assertEquals([], c.find_ids(u'year', 1931))
+        self.assertEquals([], c.find_ids(u'info.author.id', 3))
+        self.assertFalse(doc_id in c)
+        self.assertEquals(3, len(c))
+
+    def test_keys_of_dictionaries_in_lists_are_indexed(self):
+        schema = Schema({u'items': ListField({u'sku': UnicodeField(), u'n': IntField()})})
+        c = DocumentCollection(schema, [
+            {u'items': [{u'sku': u'a', u'n': 1}, {u'sku': u'b', u'n': 5}]},
+            {u'items': [{u'sku': u'b', u'n': 2}]},
+            {u'items': []},
+        ])
+        self.assertEquals([0, 1], c.find_ids(u'items.sku', u'b'))
+        c.create_index(u'items.sku')
+        c.create_index(u'items.n')
+
+        self.assertEquals(u'hash', c.index_kind(u'items.sku'))
+        self.assertEquals(u'sorted', c.index_kind(u'items.n'))
+        self.assertEquals([0, 1], c.find_ids(u'items.sku', u'b'))
+        self.assertEquals([1, 0], c.find_range_ids(u'items.n', 2, 5))
+        doc_id = c.insert({u'items': [{u'sku': u'c', u'n': 3}]})
+        self.assertEquals([doc_id], c.find_ids(u'items.sku', u'c'))
+
+        c.set(1, u'items.0.sku', u'c')
+        self.assertEquals([1, doc_id], c.find_ids(u'items.sku', u'c'))
+        self.assertEquals([0], c.find_ids(u'items.sku', u'b'))
+        self.assertRaises(SchemaFieldNotFound, c.create_index, u'items.unknown')
+        self.assertRaises(SchemaFieldNotFound, c.create_index, u'items.sku.x')
+
+    def test_insert_with_id(self):
+        c = DocumentCollection()
+        c.create_index(u'a')
+        c.insert({u'a': 1}, doc_id=u'x')
+
+        self.assertEquals([u'x'], c.find_ids(u'a', 1))
+        self.assertRaises(KeyError, c.insert, {u'a': 2}, doc_id=u'x')
+        self.assertEquals(u'hash', c.index_kind(u'a'))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.convert import JsonSchemaConverter
+from dictlib.schema import Schema, DictField, IntField, FloatField, UnicodeField, \
+    ListField, EnumField, NoneField, AnyField, DatetimeField, EmailField
+import json
+import unittest
+
+
+class Address(DictField):
+    schema = {u'street': UnicodeField(), u'zip': UnicodeField(length=5)}
+
+
+class PersonSchema(Schema):
+    schema = {
+        u'name': UnicodeField(max_len=50, title=u'Name'),
+        u'age': IntField(min=0, can_be_none=True),
+        u'home': Address(),
+        u'work': Address(optional=True),
+        u'tags': ListField(UnicodeField(), max_len=10),
+        u'kind': EnumField([u'private', u'business']),
+    }
+
+
+class TestJsonSchemaConverter(unittest.TestCase):
+    def test_fields(self):
+        converter = JsonSchemaConverter()
+        field_to_json = converter._field_to_json
+
+        self.assertEquals({u'type': u'integer', u'minimum': 0, u'maximum': 9},
+                          field_to_json(IntField(min=0, max=9)))
+        self.assertEquals({u'type': [u'number', u'null']}, field_to_json(FloatField(can_be_none=True)))
+        self.assertEquals({u'type': u'null'}, field_to_json(NoneField()))
+        self.assertEquals({}, field_to_json(AnyField()))
+        self.assertEquals({u'type': u'string', u'format': u'date-time'}, field_to_json(DatetimeField()))
+        self.assertEquals({u'type': u'string', u'minLength': 1, u'pattern': u'^(?:[a-z]+)$'},
+                          field_to_json(UnicodeField(min_len=1, match=u'[a-z]+', full_match=True)))
+        self.assertEquals({u'type': u'string', u'pattern': u'^(?=http://|ftp\\.)'},
+                          field_to_json(UnicodeField(prefixes=(u'http://', u'ftp.'))))
+        self.assertEquals(u'email', field_to_json(EmailField())[u'format'])
+        self.assertEquals({u'enum': [0, 1]}, field_to_json(EnumField([u'a', u'b'], encode_as_int=True)))
+        self.assertEquals({u'type': u'array', u'minItems': 1,
+                           u'items': {u'anyOf': [{u'type': u'integer'}, {u'type': u'string'}]}},
+                          field_to_json(ListField([IntField(), UnicodeField()], min_len=1)))
+        self.assertEquals({u'type': u'integer', u'title': u'Id', u'default': 1},
+                          field_to_json(IntField(title=u'Id', default=1)))
+
+    def test_schema(self):
+        doc = JsonSchemaConverter().to_json(PersonSchema())
+
+        self.assertEquals(u'http://json-schema.org/draft-04/schema#', doc[u'$schema'])
+        self.assertEquals(u'object', doc[u'type'])
+        self.assertEquals(False, doc[u'additionalProperties'])
+        self.assertEquals([u'age', u'home', u'kind', u'name', u'tags'], doc[u'required'])
+        self.assertEquals({u'$ref': u'#/definitions/Address'}, doc[u'properties'][u'home'])
+        self.assertEquals({u'$ref': u'#/definitions/Address'}, doc[u'properties'][u'work'])
+        self.assertEquals([u'Address'], doc[u'definitions'].keys())
+        self.assertEquals([u'street', u'zip'], doc[u'definitions'][u'Address'][u'required'])
+        json.dumps(doc)
+
+    def test_type_keys(self):
+        doc = JsonSchemaConverter().to_json(Schema({unicode: IntField()}))
+
+        self.assertEquals({}, doc[u'properties'])
+        self.assertEquals({u'type': u'integer'}, doc[u'additionalProperties'])
+
+    def test_identical_sub_fields_share_a_definition(self):
+        schema = Schema({u'a': {u'x': IntField()}, u'b': {u'x': IntField()},
+                         u'c': {u'x': FloatField()},
+                         u'd': ListField({u'x': IntField()})})
+        doc = JsonSchemaConverter().to_json(schema)
+
+        self.assertEquals(2, len(doc[u'definitions']))
+        self.assertEquals(doc[u'properties'][u'a'], doc[u'properties'][u'b'])
+        self.assertEquals(doc[u'properties'][u'a'], doc[u'properties'][u'd'][u'items'])
+        self.assertNotEquals(doc[u'properties'][u'a'], doc[u'properties'][u'c'])
+
+    def test_definitions_are_named_by_key(self):
+        schema = Schema({u'author': {u'name': UnicodeField()},
+                         u'publisher': {u'name': UnicodeField(), u'city': UnicodeField()},
+                         u'chapters': ListField({u'title': UnicodeField()})})
+        doc = JsonSchemaConverter().to_json(schema)
+
+        self.assertEquals({u'$ref': u'#/definitions/author'}, doc[u'properties'][u'author'])
+        self.assertEquals({u'$ref': u'#/definitions/publisher'}, doc[u'properties'][u'publisher'])
+        self.assertEquals({u'$ref': u'#/definitions/object'},
+                          doc[u'properties'][u'chapters'][u'items'])
+        self.assertEquals(set([u'author', u'publisher', u'object']), set(doc[u'definitions']))
+
+    def test_annotated_references(self):
+        schema = Schema({u'home': Address(title=u'Home'),
+                         u'work': Address(can_be_none=True)})
+        properties = JsonSchemaConverter().to_json(schema)[u'properties']
+
+        self.assertEquals({u'title': u'Home', u'allOf': [{u'$ref': u'#/definitions/Address'}]},
+                          properties[u'home'])
+        self.assertEquals({u'anyOf': [{u'$ref': u'#/definitions/Address'}, {u'type': u'null'}]},
+                          properties[u'work'])
+
+    def test_inlined_sub_fields(self):
+        doc = JsonSchemaConverter(use_refs=False).to_json(PersonSchema())
+
+        self.assertFalse(u'definitions' in doc)
+        self.assertEquals(u'object', doc[u'properties'][u'home'][u'type'])
+
+    def test_registry_export(self):
+        converter = JsonSchemaConverter()
+        registry = converter.export({u'person': PersonSchema(),
+                                     u'company': Schema({u'address': Address()}),
+                                     u'counter': Schema({u'n': IntField()})})
+
+        self.assertEquals([u'company', u'counter', u'person'], sorted(registry[u'schemas']))
+        self.assertEquals([u'Address'], registry[u'definitions'].keys())
+        self.assertEquals({u'$ref': u'#/definitions/Address'},
+                          registry[u'schemas'][u'company'][u'properties'][u'address'])
+        # Translations are memoized across schemas
+        self.assertTrue(converter.to_json(PersonSchema())[u'properties'][u'tags'] is
+                        registry[u'schemas'][u'person'][u'properties'][u'tags'])
+
+    def test_repeated_registry_export(self):
+        converter = JsonSchemaConverter()
+        schemas = {u'a': Schema({u'outer': {u'inner': Address()}}),
+                   u'b': Schema({u'n': IntField()})}
+        registry = converter.export(schemas)
+
+        self.assertEquals(set([u'outer', u'Address']), set(registry[u'definitions']))
+        self.assertEquals(registry, converter.export(schemas))
+        self.assertTrue(converter.export(schemas)[u'schemas'][u'a'] is registry[u'schemas'][u'a'])
+        self.assertFalse(u'definitions' in converter.to_json(schemas[u'b']))
+
+
+if __name__ == u'__main__':
+    unittest.main()
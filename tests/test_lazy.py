@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.lazy import LazyJsonAdapter, LazyJsonList
+from dictlib.mapping import DotNotationAdapter
+from dictlib.schema import Schema, UnicodeField, DatetimeField, ListField, \
+    IntField, Field, DictField
+import datetime
+import unittest
+
+
+class CountingField(Field):
+    def __init__(self):
+        super(CountingField, self).__init__()
+        self.calls = 0
+
+    def from_json(self, value):
+        self.calls += 1
+        return value
+
+
+class PointField(DictField):
+    schema = {u'x': IntField(), u'y': IntField()}
+
+    def from_json(self, value):
+        return (value['x'], value['y'])
+
+
+class CsvField(ListField):
+    def from_json(self, value):
+        return u','.join(value)
+
+
+class TestLazyJsonAdapter(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'title': UnicodeField(),
+            u'created': DatetimeField(),
+            u'info': {u'author': {u'name': UnicodeField()}},
+            u'tags': ListField(UnicodeField()),
+            u'items': ListField({u'n': IntField()}),
+        })
+        self.json_doc = {
+            'title': 'motörhead',
+            'created': '2012-04-29T12:24:36Z',
+            'info': {'author': {'name': 'lemmy'}},
+            'tags': ['a', 'b'],
+            'items': [{'n': 1}, {'n': 2}],
+        }
+
+    def test_values_are_converted_on_access(self):
+        doc = LazyJsonAdapter(self.schema, self.json_doc)
+
+        self.assertEquals(u'motörhead', doc[u'title'])
+        self.assertEquals(unicode, type(doc[u'title']))
+        self.assertEquals(datetime.datetime(2012, 4, 29, 12, 24, 36), doc[u'created'])
+        self.assertEquals(u'lemmy', doc[u'info'][u'author'][u'name'])
+        self.assertEquals(u'b', doc[u'tags'][1])
+        self.assertEquals(2, doc[u'items'][-1][u'n'])
+
+    def test_values_are_converted_only_once(self):
+        field = CountingField()
+        doc = LazyJsonAdapter(Schema({u'a': field, u'b': CountingField()}),
+                              {'a': 1, 'b': 2})
+
+        self.assertEquals(0, field.calls)
+        doc[u'a']
+        doc[u'a']
+        self.assertEquals(1, field.calls)
+
+    def test_nested_values_are_lazy_views(self):
+        doc = LazyJsonAdapter(self.schema, self.json_doc)
+
+        self.assertTrue(isinstance(doc[u'info'], LazyJsonAdapter))
+        self.assertTrue(isinstance(doc[u'tags'], LazyJsonList))
+        self.assertTrue(isinstance(doc[u'items'][0], LazyJsonAdapter))
+
+    def test_attribute_access(self):
+        doc = LazyJsonAdapter(self.schema, self.json_doc)
+
+        self.assertEquals(u'lemmy', doc.info.author.name)
+        doc.title = u'hello'
+        self.assertEquals(u'hello', doc[u'title'])
+        self.assertRaises(AttributeError, getattr, doc, u'missing')
+
+    def test_dot_notation_access(self):
+        doc = DotNotationAdapter(LazyJsonAdapter(self.schema, self.json_doc))
+
+        self.assertEquals(u'lemmy', doc[u'info.author.name'])
+        self.assertEquals(1, doc[u'items.0.n'])
+
+    def test_modifications_do_not_change_json_doc(self):
+        doc = LazyJsonAdapter(self.schema, self.json_doc)
+
+        doc[u'title'] = u'hello'
+        del doc[u'created']
+        doc[u'tags'].append(u'c')
+
+        self.assertFalse(u'created' in doc)
+        self.assertRaises(KeyError, doc.__getitem__, u'created')
+        self.assertEquals([u'a', u'b', u'c'], doc[u'tags'])
+        self.assertEquals('motörhead', self.json_doc['title'])
+        self.assertEquals(['a', 'b'], self.json_doc['tags'])
+        self.assertTrue('created' in self.json_doc)
+
+    def test_materialize_equals_from_json(self):
+        doc = LazyJsonAdapter(self.schema, self.json_doc)
+        doc[u'info']
+
+        materialized = doc.materialize()
+
+        self.assertEquals(self.schema.from_json(self.json_doc), materialized)
+        self.assertEquals(dict, type(materialized[u'info']))
+        self.assertEquals(list, type(materialized[u'items']))
+        self.assertEquals(dict, type(materialized[u'items'][0]))
+        self.assertEquals(materialized, doc.doc)
+        self.assertTrue(doc.is_materialized)
+
+    def test_overridden_from_json_is_used(self):
+        schema = Schema({u'point': PointField(), u'csv': CsvField(UnicodeField()),
+                         u'tags': ListField(UnicodeField(), title=u'Counted tags')})
+        # Replaced like by ValidationMetrics; the field is shared by schemas
+        tags = schema.get_field(u'tags')
+        tags.from_json = lambda value: len(value)
+        self.addCleanup(delattr, tags, u'from_json')
+        doc = LazyJsonAdapter(schema, {'point': {'x': 1, 'y': 2}, 'csv': ['a', 'b'],
+                                       'tags': ['a', 'b']})
+
+        self.assertEquals((1, 2), doc[u'point'])
+        self.assertEquals(u'a,b', doc[u'csv'])
+        self.assertEquals(2, doc[u'tags'])
+        self.assertEquals(schema.from_json(doc._json_doc), doc.materialize())
+
+
+class TestLazyJsonList(unittest.TestCase):
+    def setUp(self):
+        self.json_list = ['a', 'b', 'c', 'd']
+        self.field = ListField(UnicodeField())
+
+    def test_json_list_is_not_copied(self):
+        items = LazyJsonList(self.field, self.json_list)
+        items[0] = u'z'
+
+        self.assertEquals(u'b', items[1])
+        self.assertTrue(items._json_list is self.json_list)
+
+    def test_behaves_like_a_list(self):
+        items = LazyJsonList(self.field, self.json_list)
+        expected = [u'a', u'b', u'c', u'd']
+        self.assertEquals(u'b', items[1])
+
+        for lst in (items, expected):
+            lst[-1] = u'x'
+            del lst[0]
+            lst.insert(1, u'y')
+            lst.insert(-10, u'first')
+            lst.append(u'last')
+            del lst[::3]
+        self.assertEquals(expected, items.materialize())
+        self.assertEquals(expected[1:], items[1:])
+        self.assertRaises(IndexError, items.__getitem__, len(expected))
+        self.assertRaises(IndexError, items.__setitem__, -len(expected) - 1, u'a')
+        self.assertEquals(['a', 'b', 'c', 'd'], self.json_list)
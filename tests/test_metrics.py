@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.exceptions import ValidationError
+from dictlib.metrics import ValidationMetrics, MemorySink, FileSink, CallbackSink
+from dictlib.schema import Schema, IntField, UnicodeField, ListField
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+class BookSchema(Schema):
+    schema = {
+        u'id': IntField(min=1),
+        u'title': UnicodeField(prefixes=u'The '),
+        u'info': {u'tags': ListField(UnicodeField()), u'pages': IntField(optional=True)},
+    }
+
+
+def make_book(**kwargs):
+    book = {u'id': 1, u'title': u'The Book', u'info': {u'tags': [u'a', u'b', u'c']}}
+    book.update(kwargs)
+    return book
+
+
+class TestValidationErrorAttributes(unittest.TestCase):
+    def assertViolates(self, doc, path, constraint):
+        try:
+            BookSchema().validate(doc)
+            self.fail(u'No ValidationError raised')
+        except ValidationError as e:
+            self.assertEquals((path, constraint), (e.path, e.constraint))
+
+    def test_path_and_constraint(self):
+        self.assertViolates(make_book(id=0), u'id', u'min')
+        self.assertViolates(make_book(id=u'1'), u'id', u'type')
+        self.assertViolates(make_book(title=None), u'title', u'none')
+        self.assertViolates(make_book(title=u'A Book'), u'title', u'prefixes')
+        self.assertViolates(make_book(info={u'tags': [1]}), u'info.tags', u'elements')
+        self.assertViolates(make_book(info={u'tags': [], u'isbn': 1}), u'info.isbn', u'undefined')
+        self.assertViolates(make_book(info={}), u'info.tags', u'required')
+
+    def test_message_is_unchanged(self):
+        e = ValidationError(u'Field x: Value cannot be None', u'x', u'none')
+        self.assertEquals(u'Field x: Value cannot be None', unicode(e))
+
+
+class TestValidationMetrics(unittest.TestCase):
+    def test_counts_calls_and_failures(self):
+        schema = BookSchema()
+        metrics = ValidationMetrics()
+        metrics.install(schema, name=u'books')
+        schema.validate(make_book())
+        self.assertFalse(schema.is_valid(make_book(id=0)))
+        self.assertFalse(schema.is_valid(make_book(id=-1)))
+        self.assertFalse(schema.is_partially_valid({u'title': u'Book'}))
+        schema.from_json({u'id': 1, u'title': u'The Book', u'info': {u'tags': []}})
+        self.assertRaises(Exception, schema.from_json, {u'isbn': 1})
+        books = metrics.snapshot()[u'schemas'][u'books']
+
+        self.assertEquals({u'calls': 4, u'failures': 3}, books[u'validate'])
+        self.assertEquals({u'calls': 2, u'failures': 1}, books[u'from_json'])
+        self.assertEquals({u'id': {u'min': 2}, u'title': {u'prefixes': 1}},
+                          books[u'failures'])
+
+    def test_histograms(self):
+        schema = BookSchema()
+        metrics = ValidationMetrics()
+        metrics.install(schema)
+        schema.validate(make_book())
+        schema.validate(make_book(info={u'tags': [u'a'] * 5}))
+        histograms = metrics.snapshot()[u'schemas'][u'BookSchema'][u'histograms'][u'validate']
+
+        self.assertEquals({u'count': 2, u'total': 8, u'max': 4, u'buckets': {u'4': 2}},
+                          histograms[u'keys'])
+        self.assertEquals({u'count': 2, u'total': 6, u'max': 3, u'buckets': {u'4': 2}},
+                          histograms[u'depth'])
+        self.assertEquals({u'count': 2, u'total': 8, u'max': 5, u'buckets': {u'4': 1, u'8': 1}},
+                          histograms[u'list_length'])
+
+    def test_sampling(self):
+        schema = BookSchema()
+        metrics = ValidationMetrics(sample_rate=0)
+        metrics.install(schema)
+        for i in range(10):
+            schema.validate(make_book())
+        books = metrics.snapshot()[u'schemas'][u'BookSchema']
+
+        self.assertEquals(10, books[u'validate'][u'calls'])
+        self.assertEquals({}, books[u'histograms'])
+
+    def test_threads_are_aggregated(self):
+        schema = BookSchema()
+        metrics = ValidationMetrics(sample_rate=0.5)
+        metrics.install(schema)
+
+        def validate():
+            for i in range(100):
+                schema.is_valid(make_book(id=i))
+        threads = [threading.Thread(target=validate) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        books = metrics.snapshot()[u'schemas'][u'BookSchema']
+
+        self.assertEquals({u'calls': 400, u'failures': 4}, books[u'validate'])
+        self.assertEquals({u'id': {u'min': 4}}, books[u'failures'])
+
+    def test_uninstall(self):
+        schema = BookSchema()
+        with ValidationMetrics() as metrics:
+            metrics.install(schema)
+            self.assertRaises(RuntimeError, metrics.install, schema)
+            schema.validate(make_book())
+        self.assertFalse(u'validate' in schema.__dict__)
+        self.assertFalse(u'from_json' in schema.__dict__)
+        schema.validate(make_book())
+        self.assertEquals(1, metrics.snapshot()[u'schemas'][u'BookSchema'][u'validate'][u'calls'])
+        metrics.reset()
+        self.assertEquals({}, metrics.snapshot()[u'schemas'])
+
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sinks_receive_snapshots_on_flush(self):
+        path = os.path.join(self.tmpdir, u'metrics.jsonl')
+        memory = MemorySink()
+        received = []
+        schema = BookSchema()
+        metrics = ValidationMetrics(sinks=[memory, FileSink(path), CallbackSink(received.append)])
+        metrics.install(schema)
+        schema.validate(make_book())
+        self.assertEquals(None, memory.last)
+        metrics.flush()
+        schema.validate(make_book())
+        metrics.flush()
+
+        self.assertEquals(2, len(memory.snapshots))
+        self.assertEquals(memory.snapshots, received)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEquals(2, len(lines))
+        self.assertEquals(2, lines[1][u'schemas'][u'BookSchema'][u'validate'][u'calls'])
+
+
+if __name__ == u'__main__':
+    unittest.main()
@@ -1,15 +1,184 @@
+from dictlib.bidict import BiDict
+from dictlib.binary import BinaryCodec
+from dictlib.convert import JsonSchemaConverter
+from dictlib.schema import Schema, UnicodeField, ListField, FloatField, UrlField, \
+    FieldTable
+import dictlib.schema
+from tests.benchmarks import make_schema_registry, make_deep_schema, \
+    make_adversarial_strings, make_codec_docs, make_record_docs
+import collections
+import gc
+import json
+import sys
+import types
 import unittest
-import timeit
 
-#class TestPerformance(unittest.TestCase):
-    #def test_dot_notation_speed(self):
-        #t1 = timeit.Timer(u'''d1['a.b.c'] = 42''',
-            #u'''from dictlib.mapping import DotNotationAdapter
-#d1 = DotNotationAdapter()''').timeit(100000)
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
-        #print u'DotNotationAdapter set value: %r' % t1
 
-        #t2 = timeit.Timer(u'''
-            #d2 = {u'a': {u'b': {u'c': 0}}}
-            #d2[u'a'][u'b'][u'c'] = 42''').timeit(100000)
-        #print u'dict set value: %r' % t2
+def measure_memory(factory):
+    """ Return the number of bytes allocated for the object returned by
+    `factory`, using `tracemalloc` if available. Otherwise, the sizes of all
+    distinct objects reachable through containers are summed up.
+    """
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            obj = factory()
+            return tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+    obj = factory()
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, collections.Mapping):
+            for key, value in o.iteritems():
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+    return size
+
+
+def measure_object_graph(obj):
+    """ Return the number of objects and the number of bytes of all distinct
+    objects reachable from `obj`, following all references except those to
+    classes, modules and functions.
+    """
+    skipped = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+    seen = set()
+    count = size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, skipped):
+            continue
+        seen.add(id(o))
+        count += 1
+        size += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return count, size
+
+
+class _UnsharedFieldTable(FieldTable):
+    def canonical(self, field):
+        return field
+
+
+class TestSchemaRegistryMemory(unittest.TestCase):
+    def test_memory_of_shared_fields(self):
+        # The time of building the registry is covered by the benchmark
+        # `schema.registry`
+        shared = measure_object_graph(make_schema_registry(500))
+
+        original_table = dictlib.schema.default_field_table
+        dictlib.schema.default_field_table = _UnsharedFieldTable()
+        try:
+            unshared = measure_object_graph(make_schema_registry(500))
+        finally:
+            dictlib.schema.default_field_table = original_table
+
+        self.assertTrue(shared[1] * 2 < unshared[1])
+
+class TestStringConstraintPerformance(unittest.TestCase):
+    def test_adversarial_inputs_are_rejected(self):
+        # The time of the rejection is bounded by the benchmark
+        # `stringfields.reject_long`
+        for field, value in make_adversarial_strings(1000000):
+            self.assertEquals(0, field.find_invalid([value]))
+        self.assertEquals(None, UrlField().find_invalid([u'http://example.com/' + u'a' * 1000000]))
+
+class TestInterningMemory(unittest.TestCase):
+    def test_memory_per_document_with_interning(self):
+        keys = [u'field_with_a_long_name_%d' % i for i in range(20)]
+        statuses = [u'status-%d' % i for i in range(5)]
+        plain = Schema(dict((key, UnicodeField()) for key in keys))
+        interned = Schema(dict((key, UnicodeField(intern=True)) for key in keys))
+        # Decode from fresh JSON-like documents
+        json_docs = lambda: [dict((key.encode(u'utf-8'), statuses[(i + j) % 5].encode(u'utf-8'))
+                                  for j, key in enumerate(keys)) for i in range(1000)]
+
+        docs = json_docs()
+        before = measure_memory(lambda: [plain.from_json(doc) for doc in docs]) / 1000
+        after = measure_memory(lambda: [interned.from_json(doc) for doc in docs]) / 1000
+
+        self.assertTrue(after < before)
+
+class TestRecordPerformance(unittest.TestCase):
+    def test_memory_of_records(self):
+        schema, docs = make_record_docs(1000)
+        cls = schema.record_class()
+
+        dict_size = measure_memory(lambda: [dict(doc) for doc in docs]) / 1000
+        record_size = measure_memory(lambda: [cls.from_dict(doc) for doc in docs]) / 1000
+        self.assertTrue(record_size < dict_size)
+
+class TestCopyOnWritePerformance(unittest.TestCase):
+    def test_memory_of_copy_on_write_documents(self):
+        schema = make_deep_schema(5)
+
+        def create(create_doc):
+            docs = [create_doc() for i in xrange(1000)]
+            for i, doc in enumerate(docs):
+                doc[u'child'][u'child'][u'name'] = u'doc %d' % i
+            return docs
+
+        create_size = measure_memory(lambda: create(schema.create)) / 1000
+        cow_size = measure_memory(lambda: create(schema.create_copy_on_write)) / 1000
+        self.assertTrue(cow_size * 2 < create_size)
+        self.assertEquals(create(schema.create),
+                          [doc.materialize() for doc in create(schema.create_copy_on_write)])
+
+class TestArrayStoragePerformance(unittest.TestCase):
+    def test_memory_of_float_arrays(self):
+        samples = [float(i) for i in range(100000)]
+        list_field = ListField(FloatField(min=0.0))
+        array_field = ListField(FloatField(min=0.0), storage=u'array')
+
+        list_size = measure_memory(lambda: list_field.from_json(samples))
+        array_size = measure_memory(lambda: array_field.from_json(samples))
+        self.assertTrue(array_size < list_size)
+
+class TestBinaryCodecPerformance(unittest.TestCase):
+    def test_size_compared_to_json(self):
+        schema, docs = make_codec_docs(1000)
+        codec = BinaryCodec(schema)
+        json_data = [json.dumps(schema.to_json(doc)) for doc in docs]
+        binary_data = [codec.encode(doc) for doc in docs]
+        json_size = sum(len(data) for data in json_data)
+        binary_size = sum(len(data) for data in binary_data)
+        self.assertTrue(binary_size < json_size)
+
+class TestBiDictPerformance(unittest.TestCase):
+    def test_memory_compared_to_two_dicts(self):
+        pairs = [(i, u'slug-%d' % i) for i in range(10000)]
+        two_dicts = (dict(pairs), dict((value, key) for key, value in pairs))
+        bidict = BiDict(pairs)
+        bidict.inverse
+
+        # Both directions share the key and value objects
+        two_dicts_count, two_dicts_size = measure_object_graph(two_dicts)
+        bidict_count, bidict_size = measure_object_graph(bidict)
+        self.assertTrue(bidict_count < two_dicts_count + 100)
+        self.assertTrue(bidict_size < two_dicts_size * 1.01)
+
+class TestJsonSchemaExportPerformance(unittest.TestCase):
+    def test_registry_size_with_references(self):
+        registry = make_schema_registry(50)
+
+        size = lambda use_refs: len(json.dumps(JsonSchemaConverter(use_refs).export(registry),
+                                               separators=(',', ':')))
+        self.assertTrue(size(True) * 10 < size(False))
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.exceptions import ValidationError
+from dictlib.profiling import ValidationProfiler
+from dictlib.schema import Schema, Field, IntField, UnicodeField, ListField, \
+    EnumField
+import threading
+import unittest
+
+
+class BookSchema(Schema):
+    schema = {
+        u'id': IntField(min=1),
+        u'title': UnicodeField(max_len=20, match=u'[A-Z]'),
+        u'info': {
+            u'genre': EnumField([u'novel', u'poetry']),
+            u'pages': IntField(optional=True),
+        },
+        u'tags': ListField(UnicodeField(min_len=2)),
+        u'chapters': ListField([{u'title': UnicodeField()}, IntField()]),
+    }
+
+
+def make_book(**kwargs):
+    book = {u'id': 1, u'title': u'Emil', u'info': {u'genre': u'novel'},
+            u'tags': [u'kids', u'classic'], u'chapters': [{u'title': u'One'}, 2]}
+    book.update(kwargs)
+    return book
+
+
+class OddField(Field):
+    def validate(self, value, field_name=None, partial=False):
+        super(OddField, self).validate(value, field_name, partial)
+        if value % 2 != 1:
+            raise ValidationError(u'Field %s: Value %r is even' % (field_name, value))
+
+
+class CallbackField(Field):
+    def __init__(self, callback):
+        super(CallbackField, self).__init__()
+        self.callback = callback
+
+    def validate(self, value, field_name=None, partial=False):
+        super(CallbackField, self).validate(value, field_name, partial)
+        self.callback()
+
+
+class TestValidationProfiler(unittest.TestCase):
+    def test_counts_calls_per_path(self):
+        schema = BookSchema()
+        with ValidationProfiler(schema) as profiler:
+            schema.validate(make_book())
+            schema.validate(make_book(tags=[]))
+        stats = profiler.stats()
+
+        self.assertEquals(2, stats[u''][u'calls'])
+        self.assertEquals(2, stats[u'info.genre'][u'calls'])
+        self.assertFalse(u'info.pages' in stats)
+        self.assertEquals(2, stats[u'tags[]'][u'calls'])
+        self.assertEquals(2, stats[u'chapters[0].title'][u'calls'])
+        self.assertEquals(2, stats[u'chapters[1]'][u'calls'])
+        self.assertEquals(2, stats[u'id'][u'constraints'][u'min'][u'calls'])
+        self.assertFalse(u'max' in stats[u'id'][u'constraints'])
+        self.assertTrue(stats[u''][u'time'] >= stats[u'info'][u'time'] >= stats[u'info.genre'][u'time'])
+
+    def test_shared_fields_are_counted_per_path(self):
+        # Equal fields are a single shared instance
+        schema = Schema({u'a': IntField(), u'b': IntField(), u'c': {unicode: IntField()},
+                         u'd': ListField({u'a': IntField()})})
+        with ValidationProfiler(schema) as profiler:
+            schema.validate({u'a': 1, u'b': 2, u'c': {u'x': 3, u'y': 4}, u'd': [{u'a': 5}]})
+        stats = profiler.stats()
+
+        self.assertEquals(1, stats[u'a'][u'calls'])
+        self.assertEquals(1, stats[u'b'][u'calls'])
+        self.assertEquals(2, stats[u'c.*'][u'calls'])
+        self.assertEquals(1, stats[u'd[].a'][u'calls'])
+
+    def test_other_schemas_sharing_fields_are_not_counted(self):
+        a = Schema({u'id': IntField(), u'name': UnicodeField()})
+        b = Schema({u'id': IntField(), u'name': UnicodeField(), u'x': IntField()})
+        with ValidationProfiler(a) as profiler_a:
+            b.validate({u'id': 1, u'name': u'b', u'x': 2})
+            with ValidationProfiler(b) as profiler_b:
+                a.validate({u'id': 1, u'name': u'a'})
+                b.validate({u'id': 1, u'name': u'b', u'x': 2})
+                b.validate({u'id': 2, u'name': u'b', u'x': 3})
+        stats_a, stats_b = profiler_a.stats(), profiler_b.stats()
+
+        self.assertEquals(1, stats_a[u''][u'calls'])
+        self.assertEquals(1, stats_a[u'id'][u'calls'])
+        self.assertEquals(1, stats_a[u'name'][u'calls'])
+        self.assertEquals(2, stats_b[u''][u'calls'])
+        self.assertEquals(2, stats_b[u'id'][u'calls'])
+        self.assertEquals(2, stats_b[u'x'][u'calls'])
+        self.assertFalse(u'validate' in a.get_field(u'id').__dict__)
+
+    def test_validations_in_other_threads_are_not_counted(self):
+        other = Schema({u'id': IntField()})
+
+        def validate_other():
+            thread = threading.Thread(target=other.validate, args=({u'id': 1},))
+            thread.start()
+            thread.join()
+        schema = Schema({u'id': IntField(), u'x': CallbackField(validate_other)})
+        with ValidationProfiler(schema) as profiler:
+            schema.validate({u'id': 1, u'x': 0})
+
+        self.assertEquals(1, profiler.stats()[u'id'][u'calls'])
+        self.assertEquals(1, profiler.stats()[u'x'][u'calls'])
+
+    def test_counts_failures_per_constraint(self):
+        schema = BookSchema()
+        with ValidationProfiler(schema) as profiler:
+            for book in (make_book(id=0), make_book(title=u'emil'),
+                         make_book(title=u'E' * 21), make_book(tags=[u'x']),
+                         make_book(info={u'genre': u'drama'}),
+                         make_book(info={u'genre': u'novel', u'isbn': 1}),
+                         make_book(chapters=[1.0])):
+                self.assertFalse(schema.is_valid(book))
+            book = make_book()
+            del book[u'title']
+            self.assertFalse(schema.is_valid(book))
+        stats = profiler.stats()
+
+        def failures(path, constraint):
+            return stats[path][u'constraints'][constraint][u'failures']
+        self.assertEquals(1, failures(u'id', u'min'))
+        self.assertEquals(1, failures(u'title', u'match'))
+        self.assertEquals(1, failures(u'title', u'max_len'))
+        self.assertEquals(1, failures(u'tags[]', u'min_len'))
+        self.assertEquals(1, failures(u'tags', u'elements'))
+        self.assertEquals(1, failures(u'info.genre', u'values'))
+        self.assertEquals(1, failures(u'info', u'undefined'))
+        self.assertEquals(1, failures(u'chapters', u'elements'))
+        self.assertEquals(1, failures(u'', u'required'))
+        self.assertEquals(0, failures(u'', u'undefined'))
+        self.assertEquals(2, stats[u'info'][u'failures'])
+        self.assertEquals(8, stats[u''][u'failures'])
+
+    def test_unknown_validate_methods_are_timed_as_a_whole(self):
+        schema = Schema({u'n': OddField()})
+        with ValidationProfiler(schema) as profiler:
+            self.assertTrue(schema.is_valid({u'n': 1}))
+            self.assertFalse(schema.is_valid({u'n': 2}))
+            self.assertFalse(schema.is_valid({u'n': None}))
+        constraints = profiler.stats()[u'n'][u'constraints']
+
+        self.assertEquals(1, constraints[u'validate'][u'failures'])
+        self.assertEquals(1, constraints[u'none'][u'failures'])
+        self.assertEquals(3, constraints[u'none'][u'calls'])
+
+    def test_errors_are_unchanged(self):
+        schema = BookSchema()
+        books = [make_book(), make_book(id=0), make_book(title=None),
+                 make_book(title=5), make_book(tags=[u'ok', u'x']),
+                 make_book(chapters=[{u'title': 1}])]
+        expected = []
+        for book in books:
+            try:
+                schema.validate(book)
+                expected.append(None)
+            except ValidationError as e:
+                expected.append(unicode(e))
+        with ValidationProfiler(schema):
+            for book, message in zip(books, expected):
+                try:
+                    schema.validate(book)
+                    self.assertEquals(None, message)
+                except ValidationError as e:
+                    self.assertEquals(message, unicode(e))
+
+    def test_collapsed_stacks(self):
+        schema = BookSchema()
+        with ValidationProfiler(schema, name=u'books') as profiler:
+            schema.validate(make_book())
+        lines = profiler.collapsed().splitlines()
+        stacks = [line.rsplit(u' ', 1)[0] for line in lines]
+
+        self.assertTrue(u'books' in stacks)
+        self.assertTrue(u'books;info;genre' in stacks)
+        self.assertTrue(u'books;chapters;chapters[0];title' in stacks)
+        for line in lines:
+            self.assertTrue(int(line.rsplit(u' ', 1)[1]) >= 0)
+
+    def test_fields_are_restored(self):
+        schema = BookSchema()
+        fields = [schema, schema.get_field(u'id'), schema.get_field(u'tags').fields[0]]
+        profiler = ValidationProfiler(schema)
+        profiler.start()
+        self.assertTrue(u'validate' in fields[2].__dict__)
+        self.assertRaises(RuntimeError, ValidationProfiler(schema).start)
+        profiler.stop()
+
+        for field in fields:
+            self.assertEquals({}, field.__dict__)
+            self.assertFalse(field._has_dict)
+        schema.validate(make_book())
+        self.assertFalse(u'' in profiler.stats())
+        profiler.reset()
+        self.assertEquals({}, profiler.stats())
+
+
+if __name__ == u'__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.exceptions import ValidationError
+from dictlib.mapping import DotNotationAdapter
+from dictlib.record import Record, make_record_class
+from dictlib.schema import Schema, UnicodeField, IntField, ListField, \
+    SchemaDefinitionError
+from dictlib.utils import getitem
+import unittest
+
+
+class TestRecord(unittest.TestCase):
+    def setUp(self):
+        class BookSchema(Schema):
+            schema = {
+                u'title': UnicodeField(),
+                u'year': IntField(optional=True),
+                u'author': {u'name': UnicodeField(), u'größe': IntField()},
+                u'tags': ListField(UnicodeField()),
+                u'extra': {unicode: IntField(optional=True)},
+            }
+        self.schema = BookSchema()
+        self.doc = {u'title': u'a', u'author': {u'name': u'lemmy', u'größe': 180},
+                    u'tags': [u'x'], u'extra': {u'a': 1}}
+
+    def test_record_class_is_cached_and_named_after_schema(self):
+        cls = self.schema.record_class()
+
+        self.assertTrue(cls is self.schema.record_class())
+        self.assertEquals('BookSchemaRecord', cls.__name__)
+        self.assertTrue(issubclass(cls, Record))
+
+    def test_record_class_is_cached_per_name(self):
+        cls = self.schema.record_class(u'Book')
+
+        self.assertEquals('Book', cls.__name__)
+        self.assertTrue(cls is self.schema.record_class(u'Book'))
+        self.assertEquals('BookSchemaRecord', self.schema.record_class().__name__)
+        self.assertEquals('Book', self.schema.record_class(u'Book').__name__)
+
+    def test_from_dict_and_to_dict_round_trip(self):
+        record = self.schema.record_class().from_dict(self.doc)
+
+        self.assertTrue(isinstance(record[u'author'], Record))
+        self.assertEquals(dict, type(record[u'extra']))
+        self.assertEquals(self.doc, record.to_dict())
+
+    def test_record_is_a_read_only_mapping(self):
+        record = self.schema.record_class().from_dict(self.doc)
+
+        self.assertEquals(u'a', record[u'title'])
+        self.assertRaises(KeyError, record.__getitem__, u'year')
+        self.assertRaises(KeyError, record.__getitem__, u'unknown')
+        self.assertFalse(u'year' in record)
+        self.assertTrue(u'title' in record)
+        self.assertEquals(4, len(record))
+        self.assertEquals(set([u'title', u'author', u'tags', u'extra']), set(record.keys()))
+        self.assertEquals(self.doc, record)
+        self.assertRaises(AttributeError, setattr, record, u'_0', u'b')
+        self.assertFalse(hasattr(record, u'__dict__'))
+
+    def test_dotted_access_on_records(self):
+        record = self.schema.record_class().from_dict(self.doc)
+
+        self.assertEquals(u'lemmy', getitem(record, u'author.name'))
+        self.assertEquals(180, DotNotationAdapter(record)[u'author.größe'])
+        self.assertEquals(u'x', getitem(record, u'tags.0'))
+
+    def test_schema_validates_records(self):
+        cls = self.schema.record_class()
+
+        self.schema.validate(cls.from_dict(self.doc))
+        self.doc[u'author'][u'größe'] = u'tall'
+        self.assertRaises(ValidationError, self.schema.validate, cls.from_dict(self.doc))
+        del self.doc[u'title']
+        self.assertRaises(ValidationError, self.schema.validate, cls.from_dict(self.doc))
+
+    def test_from_dict_raises_KeyError_on_unknown_key(self):
+        cls = make_record_class(u'R', [u'a'])
+
+        self.assertRaises(KeyError, cls.from_dict, {u'b': 1})
+
+    def test_schema_with_type_keys_cannot_create_record_class(self):
+        self.assertRaises(SchemaDefinitionError,
+                          Schema({unicode: IntField()}).record_class)
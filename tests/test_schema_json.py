@@ -18,8 +18,11 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+from dictlib.exceptions import ValidationError
 from dictlib.schema import IntField, DatetimeField, DateField, TimeField, Field, \
-    NoneField, LongField, FloatField, UnicodeField, UuidField, DictField, ListField
+    NoneField, LongField, FloatField, UnicodeField, UuidField, DictField, ListField, \
+    EnumField, InternTable, Schema
+import array
 import datetime
 import unittest
 import uuid
@@ -70,6 +73,19 @@ class TestSchemaJson(unittest.TestCase):
         self.assertEquals('we are motörhead', f.to_json(u'we are motörhead'))
         self.assertEquals(str, type(f.to_json(u'we are motörhead')))
 
+    def test_UnicodeField_from_json_interns_values(self):
+        table = InternTable(max_size=2, max_value_len=5)
+        f = UnicodeField(intern=table)
+
+        self.assertTrue(f.from_json('hello') is f.from_json('hello'))
+        # Value is too long
+        self.assertFalse(f.from_json('hello world') is f.from_json('hello world'))
+        self.assertTrue(f.from_json('wörld') is f.from_json('wörld'))
+        # Table is full
+        self.assertFalse(f.from_json('foo') is f.from_json('foo'))
+        self.assertEquals(2, len(table))
+        self.assertEquals(None, f.from_json(None))
+
     def test_UuidField_from_json_converts_uuid_to_unicode_string(self):
         u = uuid.UUID('b15dee39-f528-4ef0-8bbc-fe761a1d42a6')
 
@@ -112,16 +128,96 @@ class TestSchemaJson(unittest.TestCase):
 
         self.assertEquals(datetime.time(12, 24, 36), f.from_json('12:24:36'))
 
+    def test_EnumField_json_methods(self):
+        f = EnumField([u'red', u'grün'])
+
+        self.assertEquals('grün', f.to_json(u'grün'))
+        self.assertEquals(u'grün', f.from_json('grün'))
+        self.assertTrue(f.values[0] is f.from_json('red'))
+
+    def test_EnumField_json_methods_with_integer_encoding(self):
+        f = EnumField([u'red', u'green'], encode_as_int=True)
+
+        self.assertEquals(1, f.to_json(u'green'))
+        self.assertTrue(f.values[1] is f.from_json(1))
+        self.assertEquals([u'red', u'green', u'red'],
+                          f.decode_many(f.encode_many([u'red', u'green', u'red'])))
+        self.assertEquals([0, 1], list(f.encode_many([u'red', u'green'])))
+
+    def test_EnumField_integer_encoding_rejects_invalid_codes_and_values(self):
+        f = EnumField([u'red', u'green'], encode_as_int=True)
+
+        for code in (-1, 2, u'1', 1.0, True):
+            self.assertRaises(ValidationError, f.from_json, code)
+        self.assertRaises(ValidationError, f.to_json, u'blue')
+        self.assertRaises(ValidationError, f.to_json, [])
+
     def test_ListField_to_json_converts_list_with_unicode_strings_to_byte_strings(self):
         f = ListField(DatetimeField(), UnicodeField(), IntField())
 
         self.assertEquals(['foo', 'bar'], f.to_json([u'foo', u'bar']))
 
+    def test_ListField_to_json_does_not_change_value(self):
+        f = ListField(UnicodeField())
+        value = [u'foo']
+
+        f.to_json(value)
+
+        self.assertEquals(unicode, type(value[0]))
+
     def test_ListField_from_json_converts_list_with_byte_strings_to_list(self):
         f = ListField(UnicodeField())
 
         self.assertEquals([u'hello', u'world'], f.from_json(['hello', 'world']))
 
+    def test_ListField_json_methods_dispatch_by_element_type(self):
+        f = ListField([IntField(), UuidField(), DatetimeField()])
+        u = uuid.UUID('b15dee39-f528-4ef0-8bbc-fe761a1d42a6')
+        dt = datetime.datetime(2012, 4, 29, 12, 24, 36)
+
+        self.assertEquals([42, u, dt],
+                          f.from_json([42, 'b15dee39-f528-4ef0-8bbc-fe761a1d42a6',
+                                       '2012-04-29T12:24:36Z']))
+        self.assertEquals([42, 'b15dee39-f528-4ef0-8bbc-fe761a1d42a6',
+                           '2012-04-29T12:24:36Z'], f.to_json([42, u, dt]))
+
+    def test_ListField_from_json_keeps_unconvertible_elements(self):
+        f = ListField([DatetimeField()])
+
+        self.assertEquals([u'bad'], f.from_json([u'bad']))
+
+    def test_ListField_dispatch_follows_changed_fields(self):
+        f = ListField([IntField()])
+        f.to_json([u'a'])
+        f.from_json([u'a'])
+
+        f.fields = [UuidField()]
+        u = uuid.UUID('b15dee39-f528-4ef0-8bbc-fe761a1d42a6')
+
+        self.assertEquals([u], f.from_json(['b15dee39-f528-4ef0-8bbc-fe761a1d42a6']))
+        self.assertEquals(['b15dee39-f528-4ef0-8bbc-fe761a1d42a6'], f.to_json([u]))
+
+    def test_DictField_from_json_shares_declared_keys(self):
+        schema = Schema({u'title': UnicodeField(), u'grün': UnicodeField(),
+                         unicode: UnicodeField()})
+        keys = dict((key, key) for key in schema.get_schema() if key is not unicode)
+
+        doc = schema.from_json({'title': 'a', 'grün': 'b', 'other': 'c'})
+
+        self.assertEquals({u'title': u'a', u'grün': u'b', u'other': u'c'}, doc)
+        for key in doc:
+            self.assertEquals(unicode, type(key))
+            if key in keys:
+                self.assertTrue(keys[key] is key)
+
+    def test_ListField_with_array_storage_json_methods(self):
+        f = ListField(FloatField(), storage=u'array')
+
+        value = f.from_json([1.5, 2.5])
+        self.assertEquals(array.array('d', [1.5, 2.5]), value)
+        self.assertEquals([1.5, 2.5], f.to_json(value))
+        self.assertEquals(list, type(f.to_json(value)))
+
     def test_DictField_to_json_converts_unicode_keys_and_values_to_byte_strings(self):
         f = DictField({u'a': UnicodeField()})
 
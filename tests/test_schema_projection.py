@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.exceptions import SchemaFieldNotFound
+from dictlib.schema import Schema, UnicodeField, IntField, ListField
+import copy
+import unittest
+
+
+class BookSchema(Schema):
+    schema = {
+        u'title': UnicodeField(),
+        u'info': {u'author': {u'name': UnicodeField(), u'born': IntField()},
+                  u'pages': IntField()},
+        u'chapters': ListField({u'title': UnicodeField(), u'pages': IntField()}),
+        u'ratings': {unicode: IntField()},
+    }
+
+
+def make_book():
+    return {u'title': u'Emil', u'isbn': u'123',
+            u'info': {u'author': {u'name': u'Astrid', u'born': 1907, u'alias': u'A'},
+                      u'pages': 120},
+            u'chapters': [{u'title': u'One', u'pages': 10, u'draft': True},
+                          {u'title': u'Two', u'pages': 12}],
+            u'ratings': {u'kids': 5, u'adults': 4}}
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        self.schema = BookSchema()
+        self.book = make_book()
+
+    def test_include(self):
+        self.assertEquals({u'info': {u'author': {u'name': u'Astrid'}},
+                           u'chapters': [{u'title': u'One'}, {u'title': u'Two'}],
+                           u'ratings': {u'kids': 5}},
+                          self.schema.project(self.book, include=[u'info.author.name',
+                                                                  u'chapters.title',
+                                                                  u'ratings.kids']))
+
+    def test_included_subtrees_are_kept_as_they_are(self):
+        result = self.schema.project(self.book, include=[u'info', u'info.pages'])
+
+        self.assertEquals({u'info': self.book[u'info']}, result)
+        self.assertTrue(result[u'info'] is self.book[u'info'])
+
+    def test_exclude(self):
+        expected = make_book()
+        del expected[u'info'][u'author']
+        for chapter in expected[u'chapters']:
+            del chapter[u'pages']
+
+        self.assertEquals(expected, self.schema.project(
+            self.book, exclude=[u'info.author', u'chapters.pages']))
+
+    def test_include_and_exclude(self):
+        self.assertEquals({u'info': {u'author': {u'born': 1907, u'alias': u'A'}}},
+                          self.schema.project(self.book, include=[u'info.author'],
+                                              exclude=[u'info.author.name']))
+
+    def test_copy_leaves_document_unchanged(self):
+        self.schema.project(self.book, include=[u'title'], exclude=[u'chapters.title'])
+        self.schema.strip_unknown(self.book)
+
+        self.assertEquals(make_book(), self.book)
+
+    def test_in_place(self):
+        result = self.schema.project(self.book, include=[u'info.author', u'chapters.title'],
+                                     exclude=[u'info.author.born'], in_place=True)
+
+        self.assertTrue(result is self.book)
+        self.assertEquals({u'info': {u'author': {u'name': u'Astrid', u'alias': u'A'}},
+                           u'chapters': [{u'title': u'One'}, {u'title': u'Two'}]},
+                          self.book)
+
+    def test_undefined_paths_raise(self):
+        self.assertRaises(SchemaFieldNotFound, self.schema.project, self.book,
+                          include=[u'isbn'])
+        self.assertRaises(SchemaFieldNotFound, self.schema.project, self.book,
+                          exclude=[u'chapters.draft'])
+
+    def test_paths_into_nested_lists(self):
+        schema = Schema({u'm': ListField(ListField({u'p': IntField(), u'q': IntField()}))})
+        doc = {u'm': [[{u'p': 1, u'q': 2}], [], [{u'p': 3, u'q': 4}]]}
+
+        self.assertEquals({u'm': [[{u'q': 2}], [], [{u'q': 4}]]},
+                          schema.project(doc, exclude=[u'm.p']))
+        self.assertEquals({u'm': [[{u'p': 1}], [], [{u'p': 3}]]},
+                          schema.project(doc, include=[u'm.p']))
+
+    def test_strip_unknown(self):
+        expected = make_book()
+        del expected[u'isbn']
+        del expected[u'info'][u'author'][u'alias']
+        del expected[u'chapters'][0][u'draft']
+
+        self.assertEquals(expected, self.schema.strip_unknown(self.book))
+        self.assertEquals(expected, self.schema.strip_unknown(self.book, in_place=True))
+        self.assertEquals(expected, self.book)
+
+    def test_strip_unknown_chooses_the_best_matching_element_field(self):
+        schema = Schema({u'shapes': ListField([{u'radius': IntField()},
+                                               {u'width': IntField(), u'height': IntField()}])})
+        doc = {u'shapes': [{u'radius': 1, u'color': u'red'},
+                           {u'width': 1, u'height': 2, u'color': u'blue'}]}
+
+        self.assertEquals({u'shapes': [{u'radius': 1}, {u'width': 1, u'height': 2}]},
+                          schema.strip_unknown(doc))
+
+    def test_values_of_unexpected_types_are_kept(self):
+        book = {u'info': None, u'chapters': [u'One', {u'title': u'Two', u'x': 1}]}
+
+        self.assertEquals({u'info': None, u'chapters': [u'One', {u'title': u'Two'}]},
+                          self.schema.strip_unknown(book))
+        self.assertEquals({u'info': None, u'chapters': [u'One', {u'title': u'Two'}]},
+                          self.schema.project(book, include=[u'info.pages', u'chapters.title']))
@@ -18,7 +18,12 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from dictlib.schema import UnicodeField, Schema, IntField
+from dictlib.exceptions import SchemaFieldNotFound
+from dictlib.schema import UnicodeField, Schema, IntField, FloatField, DictField, \
+    ListField, FieldTable, SchemaDefinitionError
+import copy
+import gc
+import pickle
 import unittest
 
 class TestSchemaDefinition(unittest.TestCase):
@@ -56,3 +61,155 @@ class TestSchemaDefinition(unittest.TestCase):
 
         self.assertEquals({u'counter': 1}, schema.create())
         self.assertEquals({u'counter': 2}, schema.create())
+
+    def test_subclass_schema_extends_nested_schema_of_base_class(self):
+        class BaseSchema(Schema):
+            schema = {u'a': {u'b': UnicodeField()}}
+        class SubSchema(BaseSchema):
+            schema = {u'a': {u'c': IntField()}}
+
+        self.assertEquals(set([u'b', u'c']),
+                          set(SubSchema().get_schema()[u'a'].get_schema()))
+        # The base class' schema definition is not modified
+        self.assertEquals(set([u'b']),
+                          set(BaseSchema().get_schema()[u'a'].get_schema()))
+
+    def test_nested_schemas_are_merged_in_class_order(self):
+        class A(Schema):
+            schema = {u'a': {u'b': UnicodeField()}, u'x': {u'y': IntField()}}
+        class B(A):
+            schema = {u'a': {u'c': IntField(), u'd': {u'e': IntField()}}, u'x': IntField()}
+        class C(B):
+            schema = {u'a': {u'b': IntField(), u'd': {u'f': IntField()}},
+                      u'x': {u'z': IntField()}}
+
+        schema = C().get_schema()
+        self.assertEquals(set([u'b', u'c', u'd']), set(schema[u'a'].get_schema()))
+        self.assertTrue(isinstance(schema[u'a'].get_schema()[u'b'], IntField))
+        self.assertEquals(set([u'e', u'f']),
+                          set(schema[u'a'].get_schema()[u'd'].get_schema()))
+        # A field which is not a dictionary replaces the dictionary before it
+        self.assertEquals([u'z'], schema[u'x'].get_schema().keys())
+        self.assertEquals(set([u'b', u'c', u'd']), set(B().get_schema()[u'a'].get_schema()))
+
+    def test_extending_schema_instance_does_not_modify_class_schema(self):
+        class MySchema(Schema):
+            schema = {u'a': UnicodeField()}
+
+        s = MySchema({u'b': UnicodeField()})
+
+        self.assertEquals(set([u'a', u'b']), set(s.get_schema()))
+        self.assertEquals(set([u'a']), set(MySchema().get_schema()))
+
+
+class Address(DictField):
+    schema = {u'street': UnicodeField(), u'zip': UnicodeField(length=5)}
+
+
+class TestSharedFields(unittest.TestCase):
+    def test_equal_fields_are_shared_between_schemas(self):
+        s1 = Schema({u'a': IntField(min=0), u'b': {u'c': UnicodeField()}})
+        s2 = Schema({u'x': IntField(min=0), u'y': {u'c': UnicodeField()}})
+
+        self.assertTrue(s1.get_field(u'a') is s2.get_field(u'x'))
+        self.assertTrue(s1.get_field(u'b') is s2.get_field(u'y'))
+
+    def test_instances_of_dict_field_subclasses_are_shared(self):
+        s1 = Schema({u'home': Address(), u'work': Address(optional=True)})
+        s2 = Schema({u'address': Address(), u'others': ListField(Address())})
+
+        self.assertTrue(s1.get_field(u'home') is s2.get_field(u'address'))
+        self.assertTrue(s1.get_field(u'home') is s2.get_field(u'others').fields[0])
+        self.assertFalse(s1.get_field(u'home') is s1.get_field(u'work'))
+
+    def test_different_fields_are_not_shared(self):
+        schema = Schema({u'a': IntField(min=0), u'b': IntField(min=1),
+                         u'c': FloatField(min=0), u'd': IntField(default=1),
+                         u'e': IntField(default=1.0), u'f': {u'g': IntField()},
+                         u'h': {u'g': IntField(optional=True)}})
+
+        fields = schema.get_schema().values()
+        self.assertEquals(len(fields), len(set(fields)))
+
+    def test_shared_fields_cannot_be_changed(self):
+        field = Schema({u'a': {u'b': IntField()}}).get_field(u'a')
+
+        self.assertRaises(AttributeError, setattr, field, u'optional', True)
+        self.assertRaises(AttributeError, setattr, field.get_field(u'b'), u'type', long)
+        self.assertRaises(SchemaDefinitionError, field.extend, {u'c': IntField()})
+
+    def test_replaced_fields_cannot_be_changed(self):
+        Schema({u'x': UnicodeField()})
+        field = UnicodeField()
+        schema = Schema({u'a': field})
+
+        self.assertFalse(schema.get_field(u'a') is field)
+        self.assertRaises(AttributeError, setattr, field, u'max_len', 3)
+        schema.validate({u'a': u'abcdef'})
+
+    def test_mutable_defaults_are_not_shared_between_documents(self):
+        s1 = Schema({u'tags': ListField(UnicodeField(), default=[])})
+        s2 = Schema({u'other': ListField(UnicodeField(), default=[])})
+        s1.create()[u'tags'].append(u'x')
+
+        self.assertEquals({u'other': []}, s2.create())
+        self.assertEquals({u'tags': []}, s1.create())
+
+    def test_extending_a_schema_does_not_change_shared_fields(self):
+        class MySchema(Schema):
+            schema = {u'a': {u'b': IntField()}}
+
+        s = MySchema({u'a': {u'c': IntField()}})
+
+        self.assertEquals(set([u'b', u'c']), set(s.get_field(u'a').get_schema()))
+        self.assertEquals(set([u'b']), set(MySchema().get_field(u'a').get_schema()))
+
+    def test_schema_instances_share_their_class_schema(self):
+        class MySchema(Schema):
+            schema = {u'a': IntField()}
+
+        self.assertTrue(MySchema()._schema is MySchema()._schema)
+
+    def test_get_schema_returns_a_copy(self):
+        class MySchema(Schema):
+            schema = {u'a': IntField()}
+
+        MySchema().get_schema()[u'b'] = IntField()
+        self.assertEquals([u'a'], MySchema().get_schema().keys())
+        self.assertRaises(SchemaFieldNotFound, MySchema().get_field, u'b')
+
+    def test_fields_with_instance_attributes_are_not_shared(self):
+        f1, f2 = IntField(), IntField()
+        f1.note = f2.note = u'state of its own'
+        schema = Schema({u'a': f1, u'b': f2})
+
+        self.assertTrue(schema.get_field(u'a') is f1)
+        self.assertTrue(schema.get_field(u'b') is f2)
+        # Fields which are not shared stay mutable
+        f1.note = u'changed'
+
+    def test_copies_of_shared_fields_can_be_changed(self):
+        field = copy.copy(Schema({u'a': IntField(max=10)}).get_field(u'a'))
+        field.max = 20
+
+        self.assertEquals(20, field.max)
+        self.assertEquals(10, Schema({u'a': IntField(max=10)}).get_field(u'a').max)
+
+    def test_shared_fields_can_be_pickled(self):
+        schema = Schema({u'a': UnicodeField(max_len=3), u'b': {u'c': IntField()}})
+
+        unpickled = pickle.loads(pickle.dumps(schema))
+
+        self.assertEquals(3, unpickled.get_field(u'a').max_len)
+        self.assertTrue(unpickled.is_valid({u'a': u'abc', u'b': {u'c': 1}}))
+        self.assertFalse(unpickled.is_valid({u'a': u'abcd', u'b': {u'c': 1}}))
+
+    def test_field_table_drops_unused_fields(self):
+        table = FieldTable()
+        field = table.canonical(IntField(min=12345))
+
+        self.assertTrue(table.canonical(IntField(min=12345)) is field)
+        self.assertEquals(1, len(table))
+        del field
+        gc.collect()
+        self.assertEquals(0, len(table))
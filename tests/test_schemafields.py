@@ -20,7 +20,9 @@
 
 from dictlib.exceptions import ValidationError
 from dictlib.schema import Field, TypeField, UnicodeField, FieldField, NoneField, \
-    IntField, LongField, UuidField, FloatField, ListField, Schema, DictField
+    IntField, LongField, UuidField, FloatField, ListField, Schema, DictField, \
+    EmailField, UrlField, EnumField, compile_pattern, SchemaDefinitionError
+import array
 import re
 import unittest
 import uuid
@@ -222,6 +224,96 @@ class TestSchemaFields(unittest.TestCase):
         except ValidationError:
             self.fail('UnicodeField.validate raised ValidationError unexpectedly')
 
+    def test_UnicodeField_compiles_string_patterns_once(self):
+        field = UnicodeField(match=ur'hello .+')
+
+        field.validate(u'hello world')
+        self.assertRaises(ValidationError, field.validate, u'bye world')
+        self.assertTrue(compile_pattern(ur'hello .+') is
+                        UnicodeField(match=ur'hello .+')._pattern)
+
+    def test_UnicodeField_with_full_match_validates_whole_value(self):
+        field = UnicodeField(match=ur'[a-z]+', full_match=True)
+
+        field.validate(u'hello')
+        self.assertRaises(ValidationError, field.validate, u'hello world')
+
+    def test_UnicodeField_validates_prefixes_and_required_chars(self):
+        field = UnicodeField(prefixes=(u'a', u'b'), required_chars=u'xy')
+
+        field.validate(u'axy')
+        field.validate(u'byx')
+        self.assertRaises(ValidationError, field.validate, u'cxy')
+        self.assertRaises(ValidationError, field.validate, u'ax')
+
+    def test_EmailField_and_UrlField_validate_format(self):
+        EmailField().validate(u'user@example.com')
+        self.assertRaises(ValidationError, EmailField().validate, u'user.example.com')
+        self.assertRaises(ValidationError, EmailField().validate, u'@example.com')
+
+        UrlField().validate(u'http://example.com')
+        UrlField().validate(u'https://example.com:8080/path')
+        self.assertRaises(ValidationError, UrlField().validate, u'ftp://example.com')
+        self.assertRaises(ValidationError, UrlField().validate, u'http://')
+
+    def test_UnicodeField_find_invalid_returns_index_of_first_invalid_value(self):
+        field = UnicodeField(min_len=2, match=ur'h')
+
+        self.assertEquals(None, field.find_invalid([u'hello', u'hi']))
+        self.assertEquals(1, field.find_invalid([u'hello', u'h', u'x']))
+        self.assertEquals(2, field.find_invalid([u'hello', u'hi', u'xy']))
+        self.assertEquals(0, field.find_invalid([42]))
+        self.assertEquals(0, field.find_invalid([None]))
+        self.assertEquals(None, UnicodeField(can_be_none=True).find_invalid([None]))
+
+    def test_find_invalid_uses_validate_of_subclasses(self):
+        class Slug(UnicodeField):
+            def validate(self, value, field_name=None, partial=False):
+                super(Slug, self).validate(value, field_name, partial)
+                if u' ' in value:
+                    raise ValidationError(u'Field %s: Slug contains spaces' % field_name)
+
+        self.assertEquals(1, Slug().find_invalid([u'a', u'a b']))
+        self.assertRaises(ValidationError, ListField(Slug()).validate, [u'a b'])
+
+    def test_ListField_reports_first_invalid_element(self):
+        field = ListField(UnicodeField(max_len=3))
+
+        try:
+            field.validate([u'a', u'abcd'], u'l')
+            self.fail('ListField.validate() did not raise ValidationError')
+        except ValidationError as e:
+            self.assertTrue(unicode(e).startswith(u'Field l[1]:'))
+
+    def test_EnumField_validates_allowed_values(self):
+        field = EnumField([u'a', u'b', 3])
+
+        try:
+            field.validate(u'a')
+            field.validate(3)
+        except ValidationError:
+            self.fail('EnumField.validate() raised ValidationError unexpectedly')
+
+        self.assertRaises(ValidationError, field.validate, u'c')
+        self.assertRaises(ValidationError, field.validate, None)
+        self.assertRaises(ValidationError, field.validate, [u'a'])
+        EnumField([u'a'], can_be_none=True).validate(None)
+
+    def test_EnumField_find_invalid_returns_index_of_first_invalid_value(self):
+        field = EnumField([u'a', u'b'])
+
+        self.assertEquals(None, field.find_invalid([u'a', u'b', u'a']))
+        self.assertEquals(1, field.find_invalid([u'a', {}, u'c']))
+
+        class Vowel(EnumField):
+            def validate(self, value, field_name=None, partial=False):
+                super(Vowel, self).validate(value, field_name, partial)
+                if value not in u'aeiou':
+                    raise ValidationError(u'Field %s: Not a vowel' % field_name)
+
+        self.assertEquals(1, Vowel([u'a', u'b']).find_invalid([u'a', u'b']))
+        self.assertRaises(ValidationError, ListField(Vowel([u'a', u'b'])).validate, [u'b'])
+
     def test_UuidField_validates_Uuid_value(self):
         field = UuidField()
 
@@ -275,6 +367,58 @@ class TestSchemaFields(unittest.TestCase):
         self.assertRaises(ValidationError, field.validate, [1, 2, 3, 4, 5, 6])
         self.assertRaises(ValidationError, field.validate, None)
 
+    def test_ListField_validates_heterogeneous_list_values(self):
+        field = ListField([IntField(), UnicodeField(), DictField({u'a': IntField()})])
+
+        try:
+            field.validate([1, u'hello', {u'a': 2}])
+        except ValidationError:
+            self.fail('ListField.validate() raised ValidationError unexpectedly')
+
+        self.assertRaises(ValidationError, field.validate, [1, 1.5])
+        self.assertRaises(ValidationError, field.validate, [{u'b': 1}])
+        self.assertRaises(ValidationError, field.validate, [None])
+
+    def test_ListField_tries_ambiguous_element_fields_in_order(self):
+        field = ListField([IntField(max=10), IntField(min=100)])
+
+        try:
+            field.validate([5, 500])
+        except ValidationError:
+            self.fail('ListField.validate() raised ValidationError unexpectedly')
+
+        self.assertRaises(ValidationError, field.validate, [50])
+
+    def test_ListField_get_fields_for_type_returns_candidate_fields(self):
+        field = ListField([IntField(), UnicodeField(can_be_none=True)])
+        int_field, unicode_field = field.fields
+
+        self.assertEquals((int_field,), field.get_fields_for_type(int))
+        self.assertEquals((unicode_field,), field.get_fields_for_type(unicode))
+        self.assertEquals((unicode_field,), field.get_fields_for_type(type(None)))
+        self.assertEquals((), field.get_fields_for_type(float))
+
+    def test_ListField_with_array_storage_validates_arrays(self):
+        field = ListField(IntField(min=0, max=10), storage=u'array', max_len=3)
+
+        try:
+            field.validate(array.array('l', [0, 5, 10]))
+            field.validate(array.array('l'))
+            field.validate([1, 2])
+        except ValidationError:
+            self.fail('ListField.validate() raised ValidationError unexpectedly')
+
+        self.assertRaises(ValidationError, field.validate, array.array('l', [0, 11]))
+        self.assertRaises(ValidationError, field.validate, array.array('l', [1, 2, 3, 4]))
+        self.assertRaises(ValidationError, field.validate, array.array('d', [1.0]))
+        self.assertRaises(ValidationError, ListField(IntField()).validate, array.array('l'))
+
+    def test_ListField_storage_requires_single_numeric_field(self):
+        self.assertRaises(SchemaDefinitionError, ListField, UnicodeField(), storage=u'array')
+        self.assertRaises(SchemaDefinitionError, ListField, [IntField(), FloatField()],
+                          storage=u'array')
+        self.assertRaises(SchemaDefinitionError, ListField, IntField(), storage=u'tuple')
+
     def test_DictField_validates_value_matching_pattern(self):
         field = DictField({u'a': DictField({u'b': UnicodeField()})})
 
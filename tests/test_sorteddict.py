@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.mapping import DotNotationAdapter, ObjectMappingAdapter
+from dictlib.sorteddict import SortedDict, ValueSortedDict, FunctionSortedDict, \
+    _SortedList
+import random
+import unittest
+
+
+class TestSortedList(unittest.TestCase):
+    def test_random_operations_keep_order_and_positions(self):
+        rnd = random.Random(42)
+        l = _SortedList(load=4)
+        reference = []
+        for i in range(2000):
+            item = rnd.randint(0, 300)
+            if item in reference and rnd.random() < 0.5:
+                l.remove(item)
+                reference.remove(item)
+            else:
+                l.add(item)
+                reference.append(item)
+            reference.sort()
+            if i % 50 == 0:
+                self.assertEquals(reference, list(l))
+                self.assertEquals(reference[::-1], list(reversed(l)))
+                for position in range(0, len(reference), 7):
+                    self.assertEquals(reference[position], l[position])
+                self.assertEquals(reference[5:40], list(l.islice(5, 40)))
+                self.assertEquals(reference[5:40][::-1], list(l.islice(5, 40, reverse=True)))
+                bound = rnd.randint(0, 300)
+                self.assertEquals(sum(1 for x in reference if x < bound), l.bisect_left(bound))
+                self.assertEquals(sum(1 for x in reference if x <= bound), l.bisect_right(bound))
+        self.assertRaises(ValueError, l.remove, 301)
+
+
+class TestSortedDict(unittest.TestCase):
+    def test_keys_are_sorted(self):
+        d = SortedDict({u'b': 2, u'c': 3})
+        d[u'a'] = 1
+        d[u'b'] = 4
+
+        self.assertEquals([u'a', u'b', u'c'], d.keys())
+        self.assertEquals([1, 4, 3], d.values())
+        self.assertEquals([(u'c', 3), (u'b', 4), (u'a', 1)], [(k, d[k]) for k in reversed(d)])
+        del d[u'b']
+        self.assertEquals([(u'a', 1), (u'c', 3)], d.items())
+        self.assertEquals({u'a': 1, u'c': 3}, d.doc)
+        self.assertEquals(3, d.pop(u'c'))
+        self.assertEquals(u"SortedDict([(u'a', 1)])", repr(d))
+
+    def test_positional_access_and_ranges(self):
+        d = SortedDict((i, unicode(i)) for i in range(0, 100, 2))
+
+        self.assertEquals((0, u'0'), d.peekitem(0))
+        self.assertEquals((98, u'98'), d.peekitem())
+        self.assertEquals(5, d.index(10))
+        self.assertEquals(5, d.bisect_left(9))
+        self.assertEquals(6, d.bisect_right(10))
+        self.assertEquals([10, 12, 14], list(d.irange(10, 14)))
+        self.assertEquals([12], list(d.irange(10, 14, inclusive=(False, False))))
+        self.assertEquals([14, 12, 10], list(d.irange(9, 15, reverse=True)))
+        self.assertEquals([0, 2], list(d.islice(stop=2)))
+        self.assertEquals([98, 96], list(d.islice(stop=2, reverse=True)))
+        self.assertEquals([96, 94], list(d.islice(1, 3, reverse=True)))
+        self.assertRaises(KeyError, d.index, 1)
+        self.assertRaises(IndexError, d.peekitem, 50)
+
+    def test_works_with_adapters(self):
+        d = SortedDict({u'b': {u'c': 1}, u'a': 2})
+
+        dot = DotNotationAdapter(d)
+        self.assertEquals(1, dot[u'b.c'])
+        dot[u'0a'] = 3
+        self.assertEquals([u'0a', u'a', u'b'], d.keys())
+
+        obj = ObjectMappingAdapter(d)
+        self.assertEquals(2, obj.a)
+        self.assertEquals(1, obj.b.c)
+        obj.aa = 4
+        self.assertEquals([u'0a', u'a', u'aa', u'b'], d.keys())
+
+    def test_copy_and_clear(self):
+        d = ValueSortedDict({u'a': 2, u'b': 1})
+        copy = d.copy()
+        d.clear()
+        copy[u'c'] = 0
+
+        self.assertEquals([], d.keys())
+        self.assertEquals([u'c', u'b', u'a'], copy.keys())
+
+
+class TestValueSortedDict(unittest.TestCase):
+    def test_keys_are_sorted_by_value(self):
+        scores = ValueSortedDict({u'anna': 3, u'bob': 5, u'dora': 3})
+        scores[u'carl'] = 4
+
+        self.assertEquals([u'anna', u'dora', u'carl', u'bob'], scores.keys())
+        self.assertEquals([u'bob', u'carl'], list(scores.islice(stop=2, reverse=True)))
+        scores[u'anna'] = 6
+        self.assertEquals((u'anna', 6), scores.peekitem())
+        self.assertEquals([u'dora', u'carl'], list(scores.irange(3, 4)))
+        self.assertEquals([u'carl'], list(scores.irange(3, 5, inclusive=(False, False))))
+        self.assertEquals(1, scores.bisect_left(4))
+        self.assertEquals(2, scores.bisect_right(4))
+        del scores[u'carl']
+        self.assertEquals([u'dora', u'bob', u'anna'], scores.keys())
+
+
+class TestFunctionSortedDict(unittest.TestCase):
+    def test_keys_are_sorted_by_function_result(self):
+        d = FunctionSortedDict(lambda key, value: -len(value),
+                               {u'a': u'xx', u'b': u'x', u'c': u'xxx'})
+
+        self.assertEquals([u'c', u'a', u'b'], d.keys())
+        d[u'b'] = u'xxxx'
+        self.assertEquals([u'b', u'c', u'a'], d.keys())
+        self.assertEquals([u'c'], list(d.irange(-3, -3)))
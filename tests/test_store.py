@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from dictlib.binary import BinaryCodec
+from dictlib.exceptions import ValidationError
+from dictlib.lazy import LazyJsonAdapter
+from dictlib.schema import Schema, UnicodeField, IntField, DatetimeField
+from dictlib.store import DocumentStore, DocumentStoreError
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestDocumentStore(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'title': UnicodeField(),
+            u'year': IntField(optional=True),
+            u'created': DatetimeField(optional=True),
+        })
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, u'store.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_get(self):
+        with DocumentStore(self.path, self.schema) as store:
+            store.append(u'1', {u'title': u'a', u'created': datetime.datetime(2011, 1, 1)})
+            store.append(u'ä', {u'title': u'b'})
+
+            self.assertEquals(2, len(store))
+            self.assertTrue(u'ä' in store)
+            self.assertTrue(isinstance(store[u'1'], LazyJsonAdapter))
+            self.assertEquals(datetime.datetime(2011, 1, 1), store[u'1'][u'created'])
+            self.assertEquals({u'title': u'b'}, store[u'ä'].materialize())
+            self.assertRaises(KeyError, store.__getitem__, u'2')
+
+    def test_append_validates_documents(self):
+        with DocumentStore(self.path, self.schema) as store:
+            self.assertRaises(ValidationError, store.append, u'1', {u'title': 1})
+            self.assertEquals(0, len(store))
+
+    def test_documents_are_persistent(self):
+        with DocumentStore(self.path, self.schema) as store:
+            store.append_many(((unicode(i), {u'title': u't%d' % i}) for i in range(10)),
+                              sync_every=3)
+            store.append(u'3', {u'title': u'replaced'})
+            store.delete(u'4')
+
+        with DocumentStore(self.path, self.schema, lazy=False) as store:
+            self.assertEquals(9, len(store))
+            self.assertEquals({u'title': u'replaced'}, store[u'3'])
+            self.assertFalse(u'4' in store)
+            self.assertEquals(3, store.garbage)
+
+    def test_scan_streams_documents_in_append_order(self):
+        with DocumentStore(self.path, self.schema, lazy=False) as store:
+            store.append_many([(u'b', {u'title': u'1'}), (u'a', {u'title': u'2'}),
+                               (u'c', {u'title': u'3'})])
+            store.append(u'b', {u'title': u'4'})
+
+            self.assertEquals([(u'a', {u'title': u'2'}), (u'c', {u'title': u'3'}),
+                               (u'b', {u'title': u'4'})], list(store.scan()))
+
+    def test_compact_removes_garbage(self):
+        with DocumentStore(self.path, self.schema, lazy=False) as store:
+            store.append_many((u'%d' % i, {u'title': u'x' * 100}) for i in range(10))
+            for i in range(5):
+                store.delete(u'%d' % i)
+            size = os.path.getsize(self.path)
+
+            store.compact()
+
+            self.assertEquals(0, store.garbage)
+            self.assertTrue(os.path.getsize(self.path) < size / 2)
+            self.assertEquals(sorted(u'%d' % i for i in range(5, 10)), sorted(store))
+            store.append(u'10', {u'title': u'y'})
+            self.assertEquals({u'title': u'y'}, store[u'10'])
+
+        with DocumentStore(self.path, self.schema, lazy=False) as store:
+            self.assertEquals(6, len(store))
+            self.assertEquals({u'title': u'x' * 100}, store[u'7'])
+
+    def test_binary_codec(self):
+        codec = BinaryCodec(self.schema)
+        with DocumentStore(self.path, self.schema, codec=codec) as store:
+            store.append(u'1', {u'title': u'ö', u'year': 2011})
+
+            self.assertEquals({u'title': u'ö', u'year': 2011}, store[u'1'])
+            self.assertTrue(isinstance(store.get_raw(u'1'), memoryview))
+
+    def test_partially_written_record_is_removed(self):
+        with DocumentStore(self.path, self.schema) as store:
+            store.append(u'1', {u'title': u'a'})
+            size = os.path.getsize(self.path)
+            store.append(u'2', {u'title': u'b'})
+        with open(self.path, u'r+b') as f:
+            f.truncate(size + 5)
+
+        with DocumentStore(self.path, self.schema) as store:
+            self.assertEquals([u'1'], list(store))
+            self.assertEquals(size, os.path.getsize(self.path))
+
+    def test_invalid_file_raises_error(self):
+        with open(self.path, u'wb') as f:
+            f.write('something else')
+
+        self.assertRaises(DocumentStoreError, DocumentStore, self.path, self.schema)
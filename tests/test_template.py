@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of dictlib.
+#
+# Copyright (C) 2011  Frank Ploss
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+from dictlib.schema import Schema, UnicodeField, IntField, ListField, DatetimeField
+from dictlib.template import CopyOnWriteDict, Template
+import datetime
+import unittest
+
+
+class BookSchema(Schema):
+    def __init__(self):
+        super(BookSchema, self).__init__({
+            u'title': UnicodeField(default=u'Untitled'),
+            u'tags': ListField([UnicodeField()]),
+            u'created': DatetimeField(default=datetime.datetime.now),
+            u'subtitle': UnicodeField(optional=True),
+            u'info': {
+                u'year': IntField(default=1945),
+                u'author': {
+                    u'first_name': UnicodeField(default=u'Astrid'),
+                    u'last_name': UnicodeField(default=u'Lindgren'),
+                },
+            },
+        })
+
+
+class TestCopyOnWriteDict(unittest.TestCase):
+    def setUp(self):
+        self.schema = BookSchema()
+
+    def assertMaterializesLikeCreate(self, doc, expected):
+        materialized = doc.materialize()
+        self.assertTrue(isinstance(materialized[u'created'], datetime.datetime))
+        del materialized[u'created'], expected[u'created']
+        self.assertEquals(expected, materialized)
+
+    def test_reads_defaults(self):
+        doc = self.schema.create_copy_on_write()
+        self.assertEquals(u'Untitled', doc[u'title'])
+        self.assertEquals(1945, doc[u'info'][u'year'])
+        self.assertEquals(u'Astrid', doc[u'info'][u'author'][u'first_name'])
+        self.assertEquals([], doc[u'tags'])
+        self.assertFalse(u'subtitle' in doc)
+        self.assertRaises(KeyError, lambda: doc[u'subtitle'])
+        self.assertEquals(set([u'title', u'tags', u'created', u'info']), set(doc.keys()))
+        self.assertEquals(4, len(doc))
+        self.assertMaterializesLikeCreate(doc, self.schema.create())
+
+    def test_stores_only_overridden_values(self):
+        doc = self.schema.create_copy_on_write()
+        self.assertEquals({}, doc._doc)
+        doc[u'title'] = u'Pippi'
+        doc[u'info'][u'author'][u'first_name'] = u'Anna'
+        self.assertEquals([u'info', u'title'], sorted(doc._doc))
+        info = doc._doc[u'info']
+        self.assertTrue(isinstance(info, CopyOnWriteDict))
+        self.assertEquals([u'author'], info._doc.keys())
+        self.assertEquals({u'first_name': u'Anna'}, info._doc[u'author']._doc)
+        self.assertEquals(u'Lindgren', doc[u'info'][u'author'][u'last_name'])
+
+        expected = self.schema.create({u'title': u'Pippi',
+                                       u'info': {u'author': {u'first_name': u'Anna'}}})
+        self.assertMaterializesLikeCreate(doc, expected)
+
+    def test_template_is_shared_and_not_changed(self):
+        doc1 = self.schema.create_copy_on_write()
+        doc2 = self.schema.create_copy_on_write()
+        self.assertTrue(doc1._template is doc2._template)
+        doc1[u'info'][u'year'] = 1950
+        doc1[u'tags'].append(u'children')
+        del doc1[u'title']
+        self.assertEquals(1945, doc2[u'info'][u'year'])
+        self.assertEquals([], doc2[u'tags'])
+        self.assertEquals(u'Untitled', doc2[u'title'])
+        self.assertEquals([u'children'], doc1.materialize()[u'tags'])
+
+    def test_default_factories_are_called_per_document(self):
+        doc = self.schema.create_copy_on_write()
+        created = doc[u'created']
+        self.assertTrue(isinstance(created, datetime.datetime))
+        self.assertTrue(doc[u'created'] is created)
+        self.assertEquals(created, doc.materialize()[u'created'])
+
+    def test_delete(self):
+        doc = self.schema.create_copy_on_write()
+        del doc[u'title']
+        self.assertFalse(u'title' in doc)
+        self.assertRaises(KeyError, lambda: doc[u'title'])
+        self.assertRaises(KeyError, doc.__delitem__, u'title')
+        self.assertFalse(u'title' in doc.materialize())
+        doc[u'title'] = u'Pippi'
+        self.assertEquals(u'Pippi', doc[u'title'])
+        del doc[u'title']
+        self.assertFalse(u'title' in doc.keys())
+
+        doc[u'subtitle'] = u'Longstocking'
+        del doc[u'subtitle']
+        self.assertFalse(u'subtitle' in doc)
+
+    def test_initial_values(self):
+        initial = {u'title': u'Pippi', u'info': {u'year': 1950}, u'extra': {u'a': 1}}
+        doc = self.schema.create_copy_on_write(initial)
+        self.assertEquals(u'Astrid', doc[u'info'][u'author'][u'first_name'])
+        self.assertMaterializesLikeCreate(doc, self.schema.create(initial))
+
+    def test_validate(self):
+        doc = self.schema.create_copy_on_write()
+        doc[u'info'][u'author'][u'first_name'] = u'Anna'
+        self.schema.validate(doc)
+        doc[u'info'][u'year'] = u'1945'
+        self.assertFalse(self.schema.is_valid(doc))
+
+    def test_extend_renews_template(self):
+        template = self.schema.create_copy_on_write()._template
+        self.schema.extend({u'pages': IntField(default=100)})
+        doc = self.schema.create_copy_on_write()
+        self.assertFalse(doc._template is template)
+        self.assertEquals(100, doc[u'pages'])
+
+    def test_plain_template(self):
+        doc = CopyOnWriteDict(Template({u'a': 1, u'b': Template({u'c': [2]})}))
+        doc[u'b'][u'c'].append(3)
+        self.assertEquals({u'a': 1, u'b': {u'c': [2, 3]}}, doc.doc)
+        self.assertEquals({u'a': 1, u'b': {u'c': [2]}},
+                          CopyOnWriteDict(doc._template).materialize())
+
@@ -18,7 +18,9 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from dictlib.utils import update_recursive, walk, map_dict, throws, without
+from dictlib.utils import update_recursive, walk, map_dict, throws, without, \
+    getitem, setitem
+import array
 import unittest
 
 class TestUtils(unittest.TestCase):
@@ -46,6 +48,15 @@ class TestUtils(unittest.TestCase):
         self.assertTrue((u'a.b', 1) in result)
         self.assertTrue((u'a.c', 2) in result)
 
+    def test_getitem_and_setitem_on_arrays(self):
+        d = {u'a': array.array('l', [1, 2])}
+
+        self.assertEquals(2, getitem(d, u'a.1'))
+        setitem(d, u'a.0', 3)
+        setitem(d, u'a.2', 4)
+        self.assertEquals(array.array('l', [3, 2, 4]), d[u'a'])
+        self.assertEquals([(u'a', d[u'a'])], list(walk(d)))
+
     def test_map_dict(self):
         # simple
         d = {u'a': u'b'}
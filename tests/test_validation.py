@@ -18,8 +18,10 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+from dictlib.cache import ValidationCache
 from dictlib.exceptions import ValidationError
-from dictlib.schema import Schema, UnicodeField, DictField, LongField, ListField
+from dictlib.schema import Schema, UnicodeField, DictField, LongField, ListField, \
+    IntField
 import unittest
 
 class TestValidation(unittest.TestCase):
@@ -96,3 +98,234 @@ class TestValidation(unittest.TestCase):
 
         MySchema().validate({u'a': u'hello mars'})
         MySchema().validate({}, partial=True)
+
+
+class _Future(object):
+    """ A minimal future, like the futures of asyncio.
+    """
+    def __init__(self):
+        self.done = False
+        self.result = self.exception = None
+
+    def cancelled(self):
+        return False
+
+    def set_result(self, result):
+        self.done, self.result = True, result
+
+    def set_exception(self, exception):
+        self.done, self.exception = True, exception
+
+
+class _EventLoop(object):
+    """ A minimal event loop, counting the callbacks run.
+    """
+    def __init__(self):
+        self.callbacks = []
+        self.steps = 0
+        self.offloaded = 0
+
+    def create_future(self):
+        return _Future()
+
+    def call_soon(self, callback):
+        self.callbacks.append(callback)
+
+    def run_in_executor(self, executor, function):
+        self.offloaded += 1
+        future = _Future()
+        try:
+            future.set_result(function())
+        except ValidationError as e:
+            future.set_exception(e)
+        return future
+
+    def run_until_complete(self, future):
+        while not future.done:
+            self.callbacks.pop(0)()
+            self.steps += 1
+        return future
+
+
+class TestIncrementalValidation(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'name': UnicodeField(),
+            u'items': ListField({u'id': IntField(), u'tags': ListField(UnicodeField())}),
+            u'numbers': ListField(IntField()),
+            u'extra': {unicode: IntField(optional=True)},
+        })
+        self.doc = {
+            u'name': u'x',
+            u'items': [{u'id': i, u'tags': [u'a'] * 10} for i in range(100)],
+            u'numbers': range(1000),
+            u'extra': {},
+        }
+
+    def _error(self, f, *args, **kwargs):
+        try:
+            f(*args, **kwargs)
+        except ValidationError as e:
+            return unicode(e)
+
+    def test_iter_validate_yields_according_to_budget(self):
+        steps = list(self.schema.iter_validate(self.doc, budget=100))
+        self.assertTrue(len(steps) > 10)
+        self.assertEquals([], list(self.schema.iter_validate(self.doc, budget=10000)))
+
+    def test_iter_validate_raises_same_errors_as_validate(self):
+        invalid_docs = [
+            {u'name': u'x'},
+            dict(self.doc, unknown=1),
+            dict(self.doc, numbers=range(500) + [u'a']),
+            dict(self.doc, items=self.doc[u'items'] + [{u'id': u'a'}]),
+            dict(self.doc, extra={u'a': u'b'}),
+        ]
+        for doc in invalid_docs:
+            error = self._error(self.schema.validate, doc)
+            self.assertTrue(error is not None)
+            self.assertEquals(error, self._error(list, self.schema.iter_validate(doc, budget=10)))
+        self.assertEquals(None, self._error(list, self.schema.iter_validate({u'name': u'x'},
+                                                                            partial=True)))
+
+    def test_validate_async_runs_in_steps(self):
+        loop = _EventLoop()
+        future = loop.run_until_complete(self.schema.validate_async(self.doc, budget=100, loop=loop))
+
+        self.assertEquals(None, future.exception)
+        self.assertTrue(loop.steps > 10)
+
+        future = loop.run_until_complete(self.schema.validate_async({u'name': 1}, loop=loop))
+        self.assertTrue(isinstance(future.exception, ValidationError))
+
+    def test_validate_async_offloads_large_documents(self):
+        loop = _EventLoop()
+        future = self.schema.validate_async(self.doc, loop=loop, offload_size=1000)
+
+        self.assertEquals(1, loop.offloaded)
+        self.assertTrue(future.done)
+        future = self.schema.validate_async(self.doc, loop=loop, offload_size=10000)
+        self.assertEquals(1, loop.offloaded)
+
+    def test_validate_async_counts_nested_elements_for_offloading(self):
+        loop = _EventLoop()
+        # 1104 keys and elements at the top two levels, 1200 in the items
+        self.schema.validate_async(self.doc, loop=loop, offload_size=2000)
+
+        self.assertEquals(1, loop.offloaded)
+
+
+class TestParallelValidation(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'name': UnicodeField(),
+            u'lines': ListField({u'id': IntField(), u'name': UnicodeField()}, max_len=5000),
+            u'nested': {u'numbers': ListField(IntField())},
+        })
+        self.schema.shard_min_len = 100
+        self.doc = {
+            u'name': u'x',
+            u'lines': [{u'id': i, u'name': u'line'} for i in range(1000)],
+            u'nested': {u'numbers': range(1000)},
+        }
+
+    def _error(self, f, *args, **kwargs):
+        try:
+            f(*args, **kwargs)
+        except ValidationError as e:
+            return unicode(e)
+
+    def test_valid_document(self):
+        self.schema.validate(self.doc, workers=2)
+
+    def test_lowest_failing_index_is_reported(self):
+        lines = list(self.doc[u'lines'])
+        lines[700] = {u'id': u'a'}
+        lines[300] = {u'id': 1}
+        doc = dict(self.doc, lines=lines)
+
+        error = self._error(self.schema.validate, doc, workers=2)
+        self.assertEquals(self._error(self.schema.validate, doc), error)
+        self.assertTrue(u'lines[300]' in error)
+
+    def test_nested_lists_are_sharded(self):
+        doc = dict(self.doc, nested={u'numbers': range(999) + [u'a']})
+
+        error = self._error(self.schema.validate, doc, workers=2)
+        self.assertEquals(self._error(self.schema.validate, doc), error)
+        self.assertTrue(u'nested.numbers[999]' in error)
+        self.assertEquals(range(999) + [u'a'], doc[u'nested'][u'numbers'])
+
+    def test_rest_of_document_and_list_length_are_validated(self):
+        self.assertTrue(self._error(self.schema.validate, dict(self.doc, name=1), workers=2))
+        doc = dict(self.doc, lines=self.doc[u'lines'] * 6)
+        self.assertEquals(self._error(self.schema.validate, doc),
+                          self._error(self.schema.validate, doc, workers=2))
+
+    def test_list_length_is_validated_with_a_cache(self):
+        schema = Schema({u'lines': ListField(IntField(), max_len=150)})
+        schema.shard_min_len = 100
+        cache = ValidationCache()
+        schema.validate({u'lines': range(120)}, workers=2, cache=cache)
+        error = self._error(schema.validate, {u'lines': range(200)}, workers=2, cache=cache)
+        self.assertEquals(self._error(schema.validate, {u'lines': range(200)}), error)
+        self.assertTrue(u'too many elements' in error)
+
+
+class TestUpdateValidation(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema({
+            u'title': UnicodeField(),
+            u'info': {u'author': {u'name': UnicodeField(), u'born': LongField(optional=True)}},
+            u'tags': ListField(UnicodeField(min_len=2)),
+            u'chapters': ListField([{u'title': UnicodeField()}, LongField()]),
+            u'counts': {unicode: LongField()},
+            u'years': {long: UnicodeField()},
+        })
+
+    def _error(self, flat_update):
+        try:
+            self.schema.validate_update(flat_update)
+        except ValidationError as e:
+            return e
+        self.fail(u'validate_update() did not raise ValidationError')
+
+    def test_valid_updates(self):
+        self.schema.validate_update({u'info.author.name': u'lemmy', u'tags.3': u'rock',
+                                     u'chapters.0.title': u'One', u'chapters.1': 2L,
+                                     u'counts.plays': 10L, u'years.1975': u'founded'})
+        self.schema.validate_update({u'info': {u'author': {u'name': u'lemmy'}},
+                                     u'tags': [u'rock']})
+        self.schema.validate_update({})
+
+    def test_values_are_validated_against_the_field_of_their_path(self):
+        e = self._error({u'info.author.name': 1})
+        self.assertEquals((u'info.author.name', u'type'), (e.path, e.constraint))
+
+        e = self._error({u'tags.1': u'x'})
+        self.assertEquals((u'tags.1', u'min_len'), (e.path, e.constraint))
+
+        e = self._error({u'counts.plays': u'ten'})
+        self.assertEquals((u'counts.plays', u'type'), (e.path, e.constraint))
+
+    def test_whole_subdocuments_are_validated(self):
+        e = self._error({u'info.author': {u'born': 1945L}})
+        self.assertEquals((u'info.author.name', u'required'), (e.path, e.constraint))
+
+    def test_list_elements_must_match_one_of_the_element_fields(self):
+        e = self._error({u'chapters.2': u'Two'})
+        self.assertEquals((u'chapters.2', u'elements'), (e.path, e.constraint))
+
+    def test_undefined_paths_are_reported(self):
+        for path in (u'subtitle', u'info.editor', u'info.author.name.first',
+                     u'tags.first', u'chapters.0.pages', u'years.later'):
+            e = self._error({path: u'x'})
+            self.assertEquals((path, u'undefined'), (e.path, e.constraint))
+
+    def test_fields_of_paths_are_cached_until_the_schema_is_extended(self):
+        self.schema.validate_update({u'info.author.name': u'lemmy'})
+        self.assertTrue(u'info.author.name' in self.schema._path_fields)
+
+        self.schema.extend({u'subtitle': UnicodeField()})
+        self.schema.validate_update({u'subtitle': u'x'})
+        self.assertEquals([u'subtitle'], self.schema._path_fields.keys())